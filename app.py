@@ -1,26 +1,71 @@
-from flask import Flask, request, render_template, send_file
+from flask import Flask, request, render_template, send_file, jsonify, url_for
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-import re
 from io import BytesIO
 from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 import os
 import logging
 from logging.handlers import RotatingFileHandler
 from urllib.parse import urlparse, urljoin
-import time
-import random
 from requests_html import HTMLSession
 import asyncio
 import nest_asyncio
 from pyppeteer import launch
+from crawl_engine import host_of, run_crawl
+from browser_pool import active_browser_count, get_browser_pool
+from http_client import get_http_client
+from result_cache import CacheStats, get_result_cache
+from jobs import JobQueueFull, get_job_manager
+from page_parser import parse_page
+from pipeline import CrawlPipeline
+from politeness import get_host_scheduler, host_key
+from frontier import SUBPAGE_KEYWORD_PATTERNS, crawl_site, get_frontier_stats, site_deadline
+from fallback_race import get_race_stats, hedged_race, is_spa_shell
+from dns_cache import DOMAIN_NOT_FOUND, domain_missing, pre_resolve_in_background, pre_resolve_urls
+from url_dedup import DedupStats, SharedResults, SiteGroups
+from concurrency import get_concurrency_controller
+from checkpoint import RERUN_KINDS, checkpointed, get_checkpoint_store, row_kind
+from metrics import JobTrace, get_stage_metrics, timing_log, url_timing
+from shard_queue import SHARD_WORKERS, run_sharded
 # Apply nest_asyncio to allow nested event loops (needed for requests_html in threads)
 nest_asyncio.apply()
 
 app = Flask(__name__)
 application = app
 
+# 'async' streams URLs through the asyncio crawl engine; 'threads' keeps the
+# older batched ThreadPoolExecutor path as a fallback; 'pipeline' runs the
+# static crawl on separate fetch threads and parse processes; 'sharded' hands
+# the sites to SHARD_WORKERS worker processes through a queue (shard_queue.py).
+CRAWL_MODE = os.environ.get('CRAWL_MODE', 'async')
+PER_HOST_LIMIT = int(os.environ.get('PER_HOST_LIMIT', 2))
+
+# How the JS fallback is scheduled against the static crawl: 'sequential'
+# (the default) renders only after the crawl found nothing, 'detect' also
+# renders JS app shells straight away, 'hedged' additionally starts rendering
+# any site whose crawl is still running after HEDGE_AFTER seconds and takes the
+# first result. 'js' skips the static crawl and only renders (used to rerun
+# empty rows).
+FALLBACK_MODE = os.environ.get('FALLBACK_MODE', 'sequential')
+FALLBACK_MODES = ('sequential', 'detect', 'hedged', 'js')
+# Name under which this app's uploads are checkpointed
+CHECKPOINT_SOURCE = 'app'
+HEDGE_AFTER = float(os.environ.get('HEDGE_AFTER', 8))
+
+# One JSON line of stage timings per URL (see metrics.py), rotated by size.
+# JOB_TRACE=1 also writes a per-stage trace for every background job.
+TIMING_LOG = os.environ.get('TIMING_LOG', 'logs/crawl_timing.log')
+TIMING_LOG_MAX_BYTES = int(os.environ.get('TIMING_LOG_MAX_BYTES', 10 * 2 ** 20))
+JOB_TRACE = os.environ.get('JOB_TRACE', '0') == '1'
+if TIMING_LOG and not timing_log.handlers:
+    os.makedirs(os.path.dirname(TIMING_LOG) or '.', exist_ok=True)
+    timing_handler = RotatingFileHandler(TIMING_LOG, maxBytes=TIMING_LOG_MAX_BYTES, backupCount=5)
+    timing_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    timing_log.addHandler(timing_handler)
+    timing_log.setLevel(logging.INFO)
+    timing_log.propagate = False
+
 def find_url_column(columns):
     keywords = ['website', 'url', 'websites', 'urls']
     for col in columns:
@@ -28,229 +73,89 @@ def find_url_column(columns):
             return col
     return None
 
-def extract_emails_from_url(url):
+def extract_emails_from_url(url, first_page=None, deadline=None):
+    """Static crawl of one site: its emails, "" if it has none, None if no page could be fetched."""
     if pd.isna(url) or not isinstance(url, str):
         return ""
     if not url.startswith(('http://', 'https://')):
         url = f"http://{url}"
-    visited_urls = set()
-    emails = set()
-    keywords = ['contact', 'about', 'get in touch', 'reach us', 'communication','contacts','about the company','contact us']
+    fetched = []
     
-    base_domain = urlparse(url).netloc
-
-    def is_internal_link(link):
-        return urlparse(link).netloc == base_domain or urlparse(link).netloc == ""
+    def fetch(page_url, deadline=None):
+        scan = fetch_page(page_url, deadline)
+        if scan is not None:
+            fetched.append(page_url)
+        return scan
     
-    def fetch_emails(current_url):
-        if current_url in visited_urls:
-            return
-        visited_urls.add(current_url)
-        try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36"
-            }
-            response = requests.get(current_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            soup = BeautifulSoup(response.text, 'html.parser')
-            text = ' '.join(soup.stripped_strings)
-            raw_emails = re.findall(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', text)
-            emails.update([email for email in raw_emails if not email[0].isdigit()])
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                if href.startswith("mailto:"):
-                    email = href.replace("mailto:", "").split("?")[0]
-                    if email and not email[0].isdigit():
-                        emails.add(email)
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                full_url = urljoin(current_url, href)
-                if is_internal_link(full_url) and any(keyword in href.lower() for keyword in keywords):
-                    fetch_emails(full_url)
-        except requests.exceptions.RequestException as e:
-            print(f"RequestException for {current_url}: {e}")
-        except Exception as e:
-            print(f"Error processing {current_url}: {e}")
+    emails, _ = crawl_site(url, fetch, first_page=first_page, deadline=deadline)
+    if emails:
+        return ', '.join(emails)
+    return "" if fetched or first_page is not None else None
 
-    fetch_emails(url)
-    return ', '.join(emails) if emails else ""
-
-# Functions from the second code for JS rendering backup
-
-def extract_emails(soup):
-    """
-    Extract emails from a BeautifulSoup object by checking mailto links, text content, and obfuscated emails.
-    Returns a set of unique, lowercased emails.
-    """
-    emails = set()
-    
-    for a_tag in soup.find_all('a', href=True):
-        if a_tag['href'].startswith('mailto:'):
-            email = a_tag['href'].split('?')[0].replace('mailto:', '').strip().lower()
-            if validate_email(email):
-                emails.add(email)
-    
-    text = ' '.join(soup.stripped_strings)
-    email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[A-Za-z]{2,}'
-    potential_emails = re.findall(email_pattern, text)
-    for email in potential_emails:
-        if validate_email(email): 
-            emails.add(email.lower())
-    
-    script_tags = soup.find_all('script')
-    for script in script_tags:
-        script_text = script.get_text()
-        emails.update(extract_obfuscated_emails(script_text))
-    
-    return emails
+def fetch_html(url, deadline=None):
+    """Fetch one page and return its HTML, or None if it could not be fetched (by `deadline`)."""
+    try:
+        response = get_http_client().get_page(url, timeout=10, deadline=deadline,
+                                              limit=get_concurrency_controller().static)
+        response.raise_for_status()
+        return response.text
+    except requests.exceptions.RequestException as e:
+        print(f"RequestException for {url}: {e}")
+    except Exception as e:
+        print(f"Error processing {url}: {e}")
+    return None
 
-def extract_obfuscated_emails(text):
-    """
-    Extract emails obfuscated in JavaScript or HTML (e.g., string concatenation or character entities).
-    Returns a set of validated emails.
-    """
-    emails = set()
-    
-    concat_pattern = r'[\'"][a-zA-Z0-9._%+-]+[\'"]\s*\+\s*[\'"]\@[\'"]\s*\+\s*[\'"][a-zA-Z0-9.-]+\.[A-Za-z]{2,}[\'"]'
-    matches = re.findall(concat_pattern, text)
-    for match in matches:
-        parts = re.findall(r'[\'"]([^\'"]*)[\'"]\s*\+\s*', match + "+")
-        reconstructed = ''.join(parts)
-        if '@' in reconstructed and validate_email(reconstructed):
-            emails.add(reconstructed)
-    
-    text_decoded = re.sub(r'&#(\d+);', lambda m: chr(int(m.group(1))), text)
-    emails.update(extract_emails_from_text(text_decoded))
-    
-    return emails
+def fetch_page(url, deadline=None):
+    """Fetch one page and return its PageScan, or None if it could not be fetched."""
+    html = fetch_html(url, deadline)
+    if html is None:
+        return None
+    try:
+        return parse_page(html)
+    except Exception as e:
+        print(f"Error processing {url}: {e}")
+        return None
 
-def extract_emails_from_text(text):
-    """
-    Extract emails from plain text using regex.
-    Returns a set of validated emails.
-    """
-    if not text:
-        return set()
-    email_pattern = r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[A-Za-z]{2,}'
-    emails = set()
-    matches = re.findall(email_pattern, text)
-    for match in matches:
-        email = match.lower().strip()
-        if validate_email(email):
-            emails.add(email)
-    return emails
-
-def validate_email(email):
-    """
-    Validate if a string is a proper email address, excluding common false positives.
-    Returns True if valid, False otherwise.
-    """
-    if not email or '@' not in email:
-        return False
-    
-    pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[A-Za-z]{2,}$'
-    common_false_positives = [
-        'example.com', 'domain.com', 'email.com', 'your-email.com',
-        'username@', '@domain', 'example@example'
-    ]
-    
-    if any(fp in email.lower() for fp in common_false_positives):
-        return False
-    
-    local_part = email.split('@')[0]
-    phone_pattern = r'\d{3}-\d{3}-\d{4}'
-    if re.search(phone_pattern, local_part):
-        return False
-    
-    return bool(re.match(pattern, email))
+# Functions from the second code for JS rendering backup
 
-def find_subpage_urls(soup, base_url):
+def find_subpage_urls(page, base_url):
     """
     Find subpage URLs that might contain contact info based on keywords in link text and URL path.
-    Returns a set of absolute URLs within the same domain.
+    `page` is the PageScan of the current page. Returns a set of absolute URLs within the same domain.
+    Keywords are those of the language the page declares (<html lang> or a
+    language meta tag), English if it declares none we have keywords for.
     """
-    keywords = {
-        "en": ["contact", "about", "reach", "support", "help", "info", "team", "staff", "brokers", "get in touch", "our people", "meet the team", "directory", "contact us", "about us", "reach us"],
-        "fr": ["contact", "à propos", "nous contacter", "support", "aide", "info", "équipe", "personnel", "courtiers", "nous joindre", "notre équipe", "rencontrer l'équipe", "annuaire"],
-        "de": ["kontakt", "über uns", "erreichen", "unterstützung", "hilfe", "info", "team", "personal", "makler", "uns kontaktieren", "unser team", "team treffen", "verzeichnis"],
-        "it": ["contatto", "chi siamo", "raggiungere", "supporto", "aiuto", "info", "team", "personale", "broker", "contattarci", "il nostro team", "incontrare il team", "directory"],
-        "ur": ["رابط", "ہم سے رابطہ", "ہم تک پہنچیں", "حمایت", "مدد", "اطلاعات", "ٹیم", "افراد", "بروکر", "ہم سے رابطہ کریں", "ہماری ٹیم", "ٹیم سے ملاقات", "ڈائریکٹری"],
-        "ar": ["اتصال", "معلومات عنا", "الوصول إلينا", "دعم", "مساعدة", "معلومات", "فريق", "أفراد", "سماسرة", "اتصل بنا", "فريقنا", "لقاء الفريق", "دليل"],
-        "es": ["contacto", "acerca de", "alcanzarnos", "soporte", "ayuda", "info", "equipo", "personal", "corredores", "contactarnos", "nuestro equipo", "conocer al equipo", "directorio"],
-        "pt": ["contato", "sobre", "alcançar", "suporte", "ajuda", "info", "equipe", "pessoal", "corretor", "contatar-nos", "nossa equipe", "conhecer a equipe", "diretório"],
-        "ru": ["контакт", "о нас", "достичь", "поддержка", "помощь", "инфо", "команда", "персонал", "брокеры", "связаться с нами", "наша команда", "встреча команды", "справочник"],
-        "zh": ["联系", "关于我们", "联系我们", "支持", "帮助", "信息", "团队", "人员", "经纪人", "联系我们", "我们的团队", "团队见面", "目录"],
-        "ja": ["コンタクト", "私たちについて", "私たちに連絡する", "サポート", "ヘルプ", "情報", "チーム", "スタッフ", "ブローカー", "私たちに連絡する", "私たちのチーム", "チームに会う", "ディレクトリ"],
-        "ko": ["연락처", "关于我们", "연락처", "지원", "도움말", "정보", "팀", "직원", "중개인", "연락처", "우리 팀", "팀 만남", "디렉토리"],
-    }
-    
     subpage_urls = set()
-    base_netloc = urlparse(base_url).netloc
+    parsed_base = urlparse(base_url)
+    keywords = SUBPAGE_KEYWORD_PATTERNS.get(page.lang) or SUBPAGE_KEYWORD_PATTERNS["en"]
+    # Keywords have no '/', so one in a resolved path is in the href or in the
+    # base path; links with neither (and no keyword in their text) are skipped
+    # without resolving them
+    base_path_match = keywords.search(parsed_base.path.lower()) is not None
     
-    # Detect language of the webpage (simplified approach)
-    # For accurate detection, consider using a library like langdetect
-    detected_language = "en"  # Default to English
-    text = ' '.join(soup.stripped_strings)
-    if "fr" in text.lower():
-        detected_language = "fr"
-    elif "de" in text.lower():
-        detected_language = "de"
-    elif "it" in text.lower():
-        detected_language = "it"
-    elif "ur" in text.lower():
-        detected_language = "ur"
-    elif "ar" in text.lower():
-        detected_language = "ar"
-    elif "es" in text.lower():
-        detected_language = "es"
-    elif "pt" in text.lower():
-        detected_language = "pt"
-    elif "ru" in text.lower():
-        detected_language = "ru"
-    elif "zh" in text.lower():
-        detected_language = "zh"
-    elif "ja" in text.lower():
-        detected_language = "ja"
-    elif "ko" in text.lower():
-        detected_language = "ko"
-    
-    for a_tag in soup.find_all('a', href=True):
-        link_text = a_tag.get_text().strip().lower()
-        href = a_tag['href']
+    for href, link_text in page.links:
+        text_match = keywords.search(link_text.strip().lower()) is not None
+        if not (text_match or base_path_match or keywords.search(href.lower())):
+            continue
         abs_url = urljoin(base_url, href)
         parsed_url = urlparse(abs_url)
-        
-        # Use detected language's keywords
-        if any(keyword in link_text for keyword in keywords.get(detected_language, keywords["en"])) or \
-           any(keyword in parsed_url.path.lower() for keyword in keywords.get(detected_language, keywords["en"])):
-            if parsed_url.netloc == base_netloc and parsed_url.scheme in ['http', 'https']:
-                subpage_urls.add(abs_url)
+        if parsed_url.netloc != parsed_base.netloc or parsed_url.scheme not in ['http', 'https']:
+            continue
+        if text_match or keywords.search(parsed_url.path.lower()):
+            subpage_urls.add(abs_url)
     
     return subpage_urls
 
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from webdriver_manager.chrome import ChromeDriverManager
-from selenium.webdriver.chrome.options import Options
-
 def js_render_with_session(url, headers, timeout=30):
+    """
+    Render a page on the shared browser pool. The pool's browsers are started
+    with the same desktop Chrome user agent, so `headers` and `timeout` are
+    kept for compatibility only. Renders share the per-host politeness
+    scheduler with static fetches.
+    """
     try:
-        chrome_options = Options()
-        chrome_options.add_argument("--headless")  # Run in headless mode
-        chrome_options.add_argument(f"user-agent={headers['User-Agent']}")
-        chrome_options.add_argument("--no-sandbox")  # Required for Docker
-        chrome_options.add_argument("--disable-dev-shm-usage")  # Avoid shared memory issues
-        
-        # Automatically download and use the correct ChromeDriver version
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=chrome_options)
-        
-        driver.set_page_load_timeout(timeout)
-        driver.get(url)
-        time.sleep(3)  # Wait for JS to load
-        html_content = driver.page_source
-        driver.quit()
-        return html_content
+        with get_concurrency_controller().render.slot(), get_host_scheduler().slot(host_key(url)):
+            return get_browser_pool().render(url)
     except Exception as e:
         print(f"Error in JS rendering with Selenium: {str(e)}")
         return None
@@ -276,10 +181,9 @@ def find_emails_js(base_url, max_subpages=3, max_retries=2):
         # Process base URL
         html_content = js_render_with_session(base_url, headers)
         if html_content:
-            soup = BeautifulSoup(html_content, 'html.parser')
-            emails = extract_emails(soup)
-            all_emails.update(emails)
-            subpages = list(find_subpage_urls(soup, base_url))
+            page = parse_page(html_content)
+            all_emails.update(page.emails)
+            subpages = list(find_subpage_urls(page, base_url))
             visited_urls.add(base_url)
             
             # Process subpages
@@ -291,13 +195,11 @@ def find_emails_js(base_url, max_subpages=3, max_retries=2):
                 print(f"[JS Rendering] Scraping subpage: {subpage}")
                 html_content = js_render_with_session(subpage, headers)
                 if html_content:
-                    soup = BeautifulSoup(html_content, 'html.parser')
-                    emails = extract_emails(soup)
-                    all_emails.update(emails)
+                    page = parse_page(html_content)
+                    all_emails.update(page.emails)
                     visited_urls.add(subpage)
                 
                 subpages_processed += 1
-                time.sleep(random.uniform(1, 2))  # Polite delay between requests
     
     except Exception as e:
         print(f"Error during JS rendering scraping: {str(e)}")
@@ -305,44 +207,162 @@ def find_emails_js(base_url, max_subpages=3, max_retries=2):
     return ', '.join(all_emails) if all_emails else "No email ID found"
 
 # Combined function that tries primary method first, then backup
-def extract_emails_with_fallback(url):
+def lookup_cached_result(url, cache_stats=None):
+    """Return the cached result cell for a cleaned URL, or None on a miss."""
+    # A cached "nothing found" only counts if the JS fallback was tried too
+    cache = get_result_cache()
+    if cache is None:
+        return None
+    cached = cache.get(url, negative_methods=('fallback', 'dns'))
+    if cache_stats is not None:
+        cache_stats.record(cached is not None)
+    if cached is None:
+        return None
+    print(f"Cache hit for {url} ({cached.method})")
+    return cached.cell
+
+def extract_emails_with_fallback(url, cache_stats=None, mode=None, refresh=False):
+    """Emails for one sheet URL; `refresh` ignores a cached result (the new one is still cached)."""
     if pd.isna(url) or not isinstance(url, str) or url.strip() == "":
         return "Invalid URL"
     
     # Clean the URL (remove trailing slashes, etc.)
     url = url.strip().rstrip('/')
     
-    # Try primary method first
-    primary_result = extract_emails_from_url(url)
+    cached = None if refresh else lookup_cached_result(url, cache_stats)
+    if cached is not None:
+        return cached
+    
+    if domain_missing(url):
+        print(f"Skipping {url}: domain not found")
+        return finish_domain_missing(url)
+    
+    mode = mode or FALLBACK_MODE
+    if mode == 'js':
+        return finish_js(url, find_emails_js(url))
+    if mode == 'sequential':
+        return finish_with_fallback(url, extract_emails_from_url(url))
+    if mode == 'hedged':
+        return race_primary_and_js(url)
+    
+    # Try primary method first, unless the homepage is a JS app shell
+    path, primary_result = primary_unless_shell(url)
+    if path == 'spa_shell':
+        print(f"{url} looks like a JavaScript app shell, rendering it directly")
+        return finish_js(url, find_emails_js(url), 'spa_shell')
+    return finish_with_fallback(url, primary_result)
+
+def primary_unless_shell(url):
+    """
+    Fetch the homepage once and check it for a JS app shell. Returns
+    ('spa_shell', None) for a shell, otherwise ('primary', result of the static
+    crawl), reusing the fetched homepage. The result is None if the homepage
+    could not be fetched.
+    """
+    start_url = url if url.startswith(('http://', 'https://')) else f"http://{url}"
+    deadline = site_deadline()
+    html = fetch_html(start_url, deadline)
+    if html is None:
+        return 'primary', None
+    try:
+        page = parse_page(html)
+    except Exception as e:
+        print(f"Error processing {start_url}: {e}")
+        return 'primary', ""
+    if is_spa_shell(html, page):
+        get_race_stats().shell_detected()
+        return 'spa_shell', None
+    return 'primary', extract_emails_from_url(start_url, first_page=page, deadline=deadline)
+
+def race_primary_and_js(url):
+    """
+    Hedged mode: run the static crawl, start JS rendering as well once it has
+    taken HEDGE_AFTER seconds (or straight away for an app shell), and keep
+    whichever finds emails first.
+    """
+    shell = []
+    unreachable = []
+    
+    def primary():
+        path, result = primary_unless_shell(url)
+        if path == 'spa_shell':
+            shell.append(url)
+            return ""
+        if result is None:
+            unreachable.append(url)
+        return result
+    
+    winner, result, hedged = hedged_race(primary, lambda: find_emails_js(url), HEDGE_AFTER,
+                                         found=lambda result: bool(result) and result != "No email ID found")
+    if hedged:
+        get_race_stats().hedge_started()
+    if winner == 'primary':
+        return finish_primary(url, result, 'hedged_primary' if hedged else 'primary')
+    if hedged:
+        path = 'hedged_js'
+    else:
+        path = 'spa_shell' if shell else 'js_fallback'
+    return finish_js(url, result or "No email ID found", path, reachable=not unreachable)
+
+def finish_primary(url, primary_result, path='primary'):
+    print(f"Found emails using primary method for {url}: {primary_result}")
+    cache = get_result_cache()
+    if cache is not None:
+        cache.put(url, primary_result, 'primary')
+    get_race_stats().record(path)
+    return primary_result
+
+def finish_js(url, js_result, path='js_fallback', reachable=True):
+    """
+    Cache and return a JS rendering result, counting it for `path` if it found
+    emails. "Nothing found" is not cached when the static crawl could not
+    fetch the site (`reachable` False): the site may only be down for now.
+    """
+    print(f"JS rendering method results for {url}: {js_result}")
+    cache = get_result_cache()
+    found = js_result != "No email ID found"
+    if cache is not None:
+        if found:
+            cache.put(url, js_result, 'js')
+        elif reachable:
+            cache.put(url, "", 'fallback')
+    get_race_stats().record(path if found else 'none')
+    return js_result
+
+def finish_with_fallback(url, primary_result):
+    """
+    Cache and return the primary result, or run the JS rendering method if it
+    found nothing (None: the site could not be fetched).
+    """
     if primary_result:
-        print(f"Found emails using primary method for {url}: {primary_result}")
-        return primary_result
+        return finish_primary(url, primary_result)
     
     # If primary method fails, try JS rendering method
     print(f"Primary method found no emails for {url}, trying JS rendering method...")
-    js_result = find_emails_js(url)
-    print(f"JS rendering method results for {url}: {js_result}")
-    return js_result
+    return finish_js(url, find_emails_js(url), reachable=primary_result is not None)
 
-def process_single_url(url):
+def finish_domain_missing(url):
+    """Cache a domain that does not exist as a negative result and return its cell."""
+    cache = get_result_cache()
+    if cache is not None:
+        cache.put(url, "", 'dns')
+    return DOMAIN_NOT_FOUND
+
+def process_single_url(url, cache_stats=None, mode=None, refresh=False, trace=None):
     """Process a single URL with both methods, to be used with ThreadPoolExecutor"""
-    try:
-        return extract_emails_with_fallback(url)
-    except Exception as e:
-        print(f"Error processing URL {url}: {str(e)}")
-        return f"Error: {str(e)}"
-
-def get_optimal_workers(file_size):
-    # Reduced number of workers since JS rendering is resource-intensive
-    if file_size <= 50:
-        return 3  
-    elif file_size <= 100:
-        return 5
-    else:
-        return 8
+    with url_timing(url, trace) as timing:
+        try:
+            result = extract_emails_with_fallback(url, cache_stats=cache_stats, mode=mode, refresh=refresh)
+        except Exception as e:
+            print(f"Error processing URL {url}: {str(e)}")
+            result = f"Error: {str(e)}"
+        if timing is not None:
+            timing.result = row_kind(result)
+        return result
 
-def process_urls_in_parallel(df, url_column, num_workers):
-    urls = df[url_column].tolist()
+def process_urls_in_batches(urls, num_workers, cache_stats=None, on_result=None):
+    """Thread fallback: process URLs in fixed batches, one executor per batch."""
+    process_url = partial(process_single_url, cache_stats=cache_stats)
     results = []
     
     # Process in smaller batches to manage resources better
@@ -350,39 +370,320 @@ def process_urls_in_parallel(df, url_column, num_workers):
     for i in range(0, len(urls), batch_size):
         batch = urls[i:i+batch_size]
         with ThreadPoolExecutor(max_workers=num_workers) as executor:
-            batch_results = list(executor.map(process_single_url, batch))
+            batch_results = list(executor.map(process_url, batch))
+        if on_result is not None:
+            for offset, result in enumerate(batch_results):
+                on_result(i + offset, batch[offset], result)
         results.extend(batch_results)
-        time.sleep(1)  # Brief pause between batches
     
     return results
 
+def process_urls_with_pipeline(urls, num_workers, cache_stats=None, on_result=None):
+    """
+    Pipeline mode: cache lookups first, then the static crawl for every miss on
+    the two-stage fetch/parse pipeline, then the JS fallback for rows it left empty.
+    A site the pipeline could not fetch comes back as None, so its fallback
+    result is not cached as a negative.
+    """
+    results = [None] * len(urls)
+    misses = []
+    for index, url in enumerate(urls):
+        if pd.isna(url) or not isinstance(url, str) or url.strip() == "":
+            results[index] = "Invalid URL"
+        else:
+            url = url.strip().rstrip('/')
+            cached = lookup_cached_result(url, cache_stats)
+            if cached is not None:
+                results[index] = cached
+            elif domain_missing(url):
+                results[index] = finish_domain_missing(url)
+            else:
+                misses.append((index, url))
+                continue
+        if on_result is not None:
+            on_result(index, url, results[index])
+    
+    pipeline = CrawlPipeline(fetch_workers=num_workers)
+    primary_results = pipeline.run([url for _, url in misses])
+    print(f"Pipeline stats: {pipeline.stats()}")
+    
+    def finish(item):
+        (index, url), primary_result = item
+        try:
+            return finish_with_fallback(url, primary_result)
+        except Exception as e:
+            print(f"Error processing URL {url}: {str(e)}")
+            return f"Error: {str(e)}"
+    
+    def finished(position, item, result):
+        if on_result is not None:
+            index, url = item[0]
+            on_result(index, url, result)
+    
+    fallback_results, _ = run_crawl(list(zip(misses, primary_results)), finish, concurrency=num_workers,
+                                    per_host_limit=PER_HOST_LIMIT, host_key=lambda item: host_of(item[0][1]),
+                                    on_result=finished)
+    for (index, _), result in zip(misses, fallback_results):
+        results[index] = result
+    return results
+
+def process_urls_with_shards(urls, num_workers, on_result=None):
+    """
+    Sharded mode: the sites go through the shard queue to SHARD_WORKERS local
+    worker processes (and any workers started elsewhere on the same queue),
+    which run process_single_url with num_workers threads between them. Cache
+    hits are counted in the workers, not in this request's cache stats.
+    """
+    concurrency = max(1, -(-num_workers // max(1, SHARD_WORKERS)))
+    return run_sharded(urls, 'app:process_single_url', workers=SHARD_WORKERS, concurrency=concurrency,
+                       on_result=on_result)
+
+def process_urls_in_parallel(df, url_column, num_workers, mode=None, cache_stats=None, dedup_stats=None,
+                             on_row_result=None):
+    """
+    Crawl each distinct site of the URL column once and return one result per
+    row. `on_row_result(row position, result)` is called for every row as soon
+    as its site is done.
+    """
+    rows = df[url_column].tolist()
+    groups = SiteGroups(rows)
+    dedup_stats = dedup_stats if dedup_stats is not None else DedupStats()
+    dedup_stats.record(len(rows), len(groups.urls))
+    print(dedup_stats.summary())
+    urls = groups.urls
+    pre_resolve_urls(urls)
+    
+    def site_done(position, url, result):
+        if on_row_result is not None:
+            for row in groups.site_rows[position]:
+                on_row_result(row, result)
+    
+    mode = mode or CRAWL_MODE
+    if mode == 'threads':
+        results = process_urls_in_batches(urls, num_workers, cache_stats=cache_stats, on_result=site_done)
+    elif mode == 'pipeline':
+        results = process_urls_with_pipeline(urls, num_workers, cache_stats=cache_stats, on_result=site_done)
+    elif mode == 'sharded':
+        results = process_urls_with_shards(urls, num_workers, on_result=site_done)
+    else:
+        process_url = partial(process_single_url, cache_stats=cache_stats)
+        results, stats = run_crawl(urls, process_url, concurrency=num_workers, per_host_limit=PER_HOST_LIMIT,
+                                   on_result=site_done)
+        print(f"Crawled {stats.done} URLs in {stats.elapsed:.1f}s ({stats.urls_per_sec:.2f} URLs/sec, {stats.errors} errors)")
+    return groups.fan_out(results)
+
+def build_output_workbook(df):
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        df.to_excel(writer, index=False)
+    output.seek(0)
+    return output
+
 @app.route('/')
 def upload_file():
     return render_template('upload.html')
 
+def build_checkpoint_workbook(checkpoint, df=None):
+    """Output workbook of a checkpointed upload, with every row's result taken from the store."""
+    if df is None:
+        df = pd.read_excel(checkpoint.input_path)
+    results = checkpoint.results()
+    df['Emails'] = [results.get(index, "") for index in range(len(df))]
+    return build_output_workbook(df)
+
 @app.route('/process', methods=['POST'])
 def process_file():    
     file = request.files['file']
     if not file or not file.filename.endswith('.xlsx'):
         return "Invalid file type. Please upload an Excel file.", 400
     try:
-        df = pd.read_excel(file)
+        # Uploading the same file again skips the rows an interrupted run finished
+        checkpoint = get_checkpoint_store().open_upload(file, 'xlsx', CHECKPOINT_SOURCE, settings=FALLBACK_MODE)
+        df = pd.read_excel(checkpoint.input_path)
         url_column = find_url_column(df.columns)
         if not url_column:
             return "No column found that likely contains URLs.", 400
         
-        num_workers = get_optimal_workers(len(df))
-        df['Emails'] = process_urls_in_parallel(df, url_column, num_workers)
+        done = checkpoint.reusable_results()
+        todo = [index for index in range(len(df)) if index not in done]
+        if done:
+            print(f"Resuming {file.filename}: {len(done)} of {len(df)} rows already checkpointed")
+        checkpoint.set_status('running', rows_total=len(df))
+        urls = df[url_column].tolist()
+        
+        def save_row(position, result):
+            index = todo[position]
+            checkpoint.save(index, urls[index], result)
         
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False)
-        output.seek(0)
+        num_workers = get_concurrency_controller().row_workers(len(todo))
+        cache_stats = CacheStats()
+        dedup_stats = DedupStats()
+        if todo:
+            process_urls_in_parallel(df.iloc[todo], url_column, num_workers, cache_stats=cache_stats,
+                                     dedup_stats=dedup_stats, on_row_result=save_row)
+        checkpoint.set_status('done')
+        print(f"Cache hit rate: {cache_stats.hit_rate:.1%} ({cache_stats.hits} hits, {cache_stats.misses} misses)")
+        print(f"Pages per site: {get_frontier_stats().as_dict()}")
+        print(f"Extraction paths: {get_race_stats().as_dict()}")
+        
+        output = build_checkpoint_workbook(checkpoint, df)
         original_filename = file.filename
         processed_filename = f"{original_filename}"
-        return send_file(output, as_attachment=True, download_name=processed_filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response = send_file(output, as_attachment=True, download_name=processed_filename, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+        response.headers['X-Cache-Hits'] = str(cache_stats.hits)
+        response.headers['X-Cache-Misses'] = str(cache_stats.misses)
+        response.headers['X-Cache-Hit-Rate'] = f"{cache_stats.hit_rate:.3f}"
+        response.headers['X-Dedup-Ratio'] = f"{dedup_stats.ratio:.3f}"
+        return response
+    except Exception as e:
+        return f"An error occurred: {e}", 500
+
+def submit_checkpointed_job(checkpoint, rows=None, mode=None, refresh=False, trace=False):
+    """
+    Queue the rows of a checkpointed upload that have no result yet or a
+    failed one, or the (index, url) `rows` given for a rerun, as a background
+    job with the checkpoint's ID. Every result is checkpointed as it finishes
+    and the output is built from the store. With `trace` (or JOB_TRACE) every
+    stage of every URL is written to the job's trace file.
+    """
+    df = pd.read_excel(checkpoint.input_path)
+    if rows is None:
+        done = checkpoint.reusable_results()
+        urls = df[find_url_column(df.columns)].tolist()
+        rows = [(index, url) for index, url in enumerate(urls) if index not in done]
+    settings = mode or FALLBACK_MODE
+    checkpoint.set_status('running', rows_total=len(df), settings=settings)
+    cache_stats = CacheStats()
+    dedup_stats = DedupStats()
+    job_trace = JobTrace(checkpoint.id) if trace or JOB_TRACE else None
+    process_url = SharedResults(partial(process_single_url, cache_stats=cache_stats, mode=mode, refresh=refresh,
+                                        trace=job_trace),
+                                stats=dedup_stats)
+    
+    def finalize(results):
+        if job_trace is not None:
+            job_trace.close()
+        checkpoint.set_status('done')
+        return build_checkpoint_workbook(checkpoint)
+    
+    pre_resolve_in_background(url for _, url in rows)
+    return get_job_manager().submit(
+        checkpoint.name, rows, checkpointed(checkpoint, process_url, settings), finalize,
+        progress_fn=lambda: dict(checkpoint.progress(), cache_hit_rate=round(cache_stats.hit_rate, 3),
+                                 dedup_ratio=round(dedup_stats.ratio, 3)),
+        job_id=checkpoint.id)
+
+def job_response(job):
+    return jsonify(job_id=job.id, status_url=url_for('job_status', job_id=job.id),
+                   download_url=url_for('download_job', job_id=job.id)), 202
+
+def find_checkpoint(job_id):
+    """This app's checkpoint for a job ID, or None."""
+    checkpoint = get_checkpoint_store().get(job_id)
+    return checkpoint if checkpoint is not None and checkpoint.source == CHECKPOINT_SOURCE else None
+
+def find_job(job_id):
+    """
+    The job manager's job for an ID. A checkpointed job this process does not
+    know (it was cut short by a restart) is resumed; a finished one is None.
+    """
+    job = get_job_manager().get(job_id)
+    if job is not None:
+        return job
+    checkpoint = find_checkpoint(job_id)
+    if checkpoint is None or checkpoint.status == 'done':
+        return None
+    print(f"Resuming job {job_id} ({checkpoint.name}) from its checkpoint")
+    return submit_checkpointed_job(checkpoint)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue an upload for background processing and return its job ID right away."""
+    file = request.files.get('file')
+    if not file or not file.filename.endswith('.xlsx'):
+        return "Invalid file type. Please upload an Excel file.", 400
+    try:
+        checkpoint = get_checkpoint_store().open_upload(file, 'xlsx', CHECKPOINT_SOURCE, settings=FALLBACK_MODE)
+        df = pd.read_excel(checkpoint.input_path)
     except Exception as e:
         return f"An error occurred: {e}", 500
+    if not find_url_column(df.columns):
+        return "No column found that likely contains URLs.", 400
+    
+    try:
+        job = submit_checkpointed_job(checkpoint, trace=request.form.get('trace') == '1')
+    except JobQueueFull as e:
+        return str(e), 503
+    return job_response(job)
+
+@app.route('/jobs/<job_id>/rerun', methods=['POST'])
+def rerun_job(job_id):
+    """
+    Rerun a finished job's failed and/or empty rows (form field `rows`, e.g.
+    "failed,empty") with another fallback mode (`mode`, JS rendering only by
+    default), ignoring cached results.
+    """
+    checkpoint = find_checkpoint(job_id)
+    if checkpoint is None:
+        return "Unknown job.", 404
+    kinds = [kind.strip() for kind in request.form.get('rows', ','.join(RERUN_KINDS)).split(',') if kind.strip()]
+    mode = request.form.get('mode', 'js')
+    if not kinds or any(kind not in RERUN_KINDS for kind in kinds) or mode not in FALLBACK_MODES:
+        return f"rows must be taken from {', '.join(RERUN_KINDS)} and mode from {', '.join(FALLBACK_MODES)}.", 400
+    job = get_job_manager().get(job_id)
+    if checkpoint.status != 'done' or (job is not None and job.status in ('queued', 'running')):
+        return "Job is still running.", 409
+    rows = checkpoint.rows_to_rerun(kinds)
+    print(f"Rerunning {len(rows)} {'/'.join(kinds)} rows of job {job_id} with mode {mode}")
+    try:
+        job = submit_checkpointed_job(checkpoint, rows=rows, mode=mode, refresh=True,
+                                      trace=request.form.get('trace') == '1')
+    except JobQueueFull as e:
+        return str(e), 503
+    return job_response(job)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = find_job(job_id)
+    if job is not None:
+        return jsonify(job.progress())
+    checkpoint = find_checkpoint(job_id)
+    if checkpoint is None:
+        return "Unknown job.", 404
+    return jsonify(dict(checkpoint.progress(), job_id=job_id, name=checkpoint.name, status=checkpoint.status))
+
+@app.route('/jobs/<job_id>/download')
+def download_job(job_id):
+    job = find_job(job_id)
+    if job is None:
+        checkpoint = find_checkpoint(job_id)
+        if checkpoint is None:
+            return "Unknown job.", 404
+        return send_file(build_checkpoint_workbook(checkpoint), as_attachment=True, download_name=checkpoint.name, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+    if job.status == 'failed':
+        return f"An error occurred: {job.error}", 500
+    if job.status != 'done':
+        return "Job is still running.", 409
+    return send_file(os.path.abspath(job.output_path), as_attachment=True, download_name=job.name, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
+
+@app.route('/jobs/<job_id>/trace')
+def job_trace(job_id):
+    """The per-stage trace of a job submitted with trace=1, as JSON lines."""
+    if find_checkpoint(job_id) is None:
+        return "Unknown job.", 404
+    path = JobTrace.path_for(job_id)
+    if not os.path.exists(path):
+        return "Job was not traced.", 404
+    return send_file(os.path.abspath(path), mimetype='application/x-ndjson')
+
+@app.route('/metrics')
+def metrics():
+    """Stage timing histograms and crawl gauges in the Prometheus text format."""
+    concurrency = get_concurrency_controller().snapshot()
+    gauges = {f"crawler_{name}": value for name, value in concurrency.items() if name != 'recent_decisions'}
+    gauges['crawler_browsers_active'] = active_browser_count()
+    gauges['crawler_jobs_pending'] = get_job_manager().pending_count()
+    return get_stage_metrics().render_prometheus(gauges), 200, {'Content-Type': 'text/plain; version=0.0.4'}
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,82 @@
+"""
+Browser pool throughput and per-page latency against a local test server.
+
+    python -m benchmarks.bench_browser_pool --pages 40 --pool-size 2
+
+Needs Chrome and chromedriver, like the JS fallback itself. Pass --baseline to
+also time the old one-Chrome-per-page approach for comparison.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.local_server import LocalServer, percentile
+from browser_pool import BrowserPool, BrowserWorker
+
+JS_PAGE = """<html><body><div id="out"></div>
+<script>
+setTimeout(function () {
+    document.getElementById('out').innerHTML = 'Mail ' + 'sales' + '@' + 'example.org';
+}, 200);
+</script></body></html>"""
+
+
+def run_pool(server, pages, pool_size, max_pages_per_browser):
+    pool = BrowserPool(size=pool_size, max_pages_per_browser=max_pages_per_browser)
+    latencies = []
+
+    def render(i):
+        start = time.monotonic()
+        html_content = pool.render(server.url(f'/page{i}'))
+        latencies.append(time.monotonic() - start)
+        return html_content is not None and 'sales@example.org' in html_content
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=pool_size) as executor:
+        ok = sum(executor.map(render, range(pages)))
+    elapsed = time.monotonic() - start
+    stats = pool.stats()
+    pool.close()
+    return elapsed, latencies, ok, stats
+
+
+def run_baseline(server, pages):
+    latencies = []
+    start = time.monotonic()
+    ok = 0
+    for i in range(pages):
+        page_start = time.monotonic()
+        worker = BrowserWorker()
+        worker.start()
+        worker.driver.get(server.url(f'/page{i}'))
+        time.sleep(3)
+        ok += 'sales@example.org' in worker.driver.page_source
+        worker.stop()
+        latencies.append(time.monotonic() - page_start)
+    return time.monotonic() - start, latencies, ok
+
+
+def report(label, elapsed, latencies, ok, pages):
+    print(f"{label}: {pages / elapsed:.2f} pages/sec, p50 {percentile(latencies, 50):.3f}s, "
+          f"p95 {percentile(latencies, 95):.3f}s, rendered {ok}/{pages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--pool-size', type=int, default=2)
+    parser.add_argument('--max-pages-per-browser', type=int, default=50)
+    parser.add_argument('--baseline', action='store_true')
+    args = parser.parse_args()
+
+    with LocalServer({'*': JS_PAGE}) as server:
+        elapsed, latencies, ok, stats = run_pool(server, args.pages, args.pool_size, args.max_pages_per_browser)
+        report('pool', elapsed, latencies, ok, args.pages)
+        print(f"pool stats: {stats}")
+        if args.baseline:
+            elapsed, latencies, ok = run_baseline(server, args.pages)
+            report('one browser per page', elapsed, latencies, ok, args.pages)
+
+
+if __name__ == '__main__':
+    main()
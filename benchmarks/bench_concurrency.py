@@ -0,0 +1,80 @@
+"""
+Adaptive concurrency against fixed worker counts on slow local sites.
+
+    python -m benchmarks.bench_concurrency --sites 60 --latency 0.2
+
+Every local site answers each page after --latency seconds, so throughput is
+bound by how many fetches run at once. The sheet runs through
+app.process_urls_in_parallel with a controller pinned at the old
+get_optimal_workers value (8), then with the adaptive controller, which
+should grow the static limit and finish sooner. A last run reports low free
+memory halfway through to show the controller backing off. The controller's
+decisions are printed as they happen.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+import concurrency  # noqa: E402
+from benchmarks.local_server import LocalServer  # noqa: E402
+from concurrency import ConcurrencyController, memory_available  # noqa: E402
+
+
+def slow_contact_site(email, latency):
+    def page(body):
+        def route(handler):
+            time.sleep(latency)
+            handler.send_html(body)
+        return route
+
+    return {
+        '/': page('<html><body><a href="/contact">Contact</a><a href="/about">About</a></body></html>'),
+        '/contact': page(f'<html><body><a href="mailto:{email}">{email}</a></body></html>'),
+        '/about': page('<html><body><p>About us</p></body></html>'),
+    }
+
+
+def run(label, df, controller):
+    concurrency._shared_controller = controller.start()
+    start = time.monotonic()
+    results = app.process_urls_in_parallel(df, 'Website', controller.row_workers(len(df)), mode='async')
+    elapsed = time.monotonic() - start
+    controller.stop()
+    print(f"{label}: {elapsed:.2f}s, {len(df) / elapsed:.1f} rows/sec, final static limit {controller.static.limit}, "
+          f"{len(controller.decisions)} decisions")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=60)
+    parser.add_argument('--latency', type=float, default=0.2)
+    parser.add_argument('--interval', type=float, default=0.5)
+    args = parser.parse_args()
+
+    servers = [LocalServer(slow_contact_site(f"hello{i}@firm{i}.org", args.latency)).start() for i in range(args.sites)]
+    df = pd.DataFrame({'Website': [server.url('/') for server in servers]})
+    try:
+        fixed = run('fixed 8', df, ConcurrencyController(static_start=8, static_max=8, interval=args.interval))
+        adaptive = run('adaptive', df, ConcurrencyController(interval=args.interval))
+
+        start = time.monotonic()
+
+        def squeezed_memory():
+            available_mb, fraction = memory_available()
+            return (available_mb, 0.05) if time.monotonic() - start > 1.5 else (available_mb, fraction)
+
+        pressure = run('memory pressure', df, ConcurrencyController(interval=args.interval, memory_probe=squeezed_memory))
+    finally:
+        for server in servers:
+            server.stop()
+    print(f"identical results: {fixed == adaptive == pressure}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Row deduplication on a lead list that repeats the same sites.
+
+    python -m benchmarks.bench_dedup --sites 10 --repeats 8
+
+Each local contact site appears --repeats times in the URL column, written
+in different ways (bare host, scheme, trailing slash, fragment, tracking
+parameter). "rows" crawls every row as process_urls_in_parallel did before;
+"grouped" is the batch path (SiteGroups) and "streamed" the streaming path
+(SharedResults on the crawl engine). All three must give identical results;
+the grouped and streamed runs should fetch each site only once.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+from benchmarks.local_server import LocalServer, contact_site  # noqa: E402
+from crawl_engine import run_crawl  # noqa: E402
+from url_dedup import DedupStats, SharedResults  # noqa: E402
+
+VARIANTS = ['{netloc}', 'http://{netloc}', 'http://{netloc}/', 'http://{netloc}/#contact', 'http://{netloc}/?utm_source=list']
+
+
+def served(servers):
+    return sum(server.requests_served for server in servers)
+
+
+def run(label, servers, crawl):
+    for server in servers:
+        server.reset_counters()
+    start = time.monotonic()
+    results = crawl()
+    elapsed = time.monotonic() - start
+    print(f"{label}: {elapsed:.2f}s, {served(servers)} pages fetched")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=10)
+    parser.add_argument('--repeats', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    servers = [LocalServer(contact_site(f"sales{i}@company{i}.org", extra_pages=2)).start() for i in range(args.sites)]
+    rows = []
+    for repeat in range(args.repeats):
+        for server in servers:
+            rows.append(VARIANTS[repeat % len(VARIANTS)].format(netloc=server.netloc))
+    df = pd.DataFrame({'Website': rows})
+
+    try:
+        baseline = run('rows', servers, lambda: run_crawl(rows, app.process_single_url, concurrency=args.workers,
+                                                          per_host_limit=app.PER_HOST_LIMIT)[0])
+        dedup_stats = DedupStats()
+        grouped = run('grouped', servers, lambda: app.process_urls_in_parallel(df, 'Website', args.workers, mode='async',
+                                                                               dedup_stats=dedup_stats))
+        shared = SharedResults(app.process_single_url, stats=DedupStats())
+        streamed = run('streamed', servers, lambda: run_crawl(rows, shared, concurrency=args.workers,
+                                                              per_host_limit=app.PER_HOST_LIMIT)[0])
+    finally:
+        for server in servers:
+            server.stop()
+
+    print(f"dedup ratio: {dedup_stats.ratio:.1%} (streamed {shared.stats.ratio:.1%})")
+    print(f"identical results: grouped {grouped == baseline}, streamed {streamed == baseline}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+"""
+DNS pre-resolution and caching on a sheet with many dead domains.
+
+    python -m benchmarks.bench_dns --rows 40 --dead-share 0.5 [--simulated-render 1]
+
+A stub DNS server (benchmarks.stub_resolver) answers live*.test with
+127.0.0.1 after --live-delay seconds and everything else with NXDOMAIN after
+--dead-delay seconds, like a slow recursive resolver. Live rows point at a
+local contact site. The sheet runs through app.process_urls_in_parallel
+twice: "before" looks every host up again for each connection and crawls
+dead rows like any other (static crawl, then the JS fallback); "after" uses
+the TTL cache and drops dead rows after the pre-resolution stage.
+
+Without Chrome, --simulated-render SECONDS stands in for the JS fallback as
+in bench_fallback_race.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+import dns_cache  # noqa: E402
+from benchmarks.bench_fallback_race import simulated_find_emails_js  # noqa: E402
+from benchmarks.local_server import LocalServer, contact_site  # noqa: E402
+from benchmarks.stub_resolver import StubResolver  # noqa: E402
+from dns_cache import DnsCache, DnspythonResolver  # noqa: E402
+from http_client import configure_http_client  # noqa: E402
+
+
+def run(label, df, workers, cache, pre_resolve):
+    dns_cache._shared_cache = cache
+    dns_cache.DNS_PRE_RESOLVE = pre_resolve
+    configure_http_client(dns_cache=cache)
+    start = time.monotonic()
+    results = app.process_urls_in_parallel(df, 'Website', workers, mode='async')
+    elapsed = time.monotonic() - start
+    print(f"{label}: {elapsed:.2f}s, {len(df) / elapsed:.1f} rows/sec, DNS {cache.stats()}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=40)
+    parser.add_argument('--dead-share', type=float, default=0.5)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--live-delay', type=float, default=0.05)
+    parser.add_argument('--dead-delay', type=float, default=1.0)
+    parser.add_argument('--simulated-render', type=float, default=None)
+    args = parser.parse_args()
+
+    if args.simulated_render is not None:
+        app.find_emails_js = simulated_find_emails_js(args.simulated_render)
+
+    resolver = StubResolver(lambda name: name.startswith('live'), ttl=300,
+                            live_delay=args.live_delay, dead_delay=args.dead_delay).start()
+    site = LocalServer(contact_site('team@live-company.org', extra_pages=2)).start()
+    port = site.netloc.rsplit(':', 1)[1]
+    dead_rows = int(args.rows * args.dead_share)
+    urls = [f"http://dead{i}.test:{port}" for i in range(dead_rows)]
+    urls += [f"http://live{i}.test:{port}" for i in range(args.rows - dead_rows)]
+    df = pd.DataFrame({'Website': urls})
+    stub = DnspythonResolver([resolver.nameserver])
+
+    try:
+        before = run('before', df, args.workers, DnsCache(resolver=stub, ttl=0, negative_ttl=0, min_ttl=0), False)
+        queries_before = resolver.queries
+        after = run('after', df, args.workers, DnsCache(resolver=stub), True)
+    finally:
+        site.stop()
+        resolver.stop()
+
+    print(f"resolver queries: before {queries_before}, after {resolver.queries - queries_before}")
+    live_same = all(b == a for b, a in zip(before[dead_rows:], after[dead_rows:]))
+    print(f"live rows identical: {live_same}; dead rows after: {set(after[:dead_rows])}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""
+Sequential, shell-detecting and hedged JS fallback scheduling on local sites.
+
+    python -m benchmarks.bench_fallback_race --sites 9 [--simulated-render 2]
+
+A third of the sites are static contact sites. A third are JavaScript app
+shells whose every page is an empty mount point plus a bundle. The rest are
+ordinary-looking pages whose email is only filled in by a script. Both of
+the latter have slow subpages, so the static crawl spends a while finding
+nothing. Each mode runs extract_emails_with_fallback over all sites and
+reports wall time and which path produced each result.
+
+Rendering needs Chrome, like the JS fallback itself. Without Chrome, pass
+--simulated-render SECONDS to replace find_emails_js with a stand-in that
+waits that long and reads the email the shell would have rendered.
+"""
+import argparse
+import os
+import time
+
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+
+import app  # noqa: E402
+from benchmarks.local_server import LocalServer, contact_site  # noqa: E402
+from crawl_engine import run_crawl  # noqa: E402
+from fallback_race import RaceStats  # noqa: E402
+import fallback_race  # noqa: E402
+
+SHELL = """<html><head><script src="/static/js/main.4f9a2c1e.js"></script></head>
+<body><noscript>You need to enable JavaScript to run this app.</noscript><div id="root"></div>
+<a href="/contact">Contact</a><a href="/about">About</a></body></html>"""
+
+
+def js_site(email, subpage_delay, homepage):
+    def slow_page(handler):
+        time.sleep(subpage_delay)
+        handler.send_html(homepage)
+
+    # What a browser would see after the scripts ran
+    rendered = f'<html><body><a href="mailto:{email}">{email}</a></body></html>'
+    return {'/': homepage, '/rendered': rendered, '*': slow_page}
+
+
+def injected_page():
+    text = ' '.join(f"We have served our customers for {n} years." for n in range(20))
+    return (f'<html><body><p>{text}</p><p id="mail"></p><a href="/contact">Contact</a><a href="/about">About</a>'
+            '<script>document.getElementById("mail").textContent = atob("b3duZXI=");</script></body></html>')
+
+
+def simulated_find_emails_js(render_seconds):
+    def find_emails_js(base_url, max_subpages=3, max_retries=2):
+        time.sleep(render_seconds)
+        html = app.fetch_html(base_url.rstrip('/') + '/rendered')
+        emails = app.parse_page(html).emails if html else set()
+        return ', '.join(emails) if emails else "No email ID found"
+    return find_emails_js
+
+
+def run_mode(mode, urls):
+    fallback_race._race_stats = RaceStats()
+    start = time.monotonic()
+    results, _ = run_crawl(urls, lambda url: app.extract_emails_with_fallback(url, mode=mode), concurrency=len(urls))
+    elapsed = time.monotonic() - start
+    return results, elapsed, fallback_race.get_race_stats().as_dict()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=9)
+    parser.add_argument('--subpage-delay', type=float, default=1.0)
+    parser.add_argument('--simulated-render', type=float, default=None)
+    parser.add_argument('--hedge-after', type=float, default=3.0)
+    args = parser.parse_args()
+
+    if args.simulated_render is not None:
+        app.find_emails_js = simulated_find_emails_js(args.simulated_render)
+    app.HEDGE_AFTER = args.hedge_after
+
+    servers = []
+    for i in range(args.sites):
+        email = f"owner{i}@site{i}.org"
+        if i % 3 == 0:
+            routes = contact_site(email, extra_pages=2)
+        elif i % 3 == 1:
+            routes = js_site(email, args.subpage_delay, SHELL)
+        else:
+            routes = js_site(email, args.subpage_delay, injected_page())
+        servers.append(LocalServer(routes).start())
+    urls = [server.url('/') for server in servers]
+
+    try:
+        baseline = None
+        for mode in ('sequential', 'detect', 'hedged'):
+            results, elapsed, stats = run_mode(mode, urls)
+            if baseline is None:
+                baseline = results
+            print(f"{mode}: {elapsed:.2f}s, same results as sequential: {results == baseline}, "
+                  f"wins={stats['wins']}, shells={stats['shells_detected']}, hedges={stats['hedges_started']}")
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+"""
+End-to-end crawl benchmark on a local farm of synthetic sites.
+
+    python -m benchmarks.bench_farm [--sites 32] [--targets fallback,newnewapp,process,newnewapp-process]
+
+Starts a SiteFarm (see site_farm.py: static, concatenated, JS-injected,
+redirecting, slow, large, failing and dead sites) and runs every target over
+all of its sites:
+
+  fallback           app.extract_emails_with_fallback per URL, on the crawl engine
+  newnewapp          newnewapp.extract_emails_from_url per URL, on the crawl engine
+  process            POST /process of app.py with the URLs as an .xlsx sheet
+  newnewapp-process  POST /process of newnewapp.py with the URLs as a .csv sheet
+
+For each it reports throughput, p50/p95 latency per URL, the peak RSS of the
+process during the run and the recall of the emails the farm planted, per
+site kind and overall. Latencies of the /process targets come from the
+per-URL timing log (metrics.py). Nothing leaves the machine: rendering uses
+simulated_find_emails_js with --simulated-render seconds per site unless
+--chrome is given, and the result cache, checkpoints and timing log go to a
+temporary directory.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+
+_scratch = tempfile.mkdtemp(prefix='bench_farm-')
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+os.environ.setdefault('CHECKPOINT_PATH', os.path.join(_scratch, 'checkpoints.sqlite3'))
+os.environ.setdefault('CHECKPOINT_DIR', os.path.join(_scratch, 'checkpoints'))
+os.environ.setdefault('TIMING_LOG', os.path.join(_scratch, 'crawl_timing.log'))
+
+import pandas as pd  # noqa: E402
+
+import app  # noqa: E402
+import newnewapp  # noqa: E402
+from benchmarks.bench_fallback_race import simulated_find_emails_js  # noqa: E402
+from benchmarks.local_server import percentile  # noqa: E402
+from benchmarks.site_farm import KINDS, SiteFarm, score  # noqa: E402
+from concurrency import process_rss_mb  # noqa: E402
+from crawl_engine import run_crawl  # noqa: E402
+from metrics import timing_log  # noqa: E402
+
+TARGETS = ('fallback', 'newnewapp', 'process', 'newnewapp-process')
+
+
+class RssSampler:
+    """Samples process_rss_mb() on a thread and keeps the peak."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, process_rss_mb())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+class UrlLatencies(logging.Handler):
+    """Collects the per-URL seconds of the timing log's summary lines."""
+
+    def __init__(self):
+        super().__init__()
+        self.seconds = []
+
+    def emit(self, record):
+        try:
+            self.seconds.append(json.loads(record.getMessage())['seconds'])
+        except (ValueError, KeyError):
+            pass
+
+
+def crawl_each(fn, urls, workers):
+    latencies = []
+
+    def timed_fn(url):
+        start = time.monotonic()
+        try:
+            return fn(url)
+        finally:
+            latencies.append(time.monotonic() - start)
+
+    results, _ = run_crawl(urls, timed_fn, concurrency=workers, per_host_limit=app.PER_HOST_LIMIT)
+    return results, latencies
+
+
+def post_sheet(flask_app, urls, fmt):
+    df = pd.DataFrame({'Website': urls})
+    upload = BytesIO()
+    if fmt == 'xlsx':
+        df.to_excel(upload, index=False)
+    else:
+        upload.write(df.to_csv(index=False).encode('utf-8'))
+    upload.seek(0)
+    response = flask_app.test_client().post('/process', data={'file': (upload, f"farm.{fmt}")})
+    if response.status_code != 200:
+        raise RuntimeError(f"/process returned {response.status_code}: {response.get_data(as_text=True)[:200]}")
+    data = BytesIO(response.get_data())
+    output = pd.read_excel(data) if fmt == 'xlsx' else pd.read_csv(StringIO(data.getvalue().decode('utf-8')))
+    return output['Emails'].fillna('').astype(str).tolist()
+
+
+def run_target(target, farm, workers):
+    urls = farm.urls
+    latencies = UrlLatencies()
+    timing_log.addHandler(latencies)
+    try:
+        with RssSampler() as rss:
+            start = time.monotonic()
+            if target == 'fallback':
+                results, per_url = crawl_each(app.extract_emails_with_fallback, urls, workers)
+            elif target == 'newnewapp':
+                results, per_url = crawl_each(newnewapp.extract_emails_from_url, urls, workers)
+            elif target == 'process':
+                results, per_url = post_sheet(app.app, urls, 'xlsx'), latencies.seconds
+            else:
+                results, per_url = post_sheet(newnewapp.app, urls, 'csv'), latencies.seconds
+            elapsed = time.monotonic() - start
+    finally:
+        timing_log.removeHandler(latencies)
+    return results, per_url, elapsed, rss.peak
+
+
+def report(target, farm, results, latencies, elapsed, peak_rss):
+    scores = score(farm.sites, results)
+    hits, expected, extra = scores['all']
+    print(f"{target}: {len(results)} URLs in {elapsed:.2f}s ({len(results) / elapsed:.2f} URLs/s), "
+          f"p50 {percentile(latencies, 50):.2f}s, p95 {percentile(latencies, 95):.2f}s, peak RSS {peak_rss:.0f} MB, "
+          f"recall {hits}/{expected} ({hits / expected if expected else 0:.0%}), {extra} unexpected emails")
+    print('  ' + ', '.join(f"{kind} {scores[kind][0]}/{scores[kind][1]}" for kind in KINDS
+                           if kind in scores and scores[kind][1]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=16)
+    parser.add_argument('--targets', default=','.join(TARGETS))
+    parser.add_argument('--fallback-mode', default=app.FALLBACK_MODE, choices=app.FALLBACK_MODES)
+    parser.add_argument('--slow-seconds', type=float, default=2.0)
+    parser.add_argument('--large-mb', type=float, default=3.0)
+    parser.add_argument('--simulated-render', type=float, default=1.0)
+    parser.add_argument('--chrome', action='store_true', help='render with the real browser pool')
+    args = parser.parse_args()
+
+    targets = [target.strip() for target in args.targets.split(',') if target.strip()]
+    unknown = [target for target in targets if target not in TARGETS]
+    if unknown:
+        parser.error(f"unknown targets {unknown}, choose from {', '.join(TARGETS)}")
+    if not args.chrome:
+        app.find_emails_js = simulated_find_emails_js(args.simulated_render)
+    app.FALLBACK_MODE = args.fallback_mode
+
+    print(f"{args.sites} sites ({', '.join(KINDS)}), fallback mode {args.fallback_mode}, "
+          f"{'Chrome' if args.chrome else f'simulated {args.simulated_render}s'} renders")
+    for target in targets:
+        # A new farm per target: fresh ports, so no connection or DNS state carries over
+        with SiteFarm(args.sites, slow_seconds=args.slow_seconds, large_bytes=int(args.large_mb * 2 ** 20)) as farm:
+            results, latencies, elapsed, peak_rss = run_target(target, farm, args.workers)
+        report(target, farm, results, latencies, elapsed, peak_rss)
+
+
+if __name__ == '__main__':
+    main()
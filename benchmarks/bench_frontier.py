@@ -0,0 +1,116 @@
+"""
+Crawl frontier against the old unbounded recursion on a large local site.
+
+    python -m benchmarks.bench_frontier [--fanout 6] [--levels 3] [--budget 10]
+
+The site's homepage links to a contact page and to --fanout /about/... pages,
+and every about page links to --fanout deeper ones, --levels deep. Links are
+repeated with fragments, trailing slashes and tracking parameters. "legacy"
+is the recursive fetch_emails the primary crawl used before the frontier.
+Both runs should find the same emails; the frontier should fetch a small,
+bounded number of pages.
+"""
+import argparse
+import time
+from urllib.parse import urljoin, urlparse
+
+from benchmarks.local_server import LocalServer
+from frontier import crawl_site, get_frontier_stats
+from http_client import HttpClient
+from page_parser import parse_page
+from politeness import HostScheduler
+
+EMAIL = 'office@contact-frontier.org'
+LEGACY_KEYWORDS = ['contact', 'about', 'get in touch', 'reach us', 'communication', 'contacts', 'about the company', 'contact us']
+
+
+def deep_site(fanout, levels):
+    def children(path, level):
+        if level >= levels:
+            return ''
+        links = []
+        for i in range(fanout):
+            child = f"{path.rstrip('/')}/about{i}"
+            links.append(f'<a href="{child}">Section {i}</a>')
+            links.append(f'<a href="{child}/#top">Section {i}</a>')
+            links.append(f'<a href="{child}?utm_source=nav">Section {i}</a>')
+        return ''.join(links)
+
+    def route(handler):
+        path = handler.path.split('?', 1)[0].split('#', 1)[0].rstrip('/') or '/'
+        if path == '/contact':
+            handler.send_html(f'<html><body><a href="mailto:{EMAIL}">{EMAIL}</a></body></html>')
+            return
+        level = 0 if path == '/' else path.count('/')
+        body = children(path, level)
+        if path == '/':
+            body = '<a href="/contact">Contact</a>' + body
+        handler.send_html(f'<html><body><p>Page {path}</p>{body}</body></html>')
+
+    return {'*': route}
+
+
+def legacy_crawl(url, client):
+    visited_urls = set()
+    emails = set()
+    base_domain = urlparse(url).netloc
+
+    def fetch_emails(current_url):
+        if current_url in visited_urls:
+            return
+        visited_urls.add(current_url)
+        try:
+            response = client.get(current_url, timeout=10)
+            response.raise_for_status()
+            scan = parse_page(response.text)
+            emails.update(scan.emails)
+            for href, _ in scan.links:
+                full_url = urljoin(current_url, href)
+                if urlparse(full_url).netloc in (base_domain, '') and any(keyword in href.lower() for keyword in LEGACY_KEYWORDS):
+                    fetch_emails(full_url)
+        except Exception as e:
+            print(f"Error processing {current_url}: {e}")
+
+    fetch_emails(url)
+    return emails, len(visited_urls)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--fanout', type=int, default=6)
+    parser.add_argument('--levels', type=int, default=3)
+    parser.add_argument('--budget', type=int, default=10)
+    parser.add_argument('--max-depth', type=int, default=3)
+    args = parser.parse_args()
+
+    server = LocalServer(deep_site(args.fanout, args.levels)).start()
+    client = HttpClient(scheduler=HostScheduler(concurrency=4, min_interval=0))
+
+    def fetch_page(url, deadline=None):
+        try:
+            response = client.get_page(url, timeout=10, deadline=deadline)
+            response.raise_for_status()
+            return parse_page(response.text)
+        except Exception as e:
+            print(f"Error processing {url}: {e}")
+            return None
+
+    try:
+        start = time.perf_counter()
+        legacy_emails, legacy_pages = legacy_crawl(server.url('/'), client)
+        legacy_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        emails, pages = crawl_site(server.url('/'), fetch_page, page_budget=args.budget, max_depth=args.max_depth)
+        frontier_time = time.perf_counter() - start
+    finally:
+        server.stop()
+
+    print(f"legacy:   {legacy_pages} pages, {legacy_time:.2f}s, emails={sorted(legacy_emails)}")
+    print(f"frontier: {pages} pages, {frontier_time:.2f}s, emails={sorted(emails)}")
+    print(f"same emails: {emails == legacy_emails}")
+    print(f"frontier stats: {get_frontier_stats().as_dict()}")
+
+
+if __name__ == '__main__':
+    main()
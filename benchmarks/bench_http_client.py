@@ -0,0 +1,59 @@
+"""
+Connections opened per site, with and without connection reuse.
+
+    python -m benchmarks.bench_http_client --sites 10 --extra-pages 5
+
+Starts one local server per site (each on its own port, so each is a separate
+host to the crawler), runs app.extract_emails_from_url over all of them and
+counts the TCP connections every server accepted. The "before" run sends
+`Connection: close` on every request, which is what bare requests.get did.
+"""
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+from benchmarks.local_server import LocalServer, contact_site
+from http_client import configure_http_client
+
+
+def crawl(servers, workers):
+    for server in servers:
+        server.reset_counters()
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(app.extract_emails_from_url, [server.url('/') for server in servers]))
+    elapsed = time.monotonic() - start
+    connections = sum(server.connections_opened for server in servers)
+    requests_served = sum(server.requests_served for server in servers)
+    found = sum(1 for result in results if result)
+    return elapsed, connections, requests_served, found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=10)
+    parser.add_argument('--extra-pages', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=5)
+    parser.add_argument('--backend', default='requests', choices=['requests', 'httpx'])
+    args = parser.parse_args()
+
+    servers = [LocalServer(contact_site(f'info@site{i}.org', extra_pages=args.extra_pages)).start()
+               for i in range(args.sites)]
+    try:
+        for label, keep_alive in (('before (no reuse)', False), ('after (pooled)', True)):
+            client = configure_http_client(backend=args.backend, keep_alive=keep_alive)
+            elapsed, connections, requests_served, found = crawl(servers, args.workers)
+            print(f"{label}: {requests_served} requests, {connections} connections, "
+                  f"{connections / len(servers):.1f} connections/site, {elapsed:.2f}s, "
+                  f"emails found on {found}/{len(servers)} sites")
+            stats = client.connection_stats()
+            if stats:
+                print(f"  client pools: {stats}")
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
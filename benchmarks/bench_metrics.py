@@ -0,0 +1,103 @@
+"""
+Overhead of the per-stage timing instrumentation.
+
+    python -m benchmarks.bench_metrics [--calls 200000] [--sites 20] [--rounds 3]
+
+First the cost of a single timed() block and observe() call, with metrics
+off, on, and on inside a url_timing() block (which also adds the stage to
+the URL's summary). Then --sites local contact sites are crawled through
+app.process_single_url with METRICS_ENABLED off and on, alternating for
+--rounds rounds, and the fastest crawl of each is compared; the timing log
+goes to a temporary file. Finally the app's /metrics output is printed.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+os.environ.setdefault('TIMING_LOG', os.path.join(tempfile.mkdtemp(), 'crawl_timing.log'))
+
+import app  # noqa: E402
+import metrics  # noqa: E402
+from benchmarks.local_server import LocalServer, contact_site  # noqa: E402
+from crawl_engine import run_crawl  # noqa: E402
+from metrics import get_stage_metrics, observe, timed, url_timing  # noqa: E402
+
+
+def per_call(fn, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter() - start) / calls * 1e6
+
+
+def timed_block():
+    with timed('bench'):
+        pass
+
+
+def observe_call():
+    observe('bench', 0.001)
+
+
+def micro(calls):
+    for label, enabled, in_url in (('off', False, False), ('on', True, False), ('on, inside url_timing', True, True)):
+        metrics.METRICS_ENABLED = enabled
+        if in_url:
+            with url_timing('http://bench.invalid/'):
+                timed_us, observe_us = per_call(timed_block, calls), per_call(observe_call, calls)
+        else:
+            timed_us, observe_us = per_call(timed_block, calls), per_call(observe_call, calls)
+        print(f"metrics {label}: timed() {timed_us:.2f}us, observe() {observe_us:.2f}us per call")
+    metrics.METRICS_ENABLED = True
+
+
+def crawl(urls, workers):
+    start = time.monotonic()
+    results, _ = run_crawl(urls, app.process_single_url, concurrency=workers, per_host_limit=app.PER_HOST_LIMIT)
+    return time.monotonic() - start, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--calls', type=int, default=200000)
+    parser.add_argument('--sites', type=int, default=20)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    micro(args.calls)
+
+    servers = [LocalServer(contact_site(f"info{i}@metrics{i}.org", extra_pages=3)).start() for i in range(args.sites)]
+    urls = [server.url('/') for server in servers]
+    best = {False: float('inf'), True: float('inf')}
+    try:
+        crawl(urls, args.workers)  # warm up connections and the DNS cache
+        for _ in range(args.rounds):
+            for enabled in (False, True):
+                metrics.METRICS_ENABLED = enabled
+                elapsed, results = crawl(urls, args.workers)
+                best[enabled] = min(best[enabled], elapsed)
+    finally:
+        metrics.METRICS_ENABLED = True
+        for server in servers:
+            server.stop()
+
+    found = sum(1 for result in results if '@' in result)
+    print(f"crawl of {args.sites} sites: metrics off {best[False]:.3f}s, on {best[True]:.3f}s "
+          f"({(best[True] / best[False] - 1):+.1%}), {found} sites with emails")
+    for stage, values in get_stage_metrics().snapshot().items():
+        print(f"  {stage:<10} {values['count']:>7} observations, avg {values['avg'] * 1000:.2f}ms")
+
+    response = app.app.test_client().get('/metrics')
+    lines = response.get_data(as_text=True).splitlines()
+    print(f"/metrics: {response.status_code}, {len(lines)} lines, e.g.")
+    for line in lines:
+        if 'stage="fetch"' in line and ('_sum' in line or '_count' in line) or line.startswith('crawler_static'):
+            print(f"  {line}")
+    print(f"timing log: {app.TIMING_LOG}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Parser backend comparison on a fixed HTML corpus.
+
+    python -m benchmarks.bench_parsers [--corpus DIR] [--pages 200]
+
+Times parse + scan for every installed backend and checks that each one finds
+exactly the same emails and links as html.parser on every page.
+"""
+import argparse
+import time
+
+from benchmarks.corpus import load_corpus
+from page_parser import BACKENDS, available_backends
+
+
+def run(backend, corpus):
+    scan_page = BACKENDS[backend]
+    start = time.perf_counter()
+    scans = [scan_page(html) for html in corpus]
+    return time.perf_counter() - start, scans
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--corpus', help='directory of saved .html pages')
+    parser.add_argument('--pages', type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus, pages=args.pages)
+    print(f"{len(corpus)} pages, {sum(len(html) for html in corpus) / 1e6:.1f} MB")
+    baseline = None
+    for backend in available_backends():
+        elapsed, scans = run(backend, corpus)
+        line = f"{backend}: {len(corpus) / elapsed:.0f} pages/sec"
+        if baseline is None:
+            baseline = scans
+        else:
+            mismatches = [i for i, (scan, expected) in enumerate(zip(scans, baseline))
+                          if scan.emails != expected.emails
+                          or [href for href, _ in scan.links] != [href for href, _ in expected.links]]
+            line += ", results identical" if not mismatches else f", {len(mismatches)} pages differ (first: {mismatches[0]})"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Two-stage pipeline against local sites, with per-stage utilization.
+
+    python -m benchmarks.bench_pipeline --sites 40 --fetch-workers 20
+
+Serves large synthetic pages from local servers so that parsing carries real
+CPU cost, then crawls them once with thread-only extraction (the crawl engine
+running extract_emails_from_url) and once with the fetch/parse pipeline. The
+pipeline's stats show which stage was the bottleneck.
+"""
+import argparse
+import random
+import time
+
+from benchmarks.corpus import synthetic_page
+from benchmarks.local_server import LocalServer
+from crawl_engine import run_crawl
+from pipeline import CrawlPipeline
+
+
+def site_routes(rng, index, paragraphs):
+    page = synthetic_page(rng, index, paragraphs=paragraphs, links=20)
+    return {'/': page, '*': page.replace('/contact/', '/news/').replace('/about/', '/blog/')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=40)
+    parser.add_argument('--paragraphs', type=int, default=200)
+    parser.add_argument('--fetch-workers', type=int, default=20)
+    parser.add_argument('--parse-workers', type=int, default=None)
+    args = parser.parse_args()
+
+    import app
+
+    rng = random.Random(3)
+    servers = [LocalServer(site_routes(rng, i, args.paragraphs)).start() for i in range(args.sites)]
+    urls = [server.url('/') for server in servers]
+    try:
+        start = time.monotonic()
+        threaded, _ = run_crawl(urls, app.extract_emails_from_url, concurrency=args.fetch_workers)
+        elapsed = time.monotonic() - start
+        print(f"threads only: {len(urls) / elapsed:.2f} sites/sec")
+
+        pipeline = CrawlPipeline(fetch_workers=args.fetch_workers, parse_workers=args.parse_workers)
+        pipeline.run(urls[:1])  # warm up the worker processes
+        start = time.monotonic()
+        piped = pipeline.run(urls)
+        elapsed = time.monotonic() - start
+        print(f"pipeline: {len(urls) / elapsed:.2f} sites/sec")
+        print(f"pipeline stats: {pipeline.stats()}")
+        same = sum(set((a or '').split(', ')) == set((b or '').split(', ')) for a, b in zip(threaded, piped))
+        print(f"identical results on {same}/{len(urls)} sites")
+        pipeline.close()
+    finally:
+        for server in servers:
+            server.stop()
+
+
+if __name__ == '__main__':
+    main()
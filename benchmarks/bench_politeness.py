@@ -0,0 +1,113 @@
+"""
+Politeness scheduler against a local server that rate-limits.
+
+    python -m benchmarks.bench_politeness --pages 20
+
+One local host answers 429 (with Retry-After) whenever it gets more than one
+request per --limit-window seconds; the other hosts never throttle. All pages
+are fetched concurrently through the shared HTTP client. The run fails with
+an AssertionError unless every page ends up 200 (no 429 reaches the caller),
+no request reaches the throttled host within Retry-After of a 429 (other
+than one already in flight), the throttled host served fewer 429s than it
+has pages, and the unthrottled hosts finished before it.
+"""
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.local_server import LocalServer
+from http_client import HttpClient
+from politeness import HostScheduler
+
+PAGE = "<html><body><p>Contact: info@site.org</p></body></html>"
+# A request sent by the other slot just before the 429 came back may still
+# arrive after it
+IN_FLIGHT_SLACK = 0.1
+
+
+def rate_limited_route(window, retry_after):
+    lock = threading.Lock()
+    state = {'last': 0.0, 'throttled': 0, 'arrivals': []}
+
+    def route(handler):
+        with lock:
+            now = time.monotonic()
+            allowed = now - state['last'] >= window
+            if allowed:
+                state['last'] = now
+            else:
+                state['throttled'] += 1
+            state['arrivals'].append((now, 200 if allowed else 429))
+        if allowed:
+            handler.send_html(PAGE)
+        else:
+            handler.send_html("Too many requests", status=429, headers={'Retry-After': str(retry_after)})
+
+    return route, state
+
+
+def early_retries(arrivals, retry_after):
+    """Requests that arrived after a 429 but before its Retry-After had passed."""
+    early = []
+    for throttled_at, status in arrivals:
+        if status != 429:
+            continue
+        early.extend(arrived for arrived, _ in arrivals
+                     if throttled_at + IN_FLIGHT_SLACK < arrived < throttled_at + retry_after)
+    return early
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--free-hosts', type=int, default=3)
+    parser.add_argument('--limit-window', type=float, default=0.5)
+    parser.add_argument('--retry-after', type=int, default=1)
+    parser.add_argument('--min-interval', type=float, default=0.05)
+    args = parser.parse_args()
+
+    route, throttle_state = rate_limited_route(args.limit_window, args.retry_after)
+    limited = LocalServer({'*': route}).start()
+    free = [LocalServer({'*': PAGE}).start() for _ in range(args.free_hosts)]
+    scheduler = HostScheduler(concurrency=2, min_interval=args.min_interval)
+    client = HttpClient(scheduler=scheduler, throttle_retries=5)
+
+    finished = {}
+
+    def fetch(job):
+        server, i = job
+        response = client.get(server.url(f'/page{i}'))
+        finished[server.netloc] = time.monotonic()
+        return server.netloc, response.status_code
+
+    jobs = [(server, i) for i in range(args.pages) for server in [limited] + free]
+    try:
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            statuses = list(executor.map(fetch, jobs))
+        elapsed = time.monotonic() - start
+        ok = sum(1 for _, status in statuses if status == 200)
+        print(f"{ok}/{len(statuses)} pages fetched with HTTP 200 in {elapsed:.2f}s")
+        print(f"rate-limited host: done after {finished[limited.netloc] - start:.2f}s, "
+              f"{throttle_state['throttled']} x 429 served")
+        for server in free:
+            print(f"free host {server.netloc}: done after {finished[server.netloc] - start:.2f}s")
+        print(f"scheduler: {scheduler.stats()}")
+    finally:
+        for server in [limited] + free:
+            server.stop()
+
+    not_ok = [(netloc, status) for netloc, status in statuses if status != 200]
+    assert not not_ok, f"{len(not_ok)} pages did not end up 200: {not_ok[:5]}"
+    early = early_retries(throttle_state['arrivals'], args.retry_after)
+    assert not early, f"{len(early)} requests reached the throttled host before Retry-After had passed"
+    assert throttle_state['throttled'] < args.pages, \
+        f"{throttle_state['throttled']} x 429 for {args.pages} pages, backoff did not slow the host down"
+    assert all(finished[server.netloc] < finished[limited.netloc] for server in free), \
+        "an unthrottled host was held up by the throttled one"
+    print("no 429 reached the caller and Retry-After was honored")
+
+
+if __name__ == '__main__':
+    main()
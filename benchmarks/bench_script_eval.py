@@ -0,0 +1,72 @@
+"""
+How many browser renders the script evaluation tier saves.
+
+    python -m benchmarks.bench_script_eval [--sites 30] [--simulated-render 1]
+
+The farm (site_farm.py) holds static contact sites and sites whose address
+is hidden: base64 via atob, Cloudflare email protection, ROT13, a reversed
+string, and an address only an API call fills in. Every site runs through
+app.extract_emails_with_fallback with email_extraction.SCRIPT_EVAL off and
+on. Renders use simulated_find_emails_js (--simulated-render seconds each)
+and are counted; each run reports wall time, renders, recall and the share
+of would-be fallback sites the tier resolved (FrontierStats.eval_resolved_rate).
+"""
+import argparse
+import os
+import threading
+import time
+
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+
+import app  # noqa: E402
+import email_extraction  # noqa: E402
+import frontier  # noqa: E402
+from benchmarks.bench_fallback_race import simulated_find_emails_js  # noqa: E402
+from benchmarks.site_farm import HIDDEN_KINDS, SiteFarm, score  # noqa: E402
+from crawl_engine import run_crawl  # noqa: E402
+
+KINDS = ('static',) + HIDDEN_KINDS
+
+
+def counting(find_emails_js):
+    lock = threading.Lock()
+    renders = []
+
+    def find(base_url, *args, **kwargs):
+        with lock:
+            renders.append(base_url)
+        return find_emails_js(base_url, *args, **kwargs)
+    return find, renders
+
+
+def run(label, farm, enabled, render_seconds, workers):
+    email_extraction.SCRIPT_EVAL = enabled
+    frontier._frontier_stats = frontier.FrontierStats()
+    app.find_emails_js, renders = counting(simulated_find_emails_js(render_seconds))
+    start = time.monotonic()
+    results, _ = run_crawl(farm.urls, app.extract_emails_with_fallback, concurrency=workers,
+                           per_host_limit=app.PER_HOST_LIMIT)
+    elapsed = time.monotonic() - start
+    scores = score(farm.sites, results)
+    hits, expected, extra = scores['all']
+    stats = frontier.get_frontier_stats().as_dict()
+    print(f"{label}: {elapsed:.2f}s, {len(renders)} renders for {len(farm.sites)} sites, recall {hits}/{expected}, "
+          f"{extra} unexpected emails, resolved by the tier {stats['resolved_by_eval']} "
+          f"({stats['eval_resolved_rate']:.0%} of the sites the plain scan missed)")
+    print('  ' + ', '.join(f"{kind} {scores[kind][0]}/{scores[kind][1]}" for kind in KINDS if kind in scores))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=30)
+    parser.add_argument('--simulated-render', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, default=8)
+    args = parser.parse_args()
+
+    with SiteFarm(args.sites, kinds=KINDS) as farm:
+        run('without tier', farm, False, args.simulated_render, args.workers)
+        run('with tier', farm, True, args.simulated_render, args.workers)
+
+
+if __name__ == '__main__':
+    main()
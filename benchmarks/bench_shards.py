@@ -0,0 +1,155 @@
+"""
+Sharded crawling (shard_queue.py) with local worker processes.
+
+    python -m benchmarks.bench_shards [--sites 48] [--workers 1,2,4] [--threads 16]
+
+Crawls a SiteFarm of static and slow sites through app.extract_emails_with_fallback,
+first in this process on the crawl engine with --threads threads, then
+through run_sharded with each number of worker processes in --workers,
+splitting the same threads between them. A last run kills one worker with
+SIGKILL once a few results are in: its leases expire (the benchmark uses
+SHARD_LEASE_SECONDS=3), other workers take its tasks and the coordinator
+starts a replacement. Renders are simulated (simulated_find_emails_js).
+
+The run fails with an AssertionError unless every sharded run delivered
+exactly one result per site, in the farm's order and with every planted
+email found, and left every task done with one stored result; and unless
+every task the killed worker held was leased again and finished by another
+worker.
+"""
+import argparse
+import os
+import signal
+import tempfile
+import threading
+import time
+from collections import Counter
+
+_scratch = tempfile.mkdtemp(prefix='bench_shards-')
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+os.environ.setdefault('TIMING_LOG', '')
+os.environ.setdefault('SHARD_LEASE_SECONDS', '3')
+os.environ.setdefault('SHARD_HEARTBEAT_SECONDS', '1')
+
+import app  # noqa: E402
+from benchmarks.bench_fallback_race import simulated_find_emails_js  # noqa: E402
+from benchmarks.site_farm import SiteFarm, score  # noqa: E402
+from crawl_engine import run_crawl  # noqa: E402
+from shard_queue import ShardQueue, run_sharded  # noqa: E402
+
+KINDS = ('static', 'static', 'static', 'slow')
+TARGET = 'benchmarks.bench_shards:crawl_farm_site'
+
+
+def crawl_farm_site(url):
+    """The per-URL function of the workers: the app's crawl with simulated renders."""
+    app.find_emails_js = simulated_find_emails_js(1.0)
+    return app.process_single_url(url)
+
+
+def report(label, farm, results, elapsed):
+    hits, expected, extra = score(farm.sites, results)['all']
+    print(f"{label}: {len(results)} sites in {elapsed:.2f}s ({len(results) / elapsed:.2f} sites/s), "
+          f"recall {hits}/{expected}, {extra} unexpected emails")
+
+
+def kill_one_worker(queue_path, after_results, results_seen, killed):
+    """Once `after_results` results are in, SIGKILL a worker that holds leases."""
+    while len(results_seen) < after_results:
+        time.sleep(0.05)
+    queue = ShardQueue(queue_path)
+    try:
+        while True:
+            workers = queue.workers()
+            leases = {worker_id: tasks for worker_id, tasks in queue.leases().items() if worker_id in workers}
+            if leases:
+                break
+            time.sleep(0.05)
+        worker_id, tasks = sorted(leases.items())[0]
+        os.kill(workers[worker_id]['pid'], signal.SIGKILL)
+        killed.append((worker_id, [position for _, position in tasks]))
+    finally:
+        queue.close()
+
+
+def check_job(farm, job_id, results, results_seen, queue_path, killed):
+    hits, expected, _ = score(farm.sites, results)['all']
+    assert hits == expected, f"{job_id}: recall {hits}/{expected}"
+    assert None not in results, f"{job_id}: {results.count(None)} sites without a result"
+    repeated = [position for position, count in Counter(results_seen).items() if count != 1]
+    assert len(results_seen) == len(farm.sites) and not repeated, \
+        f"{job_id}: {len(results_seen)} results for {len(farm.sites)} sites, repeated {repeated}"
+    queue = ShardQueue(queue_path)
+    try:
+        tasks = {position: (status, attempts, stored, worker)
+                 for position, status, attempts, stored, worker in queue.tasks(job_id)}
+        queue.forget(job_id)
+    finally:
+        queue.close()
+    unfinished = [position for position, (status, _, stored, _) in tasks.items() if status != 'done' or stored != 1]
+    assert len(tasks) == len(farm.sites) and not unfinished, f"{job_id}: tasks not finished exactly once: {unfinished}"
+    for worker_id, positions in killed:
+        assert positions, f"{job_id}: the killed worker held no leases"
+        for position in positions:
+            _, attempts, _, finished_by = tasks[position]
+            assert attempts >= 2 and finished_by != worker_id, \
+                f"{job_id}: task {position} of the killed worker was not leased again ({attempts} attempts, " \
+                f"finished by {finished_by})"
+
+
+def run_sharded_once(farm, workers, threads, queue_path, kill_after=None):
+    results_seen = []
+    killed = []
+    killer = None
+    if kill_after is not None:
+        killer = threading.Thread(target=kill_one_worker, args=(queue_path, kill_after, results_seen, killed),
+                                  daemon=True)
+        killer.start()
+    job_id = f"bench-{workers}-{'kill' if kill_after is not None else 'plain'}"
+    start = time.monotonic()
+    results = run_sharded(farm.urls, TARGET, workers=workers, concurrency=max(1, threads // workers),
+                          on_result=lambda position, url, result: results_seen.append(position),
+                          queue_path=queue_path, job_id=job_id, forget=False)
+    elapsed = time.monotonic() - start
+    if killer is not None:
+        killer.join(timeout=1)
+    check_job(farm, job_id, results, results_seen, queue_path, killed)
+    return results, elapsed, [worker_id for worker_id, _ in killed]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sites', type=int, default=48)
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--slow-seconds', type=float, default=2.0)
+    args = parser.parse_args()
+    worker_counts = [int(count) for count in args.workers.split(',') if count.strip()]
+
+    summary = []
+    with SiteFarm(args.sites, kinds=KINDS, slow_seconds=args.slow_seconds) as farm:
+        app.find_emails_js = simulated_find_emails_js(1.0)
+        start = time.monotonic()
+        results, _ = run_crawl(farm.urls, app.process_single_url, concurrency=args.threads,
+                               per_host_limit=app.PER_HOST_LIMIT)
+        summary.append(('in process', farm, results, time.monotonic() - start))
+
+        for workers in worker_counts:
+            queue_path = os.path.join(_scratch, f"shards-{workers}.sqlite3")
+            results, elapsed, _ = run_sharded_once(farm, workers, args.threads, queue_path)
+            summary.append((f"{workers} worker processes", farm, results, elapsed))
+
+        workers = max(2, max(worker_counts))
+        queue_path = os.path.join(_scratch, 'shards-kill.sqlite3')
+        results, elapsed, killed = run_sharded_once(farm, workers, args.threads, queue_path,
+                                                    kill_after=args.sites // 4)
+        summary.append((f"{workers} worker processes, killed {', '.join(killed) or 'none'}", farm, results, elapsed))
+
+    print()
+    for label, farm, results, elapsed in summary:
+        report(label, farm, results, elapsed)
+    print("every site finished exactly once, and the killed worker's tasks were leased again")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Rows/sec and peak RSS for sheet ingestion and output, without any network.
+
+    python -m benchmarks.bench_sheet_io --rows 100000
+
+Generates an input file, then runs each mode in its own subprocess (so peak
+RSS is measured per mode) with a crawl function that returns instantly:
+
+  stream  sheet_io reader -> crawl_engine generator -> incremental writer
+  pandas  the old path: read_excel, 150-row chunk files, repeated pd.concat
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from sheet_io import SheetReader, SheetWriter, stream_sheet
+
+
+def fake_extract(url):
+    return f"info@{url}" if url else ""
+
+
+def generate(path, rows):
+    with SheetWriter(path, ['Company', 'Website', 'City']) as writer:
+        for i in range(rows):
+            writer.append((f"Company {i}", f"site{i}.example.org", "Springfield"))
+
+
+def run_stream(input_path, output_path):
+    from crawl_engine import run_crawl
+    with SheetReader(input_path) as reader:
+        url_index = reader.header.index('Website')
+        with SheetWriter(output_path, reader.header + ['Emails']) as writer:
+            return stream_sheet(reader, writer, url_index,
+                                lambda urls, on_result: run_crawl(urls, fake_extract, concurrency=20,
+                                                                  on_result=on_result, collect=False))
+
+
+def run_pandas(input_path, output_path, chunk_size=150):
+    import pandas as pd
+    read = pd.read_csv if input_path.endswith('.csv') else pd.read_excel
+    df = read(input_path)
+    folder = tempfile.mkdtemp()
+    split_files = []
+    for i, chunk in enumerate(range(0, len(df), chunk_size)):
+        split_file = os.path.join(folder, f"part_{i + 1}.xlsx")
+        df.iloc[chunk:chunk + chunk_size].to_excel(split_file, index=False)
+        split_files.append(split_file)
+    combined_df = pd.DataFrame()
+    for split_file in split_files:
+        df_split = pd.read_excel(split_file)
+        df_split['Emails'] = [fake_extract(url) for url in df_split['Website']]
+        combined_df = pd.concat([combined_df, df_split], ignore_index=True)
+        os.remove(split_file)
+    combined_df.to_excel(output_path, index=False)
+    return len(combined_df)
+
+
+def child(mode, input_path):
+    output_path = input_path.replace('input', f'output_{mode}')
+    start = time.monotonic()
+    rows = run_stream(input_path, output_path) if mode == 'stream' else run_pandas(input_path, output_path)
+    elapsed = time.monotonic() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode} ({os.path.splitext(input_path)[1]}): {rows} rows in {elapsed:.1f}s, "
+          f"{rows / elapsed:.0f} rows/sec, peak RSS {peak_mb:.0f} MB")
+    os.remove(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--format', default='xlsx', choices=['xlsx', 'csv'])
+    parser.add_argument('--modes', default='stream,pandas')
+    parser.add_argument('--child', nargs=2, metavar=('MODE', 'INPUT'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(*args.child)
+        return
+
+    folder = tempfile.mkdtemp()
+    input_path = os.path.join(folder, f"input.{args.format}")
+    generate(input_path, args.rows)
+    try:
+        for mode in args.modes.split(','):
+            subprocess.run([sys.executable, '-m', 'benchmarks.bench_sheet_io', '--child', mode, input_path], check=True)
+    finally:
+        os.remove(input_path)
+
+
+if __name__ == '__main__':
+    main()
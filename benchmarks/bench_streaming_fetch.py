@@ -0,0 +1,178 @@
+"""
+Streamed page fetches with a byte budget, content-type filtering and a site deadline.
+
+    python -m benchmarks.bench_streaming_fetch [--oversize-mb 50] [--drip-seconds 20] [--deadline 5]
+
+The local site's homepage links to four "contact" pages: a --oversize-mb
+HTML page, a --oversize-mb PDF served without a file extension, the real
+contact page, and a page that drips a few bytes every 0.2s for
+--drip-seconds. "before" fetches every page whole with a per-request
+timeout, as the crawler did before; "after" uses HttpClient.get_page with
+MAX_PAGE_BYTES and a --deadline second site deadline. The run fails with an
+AssertionError unless both find the email and "after" held at most
+MAX_PAGE_BYTES of any page, read no more than MAX_PAGE_BYTES of the oversized
+page and none of the PDF (give or take what the socket buffers take in), and
+finished within the deadline.
+"""
+import argparse
+import threading
+import time
+
+import frontier
+from benchmarks.local_server import LocalServer
+from frontier import crawl_site
+from http_client import MAX_PAGE_BYTES, HttpClient
+from page_parser import parse_page
+from politeness import HostScheduler
+
+EMAIL = 'desk@streaming-fetch.org'
+# What the kernel's socket buffers take in on both ends before a closed
+# connection stops the server, on top of what the client read
+SOCKET_BUFFER_SLACK = 16 * 2 ** 20
+# Time past the deadline for the request in flight to notice it
+DEADLINE_SLACK = 2.0
+CHUNK = b'<p>' + b'Lorem ipsum dolor sit amet. ' * 2340 + b'</p>\n'
+
+
+class Counters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bytes_sent = 0
+        self.sent_by_path = {}
+        self.largest_body = 0
+
+    def sent(self, count, path):
+        with self.lock:
+            self.bytes_sent += count
+            self.sent_by_path[path] = self.sent_by_path.get(path, 0) + count
+
+    def held(self, count):
+        with self.lock:
+            self.largest_body = max(self.largest_body, count)
+
+
+def trap_site(oversize_bytes, drip_seconds, counters):
+    def stream(handler, content_type, total, head=b''):
+        handler.send_response(200)
+        handler.send_header('Content-Type', content_type)
+        handler.send_header('Content-Length', str(total))
+        handler.end_headers()
+        written = 0
+        try:
+            handler.wfile.write(head)
+            written += len(head)
+            while written < total:
+                data = CHUNK[:total - written]
+                handler.wfile.write(data)
+                written += len(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        counters.sent(written, handler.path)
+
+    def oversized(handler):
+        stream(handler, 'text/html; charset=utf-8', oversize_bytes, b'<html><body>')
+
+    def brochure(handler):
+        stream(handler, 'application/pdf', oversize_bytes, b'%PDF-1.4\n')
+
+    def slow_drip(handler):
+        # No Content-Length: the body ends when the connection closes
+        handler.close_connection = True
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/html; charset=utf-8')
+        handler.send_header('Connection', 'close')
+        handler.end_headers()
+        written = 0
+        try:
+            ends = time.monotonic() + drip_seconds
+            while time.monotonic() < ends:
+                handler.wfile.write(b'<span>.</span>')
+                handler.wfile.flush()
+                written += 14
+                time.sleep(0.2)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        counters.sent(written, handler.path)
+
+    return {
+        '/': ('<html><body><a href="/contact/all">Contact directory</a><a href="/contact/brochure">Contact brochure</a>'
+              '<a href="/contact">Contact</a><a href="/contact/form">Contact form</a></body></html>'),
+        '/contact/all': oversized,
+        '/contact/brochure': brochure,
+        '/contact': f'<html><body><a href="mailto:{EMAIL}">{EMAIL}</a></body></html>',
+        '/contact/form': slow_drip,
+    }
+
+
+def run(label, server, counters, fetch_page, deadline_seconds):
+    counters.bytes_sent = 0
+    counters.sent_by_path = {}
+    counters.largest_body = 0
+    frontier.SITE_DEADLINE = deadline_seconds
+    start = time.monotonic()
+    emails, pages = crawl_site(server.url('/'), fetch_page, stop_early=False)
+    elapsed = time.monotonic() - start
+    # Give the server threads a moment to notice closed connections
+    time.sleep(0.5)
+    print(f"{label}: {elapsed:.2f}s, {pages} pages, {counters.bytes_sent / 2 ** 20:.1f} MB sent, "
+          f"largest body held {counters.largest_body / 2 ** 20:.2f} MB, emails={sorted(emails)}")
+    assert EMAIL in emails, f"{label}: {EMAIL} not found"
+    return elapsed, dict(counters.sent_by_path), counters.largest_body
+
+
+def check_streamed(elapsed, sent_by_path, largest_body, deadline_seconds):
+    assert largest_body <= MAX_PAGE_BYTES, f"held {largest_body} bytes of a page, MAX_PAGE_BYTES is {MAX_PAGE_BYTES}"
+    oversized = sent_by_path.get('/contact/all', 0)
+    assert oversized <= MAX_PAGE_BYTES + SOCKET_BUFFER_SLACK, \
+        f"downloaded {oversized} bytes of the oversized page, MAX_PAGE_BYTES is {MAX_PAGE_BYTES}"
+    # Skipped on its Content-Type, before any of the body is read
+    brochure = sent_by_path.get('/contact/brochure', 0)
+    assert brochure <= SOCKET_BUFFER_SLACK, f"downloaded {brochure} bytes of the PDF"
+    assert elapsed <= deadline_seconds + DEADLINE_SLACK, \
+        f"took {elapsed:.2f}s with a {deadline_seconds}s site deadline"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--oversize-mb', type=float, default=50)
+    parser.add_argument('--drip-seconds', type=float, default=20)
+    parser.add_argument('--deadline', type=float, default=5)
+    args = parser.parse_args()
+
+    counters = Counters()
+    server = LocalServer(trap_site(int(args.oversize_mb * 2 ** 20), args.drip_seconds, counters)).start()
+    client = HttpClient(scheduler=HostScheduler(concurrency=4, min_interval=0))
+
+    def fetch_whole(url, deadline=None):
+        try:
+            response = client.get(url, timeout=10)
+            response.raise_for_status()
+            counters.held(len(response.content))
+            return parse_page(response.text)
+        except Exception as e:
+            print(f"Error processing {url}: {e}")
+            return None
+
+    def fetch_streamed(url, deadline=None):
+        try:
+            response = client.get_page(url, timeout=10, deadline=deadline)
+            response.raise_for_status()
+            counters.held(len(response.content))
+            return parse_page(response.text)
+        except Exception as e:
+            print(f"Error processing {url}: {e}")
+            return None
+
+    try:
+        run('before', server, counters, fetch_whole, 0)
+        elapsed, sent_by_path, largest_body = run('after', server, counters, fetch_streamed, args.deadline)
+    finally:
+        server.stop()
+    print(f"MAX_PAGE_BYTES = {MAX_PAGE_BYTES}")
+    print(f"after: bytes sent per page {sent_by_path}")
+    check_streamed(elapsed, sent_by_path, largest_body, args.deadline)
+    print("after: byte budget, content-type filter and deadline held")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Subpage link selection (app.find_subpage_urls) on large pages with many links.
+
+    python -m benchmarks.bench_subpage_links [--pages 20] [--paragraphs 400] [--links 2000]
+
+Pages come from corpus.synthetic_page (English, <html lang="en">), scaled up
+to --paragraphs paragraphs and --links navigation links, and are parsed once
+up front; only link selection is timed. "before" guessed the language with
+eleven substring checks over the lowercased page text and then tried each of
+the language's keywords against the link text and the path of every link;
+"after" takes the declared language, searches its compiled keyword pattern
+and only resolves links that can match. The
+selected links are compared with those the page's declared language (English)
+calls for.
+"""
+import argparse
+import random
+import time
+from urllib.parse import urljoin, urlparse
+
+from app import find_subpage_urls
+from benchmarks.corpus import synthetic_page
+from frontier import SUBPAGE_KEYWORDS
+from page_parser import parse_page
+
+BASE_URL = 'http://company.org/'
+
+
+def find_subpage_urls_before(page, base_url, language=None):
+    """find_subpage_urls as it was, or with `language` forced."""
+    subpage_urls = set()
+    base_netloc = urlparse(base_url).netloc
+    detected_language = "en"
+    text = page.text
+    for code in ("fr", "de", "it", "ur", "ar", "es", "pt", "ru", "zh", "ja", "ko"):
+        if code in text.lower():
+            detected_language = code
+            break
+    keywords = SUBPAGE_KEYWORDS[language or detected_language]
+    for href, link_text in page.links:
+        link_text = link_text.strip().lower()
+        abs_url = urljoin(base_url, href)
+        parsed_url = urlparse(abs_url)
+        if any(keyword in link_text for keyword in keywords) or \
+           any(keyword in parsed_url.path.lower() for keyword in keywords):
+            if parsed_url.netloc == base_netloc and parsed_url.scheme in ['http', 'https']:
+                subpage_urls.add(abs_url)
+    return subpage_urls
+
+
+def run(label, pages, select, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        selected = [select(page, BASE_URL) for page in pages]
+    elapsed = (time.perf_counter() - start) / rounds / len(pages)
+    print(f"{label}: {elapsed * 1000:.2f} ms/page, {sum(len(urls) for urls in selected)} links selected")
+    return selected
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--pages', type=int, default=20)
+    parser.add_argument('--paragraphs', type=int, default=400)
+    parser.add_argument('--links', type=int, default=2000)
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    pages = [parse_page(synthetic_page(rng, i, paragraphs=args.paragraphs, links=args.links)) for i in range(args.pages)]
+    print(f"{args.pages} pages, {sum(len(page.text) for page in pages) // args.pages} chars of text and "
+          f"{sum(len(page.links) for page in pages) // args.pages} links each, declared language {pages[0].lang}")
+
+    expected = [find_subpage_urls_before(page, BASE_URL, language='en') for page in pages]
+    before = run('before', pages, find_subpage_urls_before, args.rounds)
+    after = run('after', pages, find_subpage_urls, args.rounds)
+    print(f"matches the declared language's keywords: before {before == expected}, after {after == expected}")
+
+
+if __name__ == '__main__':
+    main()
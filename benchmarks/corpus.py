@@ -0,0 +1,48 @@
+"""
+Synthetic HTML corpus for the parsing and extraction benchmarks.
+
+Pages mix the things the crawler meets in practice: navigation with
+contact/about links, paragraphs of filler text, mailto links, emails in plain
+text, inline scripts with concatenated or entity-encoded addresses, and CSS.
+Passing a directory of saved .html pages uses real pages instead.
+"""
+import os
+import random
+
+WORDS = ("lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+         "et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris nisi").split()
+NAV = ['home', 'services', 'about', 'contact', 'team', 'careers', 'blog', 'news', 'support', 'pricing']
+
+
+def synthetic_page(rng, index, paragraphs=40, links=60):
+    domain = f"company{index}.org"
+    parts = ['<!DOCTYPE html><html lang="en"><head><title>Company</title>',
+             '<style>body { font-family: sans-serif; } .nav a { color: #333; }</style></head><body>',
+             '<div class="nav">']
+    for i in range(links):
+        name = NAV[i % len(NAV)]
+        parts.append(f'<a href="/{name}/{i}">{name.title()} {i}</a> ')
+    parts.append('</div><main>')
+    for i in range(paragraphs):
+        text = ' '.join(rng.choice(WORDS) for _ in range(60))
+        parts.append(f'<p>{text}</p>')
+        if i % 10 == 3:
+            parts.append(f'<p>Questions? Write to info{i}@{domain} or call 555-123-4567.</p>')
+    parts.append(f'<a href="mailto:sales@{domain}?subject=Hello">Email sales</a>')
+    parts.append(f'<script>var a = "press" + "@" + "{domain}"; var b = "&#104;r@{domain}";</script>')
+    parts.append('<script>window.dataLayer = window.dataLayer || []; function gtag(){dataLayer.push(arguments);}</script>')
+    parts.append('</main></body></html>')
+    return ''.join(parts)
+
+
+def load_corpus(directory=None, pages=200, seed=7):
+    """Return a list of HTML strings: saved pages from `directory`, or synthetic ones."""
+    if directory:
+        corpus = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(('.html', '.htm')):
+                with open(os.path.join(directory, name), encoding='utf-8', errors='replace') as f:
+                    corpus.append(f.read())
+        return corpus
+    rng = random.Random(seed)
+    return [synthetic_page(rng, i) for i in range(pages)]
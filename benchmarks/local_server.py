@@ -0,0 +1,124 @@
+"""
+Tiny local HTTP server for offline benchmarks.
+
+Each LocalServer listens on its own port, so several of them behave like
+separate hosts to the crawler. Routes map a path to either an HTML string or a
+callable handler(request) that writes its own response. The server speaks
+HTTP/1.1 with keep-alive and counts the TCP connections it accepts, which makes
+connection reuse visible from the outside.
+"""
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        super().setup()
+        self.server.owner._count('connections_opened')
+
+    def handle(self):
+        # Clients hang up mid-response (byte budgets, deadlines); that is not a server error
+        try:
+            super().handle()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def do_GET(self):
+        owner = self.server.owner
+        owner._count('requests_served')
+        path = self.path.split('?', 1)[0].split('#', 1)[0]
+        route = owner.routes.get(path)
+        if route is None:
+            route = owner.routes.get('*')
+        if route is None:
+            self.send_html("<html><body>Not found</body></html>", status=404)
+        elif callable(route):
+            route(self)
+        else:
+            self.send_html(route)
+
+    def send_html(self, body, status=200, headers=None):
+        data = body.encode('utf-8') if isinstance(body, str) else body
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class LocalServer:
+    """A threaded HTTP server on 127.0.0.1 serving a fixed set of routes."""
+
+    def __init__(self, routes=None, host='127.0.0.1', port=0):
+        self.routes = dict(routes or {})
+        self._httpd = ThreadingHTTPServer((host, port), _Handler)
+        self._httpd.daemon_threads = True
+        self._httpd.owner = self
+        self._thread = None
+        self._lock = threading.Lock()
+        self.connections_opened = 0
+        self.requests_served = 0
+
+    def _count(self, name):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    @property
+    def netloc(self):
+        host, port = self._httpd.server_address[:2]
+        return f"{host}:{port}"
+
+    def url(self, path='/'):
+        return f"http://{self.netloc}{path}"
+
+    def reset_counters(self):
+        with self._lock:
+            self.connections_opened = 0
+            self.requests_served = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def contact_site(email, extra_pages=0):
+    """
+    Routes for a small static site with an email on its contact page.
+    `extra_pages` adds keyword-matching /about/... pages linked from the homepage.
+    """
+    links = ''.join(f'<a href="/about/page{i}">Page {i}</a>' for i in range(extra_pages))
+    routes = {
+        '/': f'<html><body><h1>Welcome</h1><a href="/contact">Contact</a><a href="/about">About</a>{links}</body></html>',
+        '/contact': f'<html><body><p>Write to <a href="mailto:{email}">{email}</a></p></body></html>',
+        '/about': '<html><body><p>We have been around for years.</p><a href="/contact">Contact us</a></body></html>',
+    }
+    for i in range(extra_pages):
+        routes[f'/about/page{i}'] = f'<html><body><p>Filler page {i}.</p></body></html>'
+    return routes
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
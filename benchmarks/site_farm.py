@@ -0,0 +1,213 @@
+"""
+A farm of synthetic local websites for end-to-end benchmarks.
+
+Each site is its own LocalServer, so the crawler treats every one as a
+separate host. Sites come in the kinds the crawler meets in practice:
+
+  static        contact page with a mailto link
+  concatenated  the address is only built by a script: 'a' + '@' + 'b.com'
+  js_injected   a script fills the address in from base64 at runtime
+  cfemail       Cloudflare email protection (data-cfemail)
+  rot13         a script ROT13-decodes the address
+  reversed      a script reverses the address with split/reverse/join
+  fetched       the address is loaded from an API at runtime; only a browser finds it
+  redirect      the homepage is reached through a chain of redirects
+  slow          every response takes slow_seconds
+  large         a homepage of several MB with the contact link at the top
+  failing       every page is a 500
+  dead          nothing listens on the port
+
+Every site also serves /rendered, the HTML a browser would see once the
+scripts ran; benchmarks without Chrome read it through
+simulated_find_emails_js in bench_fallback_race. FarmSite.expected is the
+set of emails a perfect crawler finds (empty for failing and dead sites).
+"""
+import base64
+import codecs
+import time
+
+from benchmarks.local_server import LocalServer, contact_site
+from email_extraction import EMAIL_PATTERN
+
+KINDS = ('static', 'concatenated', 'js_injected', 'redirect', 'slow', 'large', 'failing', 'dead')
+# Sites whose address is only in the HTML in some encoded form, or not at all
+HIDDEN_KINDS = ('js_injected', 'cfemail', 'rot13', 'reversed', 'fetched')
+ROT13_FUNCTION = ('function decode(s) { return s.replace(/[a-zA-Z]/g, function (c) { return String.fromCharCode('
+                  '(c <= "Z" ? 90 : 122) >= (c = c.charCodeAt(0) + 13) ? c : c - 26); }); }')
+FILLER = '<p>' + 'Our team has served customers across the region for decades. ' * 30 + '</p>\n'
+
+
+def rendered(email):
+    return f'<html><body><a href="mailto:{email}">{email}</a></body></html>'
+
+
+def homepage(body=''):
+    return (f'<html><body><h1>Welcome</h1><a href="/contact">Contact</a><a href="/about">About</a>{body}'
+            '<p>We have been around for years.</p></body></html>')
+
+
+def concatenated_site(email):
+    local, domain = email.split('@')
+    script = f"<script>var contact = '{local}' + '@' + '{domain}';</script>"
+    return {'/': homepage(), '/contact': f'<html><body><p>Contact us</p>{script}</body></html>',
+            '/rendered': rendered(email)}
+
+
+def js_injected_site(email):
+    encoded = base64.b64encode(email.encode('ascii')).decode('ascii')
+    script = f'<script>document.getElementById("mail").textContent = atob("{encoded}");</script>'
+    page = homepage(f'<p id="mail"></p>{script}')
+    return {'/': page, '/contact': page, '/about': page, '/rendered': rendered(email)}
+
+
+def script_site(email, script):
+    page = homepage(f'<p id="mail"></p><script>{script}</script>')
+    return {'/': page, '/contact': page, '/about': page, '/rendered': rendered(email)}
+
+
+def cfemail_site(email, key=0x5a):
+    encoded = f'{key:02x}' + ''.join(f'{ord(char) ^ key:02x}' for char in email)
+    link = (f'<a href="/cdn-cgi/l/email-protection" class="__cf_email__" data-cfemail="{encoded}">'
+            '[email&#160;protected]</a>')
+    return {'/': homepage(), '/contact': f'<html><body><p>Write to {link}</p></body></html>',
+            '/about': homepage(), '/rendered': rendered(email)}
+
+
+def redirect_site(email, hops=3):
+    def redirect_to(location):
+        def handler(request):
+            request.send_response(301)
+            request.send_header('Location', location)
+            request.send_header('Content-Length', '0')
+            request.end_headers()
+        return handler
+
+    routes = contact_site(email)
+    routes['/home'] = routes['/']
+    routes['/'] = redirect_to('/hop1')
+    for hop in range(1, hops):
+        routes[f'/hop{hop}'] = redirect_to(f'/hop{hop + 1}')
+    routes[f'/hop{hops}'] = redirect_to('/home')
+    routes['/rendered'] = rendered(email)
+    return routes
+
+
+def slow_site(email, seconds):
+    def delayed(body):
+        def handler(request):
+            time.sleep(seconds)
+            request.send_html(body)
+        return handler
+
+    routes = contact_site(email)
+    routes['/rendered'] = rendered(email)
+    return {path: delayed(body) for path, body in routes.items()}
+
+
+def large_site(email, size_bytes):
+    page = homepage().replace('</body>', FILLER * (size_bytes // len(FILLER) + 1) + '</body>')
+    routes = contact_site(email)
+    routes['/'] = page
+    routes['/rendered'] = rendered(email)
+    return routes
+
+
+def failing_site():
+    def error(request):
+        request.send_html('<html><body>Internal Server Error</body></html>', status=500)
+    return {'*': error}
+
+
+class FarmSite:
+    def __init__(self, kind, server, expected):
+        self.kind = kind
+        self.server = server
+        self.expected = expected
+        self.url = server.url('/')
+
+
+class SiteFarm:
+    """
+    `sites` local sites cycling through `kinds`. Use as a context manager, or
+    call start() and stop().
+    """
+
+    def __init__(self, sites=32, kinds=KINDS, slow_seconds=2.0, large_bytes=3 * 2 ** 20):
+        self.sites = []
+        self._specs = []
+        for i in range(sites):
+            kind = kinds[i % len(kinds)]
+            email = f"contact{i}@{kind.replace('_', '-')}{i}.org"
+            if kind == 'static':
+                routes = dict(contact_site(email, extra_pages=2), **{'/rendered': rendered(email)})
+            elif kind == 'concatenated':
+                routes = concatenated_site(email)
+            elif kind == 'js_injected':
+                routes = js_injected_site(email)
+            elif kind == 'cfemail':
+                routes = cfemail_site(email)
+            elif kind == 'rot13':
+                script = f'{ROT13_FUNCTION} document.getElementById("mail").textContent = decode("{codecs.encode(email, "rot13")}");'
+                routes = script_site(email, script)
+            elif kind == 'reversed':
+                script = f'document.getElementById("mail").textContent = "{email[::-1]}".split("").reverse().join("");'
+                routes = script_site(email, script)
+            elif kind == 'fetched':
+                routes = script_site(email, 'fetch("/api/contact").then(r => r.json()).then(d => { mail.textContent = d.address; });')
+            elif kind == 'redirect':
+                routes = redirect_site(email)
+            elif kind == 'slow':
+                routes = slow_site(email, slow_seconds)
+            elif kind == 'large':
+                routes = large_site(email, large_bytes)
+            elif kind in ('failing', 'dead'):
+                routes, email = failing_site(), None
+            else:
+                raise ValueError(f"Unknown site kind: {kind}")
+            self._specs.append((kind, routes, {email} if email else set()))
+
+    def start(self):
+        for kind, routes, expected in self._specs:
+            server = LocalServer(routes).start()
+            if kind == 'dead':
+                # Keep the URL but close the port, so connections are refused
+                server.stop()
+            self.sites.append(FarmSite(kind, server, expected))
+        return self
+
+    def stop(self):
+        for site in self.sites:
+            if site.kind != 'dead':
+                site.server.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def urls(self):
+        return [site.url for site in self.sites]
+
+
+def found_emails(result):
+    """The emails in a result cell ("a@b.org, c@d.org", "No email ID found", "Error: ...")."""
+    if not isinstance(result, str) or result.startswith('Error'):
+        return set()
+    return {email.lower() for email in EMAIL_PATTERN.findall(result)}
+
+
+def score(sites, results):
+    """
+    Recall per site kind and overall: {kind: (expected emails found,
+    expected emails, unexpected emails)} plus an 'all' entry.
+    """
+    scores = {}
+    for site, result in zip(sites, results):
+        found = found_emails(result)
+        for key in (site.kind, 'all'):
+            hits, expected, extra = scores.get(key, (0, 0, 0))
+            scores[key] = (hits + len(found & site.expected), expected + len(site.expected),
+                           extra + len(found - site.expected))
+    return scores
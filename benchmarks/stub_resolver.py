@@ -0,0 +1,76 @@
+"""
+Minimal local DNS server for offline benchmarks.
+
+Answers A queries over UDP: names for which `is_live(name)` is true get
+127.0.0.1 with a fixed TTL, every other name gets NXDOMAIN. Each answer can
+be delayed to mimic a recursive resolver, with a separate (usually longer)
+delay for dead names. Queries are answered on their own threads, so delays
+overlap like they would on a real resolver.
+"""
+import socketserver
+import struct
+import threading
+import time
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        data, sock = self.request
+        owner = self.server.owner
+        try:
+            name, question_end = _parse_question(data)
+        except (IndexError, struct.error):
+            return
+        qtype = struct.unpack('!H', data[question_end - 4:question_end - 2])[0]
+        live = owner.is_live(name)
+        with owner._lock:
+            owner.queries += 1
+        time.sleep(owner.live_delay if live else owner.dead_delay)
+
+        header_id = data[:2]
+        question = data[12:question_end]
+        if not live:
+            flags, answers = 0x8183, b''
+        elif qtype == 1:
+            flags = 0x8180
+            answers = struct.pack('!HHHIH', 0xC00C, 1, 1, owner.ttl, 4) + bytes([127, 0, 0, 1])
+        else:
+            flags, answers = 0x8180, b''
+        count = 1 if answers else 0
+        sock.sendto(header_id + struct.pack('!HHHHH', flags, 1, count, 0, 0) + question + answers, self.client_address)
+
+
+def _parse_question(data):
+    labels = []
+    position = 12
+    while data[position] != 0:
+        length = data[position]
+        labels.append(data[position + 1:position + 1 + length].decode('ascii', 'replace'))
+        position += 1 + length
+    return '.'.join(labels).lower(), position + 5
+
+
+class StubResolver:
+    def __init__(self, is_live, ttl=300, live_delay=0.0, dead_delay=0.0):
+        self.is_live = is_live
+        self.ttl = ttl
+        self.live_delay = live_delay
+        self.dead_delay = dead_delay
+        self.queries = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingUDPServer(('127.0.0.1', 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.owner = self
+
+    @property
+    def nameserver(self):
+        host, port = self._server.server_address
+        return f"{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
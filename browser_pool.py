@@ -0,0 +1,300 @@
+"""
+Pool of long-lived headless Chrome workers for JS rendering.
+
+Each worker keeps one browser process and reuses its tab for successive pages.
+Before it moves on to another site the tab's cookies and the previous site's
+storage (localStorage, IndexedDB, caches) are cleared, so no site sees state
+left by another one. A browser is recycled after a fixed number of pages
+(Chrome leaks memory over time) and restarted transparently if it crashes.
+Instead of a fixed sleep, pages are considered ready once the document has
+loaded and both the resource count and the DOM size have stopped changing for
+a short quiet window. The shared pool quits its browsers at interpreter exit.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from urllib.parse import urlsplit
+
+from selenium import webdriver
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from selenium.webdriver.chrome.options import Options
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from metrics import observe, timed
+
+DEFAULT_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+
+BROWSER_POOL_SIZE = int(os.environ.get('BROWSER_POOL_SIZE', 2))
+MAX_PAGES_PER_BROWSER = int(os.environ.get('MAX_PAGES_PER_BROWSER', 50))
+# How long the exit handler waits for in-flight renders before quitting their browsers anyway
+BROWSER_POOL_CLOSE_TIMEOUT = float(os.environ.get('BROWSER_POOL_CLOSE_TIMEOUT', 5))
+
+# Snapshot used by the readiness wait: load state, number of network
+# resources requested so far, and a cheap measure of DOM size.
+_READY_PROBE_JS = """
+return [
+    document.readyState,
+    performance.getEntriesByType('resource').length,
+    document.getElementsByTagName('*').length,
+    document.body ? document.body.innerHTML.length : 0
+];
+"""
+
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+
+def get_driver_path():
+    """Resolve the chromedriver binary once per process instead of once per page."""
+    global _driver_path
+    with _driver_path_lock:
+        if _driver_path is None:
+            _driver_path = ChromeDriverManager().install()
+        return _driver_path
+
+
+def wait_until_ready(driver, max_wait=10, quiet_period=0.5, poll_interval=0.1):
+    """
+    Wait for the page to settle: document loaded and no new resources or DOM
+    changes for `quiet_period` seconds. Gives up after `max_wait` seconds.
+    Returns the time spent waiting.
+    """
+    start = time.monotonic()
+    last_snapshot = None
+    stable_since = None
+    while True:
+        now = time.monotonic()
+        if now - start >= max_wait:
+            break
+        try:
+            snapshot = tuple(driver.execute_script(_READY_PROBE_JS))
+        except WebDriverException:
+            snapshot = None
+        if snapshot and snapshot[0] == 'complete':
+            if snapshot == last_snapshot:
+                if now - stable_since >= quiet_period:
+                    break
+            else:
+                stable_since = now
+            last_snapshot = snapshot
+        time.sleep(poll_interval)
+    return time.monotonic() - start
+
+
+def origin_of(url):
+    """scheme://host[:port] of a URL, or None for pages without one (about:blank, data:)."""
+    parts = urlsplit(url or '')
+    if parts.scheme not in ('http', 'https') or not parts.netloc:
+        return None
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class BrowserWorker:
+    """One Chrome process plus the bookkeeping needed to recycle it."""
+
+    def __init__(self, user_agent=DEFAULT_USER_AGENT, page_timeout=30):
+        self.user_agent = user_agent
+        self.page_timeout = page_timeout
+        self.driver = None
+        self.pages_served = 0
+        # Host of the site the tab is on, and the origins that may hold its storage
+        self.site = None
+        self.origins = set()
+
+    def start(self):
+        chrome_options = Options()
+        chrome_options.add_argument("--headless")
+        chrome_options.add_argument(f"user-agent={self.user_agent}")
+        chrome_options.add_argument("--no-sandbox")  # Required for Docker
+        chrome_options.add_argument("--disable-dev-shm-usage")  # Avoid shared memory issues
+        service = Service(get_driver_path())
+        self.driver = webdriver.Chrome(service=service, options=chrome_options)
+        self.driver.set_page_load_timeout(self.page_timeout)
+        self.pages_served = 0
+        self.site = None
+        self.origins = set()
+
+    def clear_site_state(self):
+        """
+        Delete every cookie and the storage of the origins visited since the
+        last clear. A WebDriverException is left to the caller, which restarts
+        the browser rather than render on a tab that still holds the state.
+        """
+        self.driver.delete_all_cookies()
+        self.driver.execute_cdp_cmd('Network.clearBrowserCookies', {})
+        for origin in self.origins - {None}:
+            self.driver.execute_cdp_cmd('Storage.clearDataForOrigin', {'origin': origin, 'storageTypes': 'all'})
+        self.site = None
+        self.origins = set()
+
+    def stop(self):
+        if self.driver is not None:
+            try:
+                self.driver.quit()
+            except Exception:
+                pass
+        self.driver = None
+
+    @property
+    def alive(self):
+        return self.driver is not None
+
+
+class BrowserPool:
+    """
+    Fixed-size pool of BrowserWorker objects. Workers are started lazily, so an
+    idle pool costs nothing until the first render.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_pages_per_browser=MAX_PAGES_PER_BROWSER,
+                 user_agent=DEFAULT_USER_AGENT, page_timeout=30, max_ready_wait=10):
+        self.size = size
+        self.max_pages_per_browser = max_pages_per_browser
+        self.max_ready_wait = max_ready_wait
+        self._idle = queue.Queue()
+        self._workers = [BrowserWorker(user_agent=user_agent, page_timeout=page_timeout) for _ in range(size)]
+        for worker in self._workers:
+            self._idle.put(worker)
+        self._stats_lock = threading.Lock()
+        self.pages_rendered = 0
+        self.failures = 0
+        self.browser_starts = 0
+        self.restarts = 0
+        self.total_render_time = 0.0
+        self._closed = False
+
+    def _record(self, elapsed=None, failed=False, started=False, restarted=False):
+        with self._stats_lock:
+            if elapsed is not None:
+                self.pages_rendered += 1
+                self.total_render_time += elapsed
+            if failed:
+                self.failures += 1
+            if started:
+                self.browser_starts += 1
+            if restarted:
+                self.restarts += 1
+
+    def _ensure_started(self, worker):
+        if not worker.alive:
+            with timed('browser_start'):
+                worker.start()
+            self._record(started=True)
+        elif worker.pages_served >= self.max_pages_per_browser:
+            worker.stop()
+            with timed('browser_start'):
+                worker.start()
+            self._record(started=True)
+
+    def _render_once(self, worker, url):
+        self._ensure_started(worker)
+        driver = worker.driver
+        site = urlsplit(url).hostname
+        if worker.site is not None and worker.site != site:
+            worker.clear_site_state()
+        worker.site = site
+        worker.origins.add(origin_of(url))
+        with timed('render_load', url):
+            try:
+                driver.get(url)
+            except TimeoutException:
+                # Keep whatever has loaded so far rather than discarding the page.
+                try:
+                    driver.execute_script("window.stop();")
+                except WebDriverException:
+                    pass
+        observe('render_wait', wait_until_ready(driver, max_wait=self.max_ready_wait), url)
+        # A redirect can land on another origin, which then holds the storage
+        worker.origins.add(origin_of(driver.current_url))
+        html_content = driver.page_source
+        worker.pages_served += 1
+        return html_content
+
+    def render(self, url, retries=1):
+        """
+        Render `url` on a pooled browser and return the page HTML, or None if
+        rendering failed. A browser that raises a WebDriver error is treated as
+        crashed, restarted and the page retried up to `retries` times.
+        """
+        if self._closed:
+            raise RuntimeError("BrowserPool is closed")
+        worker = self._idle.get()
+        start = time.monotonic()
+        try:
+            for attempt in range(retries + 1):
+                try:
+                    html_content = self._render_once(worker, url)
+                    self._record(elapsed=time.monotonic() - start)
+                    return html_content
+                except WebDriverException as e:
+                    print(f"Browser error rendering {url} (attempt {attempt + 1}): {str(e).splitlines()[0] if str(e) else e}")
+                    worker.stop()
+                    self._record(restarted=True)
+            self._record(failed=True)
+            return None
+        finally:
+            self._idle.put(worker)
+
+    def active_browsers(self):
+        """Number of browser processes currently running."""
+        return sum(1 for worker in self._workers if worker.alive)
+
+    def stats(self):
+        with self._stats_lock:
+            avg = self.total_render_time / self.pages_rendered if self.pages_rendered else 0.0
+            return {
+                'size': self.size,
+                'pages_rendered': self.pages_rendered,
+                'failures': self.failures,
+                'browser_starts': self.browser_starts,
+                'restarts': self.restarts,
+                'avg_render_time': round(avg, 3),
+            }
+
+    def close(self, timeout=None):
+        """
+        Quit every browser. Waits for in-flight renders to hand their worker
+        back, for at most `timeout` seconds if given, then quits the rest anyway.
+        """
+        self._closed = True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for _ in range(self.size):
+            try:
+                wait = None if deadline is None else max(0.0, deadline - time.monotonic())
+                self._idle.get(timeout=wait).stop()
+            except queue.Empty:
+                break
+        for worker in self._workers:
+            worker.stop()
+
+
+_shared_pool = None
+_shared_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    """Return the process-wide pool used by the JS rendering fallback."""
+    global _shared_pool
+    with _shared_pool_lock:
+        if _shared_pool is None:
+            _shared_pool = BrowserPool()
+            atexit.register(close_browser_pool)
+        return _shared_pool
+
+
+def close_browser_pool(timeout=BROWSER_POOL_CLOSE_TIMEOUT):
+    """Quit the shared pool's browsers; runs at interpreter exit once the pool exists."""
+    global _shared_pool
+    with _shared_pool_lock:
+        pool, _shared_pool = _shared_pool, None
+    if pool is not None:
+        pool.close(timeout)
+
+
+def active_browser_count():
+    """Running browsers in the shared pool, without creating the pool."""
+    pool = _shared_pool
+    return pool.active_browsers() if pool is not None else 0
@@ -0,0 +1,270 @@
+"""
+Durable per-row checkpoints for long crawls.
+
+Every upload handled by /process or /jobs is a checkpointed job whose ID is a
+digest of the file's contents and the app handling it, so uploading the same
+file again after a crash resumes it instead of starting over. Only an
+unfinished job is resumed, and only its successful and empty rows are kept:
+failed rows (errors, dead domains) are crawled again, and uploading a file
+whose job already finished starts the job over. Each row's
+result is written to a SQLite database (CHECKPOINT_PATH) as soon as it
+finishes, and the upload itself is kept under CHECKPOINT_DIR so a background
+job can be resumed without the client sending it again; a background job
+cut short by a restart resumes the next time it is polled. Failed and empty
+rows of a job can be rerun with other settings, and output workbooks are
+always assembled from the stored rows. Jobs untouched for
+CHECKPOINT_RETENTION seconds are dropped along with their upload.
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from dns_cache import DOMAIN_NOT_FOUND
+from sheet_io import save_upload
+
+CHECKPOINT_PATH = os.environ.get('CHECKPOINT_PATH', 'checkpoints.sqlite3')
+CHECKPOINT_DIR = os.environ.get('CHECKPOINT_DIR', 'checkpoints')
+CHECKPOINT_RETENTION = int(os.environ.get('CHECKPOINT_RETENTION', 7 * 24 * 3600))
+
+NO_EMAIL_FOUND = "No email ID found"
+# Rows a rerun can select: crawl errors and dead domains, or rows that found nothing
+RERUN_KINDS = ('failed', 'empty')
+
+
+def row_kind(result):
+    """'failed', 'empty' or 'done' for a stored result cell."""
+    if result is None or result.startswith('Error') or result == DOMAIN_NOT_FOUND:
+        return 'failed'
+    if result in ("", NO_EMAIL_FOUND):
+        return 'empty'
+    return 'done'
+
+
+def upload_digest(path, source, chunk_size=1 << 20):
+    """Job ID for the uploaded file at `path` processed by `source` (the app's name)."""
+    digest = hashlib.sha256(source.encode('utf-8'))
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()[:32]
+
+
+class CheckpointJob:
+    """One checkpointed upload; results are read from and written to its store."""
+
+    def __init__(self, store, job_id, name, fmt, source, status, settings, rows_total, created, updated):
+        self.store = store
+        self.id = job_id
+        self.name = name
+        self.format = fmt
+        self.source = source
+        self.status = status
+        self.settings = settings
+        self.rows_total = rows_total
+        self.created = created
+        self.updated = updated
+
+    @property
+    def input_path(self):
+        return os.path.join(self.store.directory, f"{self.id}.{self.format}")
+
+    def results(self):
+        """{row index: result} for every checkpointed row."""
+        return self.store.results(self.id)
+
+    def reusable_results(self):
+        """{row index: result} for the checkpointed rows a resumed run keeps (not failed)."""
+        return {index: result for index, result in self.results().items() if row_kind(result) != 'failed'}
+
+    def save(self, index, url, result, settings=None):
+        self.store.save_result(self.id, index, url, result, settings or self.settings)
+
+    def rows_to_rerun(self, kinds=RERUN_KINDS):
+        """(index, url) of the checkpointed rows whose result is of one of `kinds`."""
+        return [(index, url) for index, url, result in self.store.rows(self.id) if row_kind(result) in kinds]
+
+    def set_status(self, status, rows_total=None, settings=None):
+        self.store.set_status(self.id, status, rows_total=rows_total, settings=settings)
+        self.status = status
+        if rows_total is not None:
+            self.rows_total = rows_total
+        if settings is not None:
+            self.settings = settings
+
+    def progress(self):
+        """Checkpoint counters to merge into a job's progress report."""
+        counts = self.store.kind_counts(self.id)
+        return {
+            'rows_in_sheet': self.rows_total,
+            'rows_checkpointed': sum(counts.values()),
+            'rows_failed': counts.get('failed', 0),
+            'rows_empty': counts.get('empty', 0),
+        }
+
+
+class CheckpointStore:
+    def __init__(self, path=CHECKPOINT_PATH, directory=CHECKPOINT_DIR, retention=CHECKPOINT_RETENTION):
+        self.path = path
+        self.directory = directory
+        self.retention = retention
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            # A committed row survives a process crash; only an OS crash can lose the last few
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " job_id TEXT PRIMARY KEY,"
+                " name TEXT NOT NULL,"
+                " format TEXT NOT NULL,"
+                " source TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " settings TEXT NOT NULL,"
+                " rows_total INTEGER,"
+                " created REAL NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " job_id TEXT NOT NULL,"
+                " row_index INTEGER NOT NULL,"
+                " url TEXT,"
+                " result TEXT NOT NULL,"
+                " settings TEXT NOT NULL,"
+                " attempts INTEGER NOT NULL,"
+                " updated REAL NOT NULL,"
+                " PRIMARY KEY (job_id, row_index))"
+            )
+            self._conn.commit()
+
+    def open_upload(self, file_storage, fmt, source, settings=''):
+        """
+        Save an uploaded file and return its CheckpointJob, creating the job the
+        first time the file is seen and starting it over if it already
+        finished. The job's copy of the file is at job.input_path.
+        """
+        self.forget_expired()
+        upload_path = os.path.join(self.directory, f"upload-{uuid.uuid4().hex}.part")
+        save_upload(file_storage, upload_path)
+        job_id = upload_digest(upload_path, source)
+        job = self.get(job_id)
+        if job is not None and job.status == 'done':
+            print(f"Job {job_id} ({file_storage.filename}) already finished, starting it over")
+            self.forget(job_id)
+            job = None
+        if job is None:
+            now = time.time()
+            job = CheckpointJob(self, job_id, file_storage.filename, fmt, source, 'running', settings, None, now, now)
+            with self._lock:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO jobs (job_id, name, format, source, status, settings, rows_total, created, updated)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, job.name, fmt, source, 'running', settings, None, now, now),
+                )
+                self._conn.commit()
+        if os.path.exists(job.input_path):
+            os.remove(upload_path)
+        else:
+            os.replace(upload_path, job.input_path)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT job_id, name, format, source, status, settings, rows_total, created, updated"
+                " FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+        return CheckpointJob(self, *row) if row is not None else None
+
+    def set_status(self, job_id, status, rows_total=None, settings=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, rows_total = COALESCE(?, rows_total),"
+                " settings = COALESCE(?, settings), updated = ? WHERE job_id = ?",
+                (status, rows_total, settings, time.time(), job_id),
+            )
+            self._conn.commit()
+
+    def save_result(self, job_id, index, url, result, settings=''):
+        url = url if isinstance(url, str) else None
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO rows (job_id, row_index, url, result, settings, attempts, updated)"
+                " VALUES (?, ?, ?, ?, ?, 1, ?)"
+                " ON CONFLICT (job_id, row_index) DO UPDATE SET result = excluded.result,"
+                " settings = excluded.settings, attempts = attempts + 1, updated = excluded.updated",
+                (job_id, int(index), url, str(result), settings, time.time()),
+            )
+            self._conn.commit()
+
+    def rows(self, job_id):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT row_index, url, result FROM rows WHERE job_id = ? ORDER BY row_index", (job_id,)
+            ).fetchall()
+
+    def results(self, job_id):
+        return {index: result for index, _, result in self.rows(job_id)}
+
+    def kind_counts(self, job_id):
+        counts = {}
+        for _, _, result in self.rows(job_id):
+            kind = row_kind(result)
+            counts[kind] = counts.get(kind, 0) + 1
+        return counts
+
+    def forget(self, job_id):
+        """Drop a job and its rows; its upload is kept."""
+        with self._lock:
+            self._conn.execute("DELETE FROM rows WHERE job_id = ?", (job_id,))
+            self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+
+    def forget_expired(self):
+        cutoff = time.time() - self.retention
+        with self._lock:
+            expired = self._conn.execute(
+                "SELECT job_id, format FROM jobs WHERE updated < ?", (cutoff,)
+            ).fetchall()
+            for job_id, _ in expired:
+                self._conn.execute("DELETE FROM rows WHERE job_id = ?", (job_id,))
+                self._conn.execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+            self._conn.commit()
+        for job_id, fmt in expired:
+            path = os.path.join(self.directory, f"{job_id}.{fmt}")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def checkpointed(job, fn, settings=None):
+    """
+    Wrap a per-URL function for the job manager: items are (row index, URL)
+    pairs and every result is checkpointed before it is returned.
+    """
+    def process(item):
+        index, url = item
+        try:
+            result = fn(url)
+        except Exception as e:
+            result = f"Error: {str(e)}"
+        job.save(index, url, result, settings)
+        return result
+    return process
+
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+
+def get_checkpoint_store():
+    """Return the process-wide checkpoint store."""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = CheckpointStore()
+        return _shared_store
@@ -0,0 +1,262 @@
+"""
+Adaptive concurrency for the crawl.
+
+Static page fetches and JS renders each go through their own AdaptiveLimit,
+a semaphore whose size can change while work is waiting on it. A
+ConcurrencyController thread looks at the last CONTROLLER_INTERVAL seconds
+every CONTROLLER_INTERVAL seconds and resizes both limits:
+
+  - memory pressure (available memory under MEMORY_LOW_FRACTION, or process
+    RSS over MAX_RSS_MB) cuts static fetches by a quarter and renders by half
+  - a static error rate over ERROR_RATE_LIMIT cuts static fetches by a quarter
+  - a limit that was fully used grows by a quarter towards its maximum while
+    throughput keeps up, and steps back if the last increase made it worse
+  - renders never exceed the browsers that fit in available memory at
+    BROWSER_MEMORY_MB each
+
+Static fetches take their slot only once the host's politeness wait and
+any Retry-After backoff are over (HttpClient.get_page's `limit`), so
+requests sleeping on a slow host do not count as load.
+
+Every change is printed with the measurements behind it and kept in
+decisions, so the thresholds can be tuned from the logs. Memory comes from
+psutil when installed, otherwise from /proc.
+"""
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from browser_pool import BROWSER_POOL_SIZE, active_browser_count
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+CONTROLLER_INTERVAL = float(os.environ.get('CONTROLLER_INTERVAL', 2.0))
+STATIC_START_WORKERS = int(os.environ.get('STATIC_START_WORKERS', 8))
+STATIC_MAX_WORKERS = int(os.environ.get('STATIC_MAX_WORKERS', min(64, (os.cpu_count() or 1) * 16)))
+RENDER_MAX_WORKERS = int(os.environ.get('RENDER_MAX_WORKERS', BROWSER_POOL_SIZE))
+BROWSER_MEMORY_MB = float(os.environ.get('BROWSER_MEMORY_MB', 300))
+MEMORY_LOW_FRACTION = float(os.environ.get('MEMORY_LOW_FRACTION', 0.15))
+MAX_RSS_MB = float(os.environ.get('MAX_RSS_MB', 0))
+ERROR_RATE_LIMIT = float(os.environ.get('ERROR_RATE_LIMIT', 0.3))
+
+# Fewer completions than this in a window are too few to judge error rate or throughput by
+_MIN_SAMPLES = 5
+
+
+def process_rss_mb():
+    """Resident memory of this process and its children (browsers, parse workers) in MB."""
+    if psutil is not None:
+        process = psutil.Process()
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                rss += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return rss / 2 ** 20
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        return 0.0
+
+
+def memory_available():
+    """(available MB, available fraction of total) for the whole machine."""
+    if psutil is not None:
+        memory = psutil.virtual_memory()
+        return memory.available / 2 ** 20, memory.available / memory.total
+    try:
+        values = {}
+        with open('/proc/meminfo') as f:
+            for line in f:
+                name, value = line.split(':', 1)
+                values[name] = int(value.split()[0])
+        return values['MemAvailable'] / 1024, values['MemAvailable'] / values['MemTotal']
+    except (OSError, KeyError, ValueError):
+        return float('inf'), 1.0
+
+
+class AdaptiveLimit:
+    """A resizable semaphore that also counts what went through it."""
+
+    def __init__(self, name, limit, min_limit, max_limit):
+        self.name = name
+        self.min_limit = min_limit
+        self.max_limit = max(min_limit, max_limit)
+        self.limit = max(self.min_limit, min(limit, self.max_limit))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._reset_window()
+
+    def _reset_window(self):
+        self.completed = 0
+        self.errors = 0
+        self.peak_in_flight = self.in_flight
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= self.limit:
+                self._cond.wait()
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+
+    def release(self, failed=False):
+        with self._cond:
+            self.in_flight -= 1
+            self.completed += 1
+            if failed:
+                self.errors += 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self):
+        """Hold a slot for the duration of the block; an exception counts as an error."""
+        self.acquire()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            self.release(failed)
+
+    def resize(self, limit):
+        with self._cond:
+            self.limit = max(self.min_limit, min(int(limit), self.max_limit))
+            self._cond.notify_all()
+            return self.limit
+
+    def take_window(self):
+        """(completed, errors, peak in flight) since the last call, then start a new window."""
+        with self._cond:
+            window = (self.completed, self.errors, self.peak_in_flight)
+            self._reset_window()
+            return window
+
+
+class ConcurrencyController:
+    def __init__(self, static_start=STATIC_START_WORKERS, static_max=STATIC_MAX_WORKERS,
+                 render_max=RENDER_MAX_WORKERS, interval=CONTROLLER_INTERVAL,
+                 memory_probe=memory_available, rss_probe=process_rss_mb, browser_probe=active_browser_count):
+        self.static = AdaptiveLimit('static', static_start, 1, static_max)
+        self.render = AdaptiveLimit('render', 1, 1, render_max)
+        self.interval = interval
+        self.memory_probe = memory_probe
+        self.rss_probe = rss_probe
+        self.browser_probe = browser_probe
+        self.decisions = deque(maxlen=200)
+        self._last_throughput = None
+        self._last_grew_from = None
+        self._last_adjust = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.adjust()
+            except Exception as e:
+                print(f"Concurrency controller error: {e}")
+
+    def row_workers(self, rows=None):
+        """Rows to keep in flight: enough to fill both limits at their maximum (`rows` may be unknown)."""
+        workers = self.static.max_limit + self.render.max_limit
+        return max(1, min(rows, workers)) if rows else workers
+
+    def adjust(self):
+        """Take one look at the last window and resize the limits. Returns the decisions made."""
+        now = time.monotonic()
+        elapsed = max(now - self._last_adjust, 1e-6)
+        self._last_adjust = now
+        completed, errors, peak = self.static.take_window()
+        render_completed, _, render_peak = self.render.take_window()
+        if completed == 0 and render_completed == 0 and self.static.in_flight == 0 and self.render.in_flight == 0:
+            return []
+
+        throughput = completed / elapsed
+        error_rate = errors / completed if completed else 0.0
+        rss = self.rss_probe()
+        available_mb, available_fraction = self.memory_probe()
+        browsers = self.browser_probe()
+        pressure = available_fraction < MEMORY_LOW_FRACTION or (MAX_RSS_MB > 0 and rss > MAX_RSS_MB)
+        measurements = (f"{throughput:.1f} pages/s, {error_rate:.0%} errors, rss {rss:.0f} MB, "
+                        f"{available_fraction:.0%} memory free, {browsers} browsers")
+        decisions = []
+
+        static_limit = self.static.limit
+        grew_from = None
+        if pressure:
+            new_static, reason = static_limit * 0.75, 'memory pressure'
+        elif completed >= _MIN_SAMPLES and error_rate > ERROR_RATE_LIMIT:
+            new_static, reason = static_limit * 0.75, 'error rate'
+        elif (self._last_grew_from is not None and self._last_throughput
+              and completed >= _MIN_SAMPLES and throughput < self._last_throughput * 0.9):
+            new_static, reason = self._last_grew_from, 'throughput dropped after growing'
+        elif peak >= static_limit and (self._last_throughput is None or throughput >= self._last_throughput * 0.95):
+            new_static, reason = static_limit + max(1, static_limit // 4), 'limit saturated'
+            grew_from = static_limit
+        else:
+            new_static, reason = static_limit, None
+        new_static = self.static.resize(new_static)
+        if new_static != static_limit:
+            decisions.append(self._log('static', static_limit, new_static, reason, measurements))
+        self._last_grew_from = grew_from if new_static > static_limit else None
+        self._last_throughput = throughput
+
+        render_limit = self.render.limit
+        # Browsers already running are part of what the memory has to hold
+        fits = int(available_mb // BROWSER_MEMORY_MB) + browsers
+        if pressure:
+            new_render, reason = render_limit // 2, 'memory pressure'
+        elif render_limit > fits:
+            new_render, reason = fits, 'not enough memory for more browsers'
+        elif render_peak >= render_limit and render_limit < fits:
+            new_render, reason = render_limit + 1, 'limit saturated'
+        else:
+            new_render, reason = render_limit, None
+        new_render = self.render.resize(new_render)
+        if new_render != render_limit:
+            decisions.append(self._log('render', render_limit, new_render, reason, measurements))
+        return decisions
+
+    def _log(self, name, old, new, reason, measurements):
+        decision = {'time': time.time(), 'limit': name, 'from': old, 'to': new, 'reason': reason}
+        self.decisions.append(decision)
+        print(f"Concurrency: {name} {old} -> {new} ({reason}; {measurements})")
+        return decision
+
+    def snapshot(self):
+        return {
+            'static_limit': self.static.limit,
+            'static_in_flight': self.static.in_flight,
+            'render_limit': self.render.limit,
+            'render_in_flight': self.render.in_flight,
+            'recent_decisions': list(self.decisions)[-10:],
+        }
+
+
+_shared_controller = None
+_shared_controller_lock = threading.Lock()
+
+
+def get_concurrency_controller():
+    """Return the process-wide controller, starting its thread on first use."""
+    global _shared_controller
+    with _shared_controller_lock:
+        if _shared_controller is None:
+            _shared_controller = ConcurrencyController().start()
+        return _shared_controller
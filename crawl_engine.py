@@ -0,0 +1,126 @@
+"""
+Asyncio crawl engine.
+
+Streams URLs through a global concurrency limit and a per-host limit with no
+batch barriers: as soon as one site finishes, the next one starts. The crawl
+function itself is blocking (requests/Selenium), so it runs in a thread pool
+sized to the global limit while the event loop only does the scheduling.
+"""
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+DEFAULT_CONCURRENCY = 20
+DEFAULT_PER_HOST_LIMIT = 2
+
+
+def host_of(url):
+    """Return the lowercased host of a sheet URL, adding a scheme if missing."""
+    if not isinstance(url, str):
+        return ""
+    url = url.strip()
+    if not url.startswith(('http://', 'https://')):
+        url = f"http://{url}"
+    return urlparse(url).netloc.lower()
+
+
+class CrawlStats:
+    """Counters for a single crawl run."""
+
+    def __init__(self, total=None):
+        self.total = total
+        self.done = 0
+        self.errors = 0
+        self.started = time.monotonic()
+        self.finished = None
+
+    @property
+    def elapsed(self):
+        end = self.finished if self.finished is not None else time.monotonic()
+        return end - self.started
+
+    @property
+    def urls_per_sec(self):
+        elapsed = self.elapsed
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return {
+            'total': self.total,
+            'done': self.done,
+            'errors': self.errors,
+            'elapsed': round(self.elapsed, 3),
+            'urls_per_sec': round(self.urls_per_sec, 3),
+        }
+
+
+async def _crawl(urls, fn, concurrency, per_host_limit, host_key, on_result, stats, executor):
+    loop = asyncio.get_running_loop()
+    global_slots = asyncio.Semaphore(concurrency)
+    # Caps the number of scheduled-but-unfinished tasks so that a generator
+    # input is consumed lazily instead of being expanded up front.
+    window = asyncio.Semaphore(concurrency * 4)
+    host_slots = {}
+    pending = set()
+
+    async def run_one(index, url):
+        try:
+            host = host_key(url)
+            slots = host_slots.get(host)
+            if slots is None:
+                slots = host_slots[host] = asyncio.Semaphore(per_host_limit)
+            # Take the host slot first so a saturated host never holds a
+            # global slot while it waits.
+            async with slots:
+                async with global_slots:
+                    try:
+                        result = await loop.run_in_executor(executor, fn, url)
+                    except Exception as e:
+                        stats.errors += 1
+                        result = f"Error: {str(e)}"
+            stats.done += 1
+            on_result(index, url, result)
+        finally:
+            window.release()
+
+    for index, url in enumerate(urls):
+        await window.acquire()
+        task = asyncio.ensure_future(run_one(index, url))
+        pending.add(task)
+        task.add_done_callback(pending.discard)
+
+    if pending:
+        await asyncio.gather(*pending)
+
+
+def run_crawl(urls, fn, concurrency=DEFAULT_CONCURRENCY, per_host_limit=DEFAULT_PER_HOST_LIMIT,
+              on_result=None, collect=True, host_key=host_of):
+    """
+    Run fn(url) for every URL with at most `concurrency` calls in flight overall
+    and at most `per_host_limit` per host.
+
+    `urls` may be any iterable, including a generator. `host_key` maps an item
+    to the host its limit applies to, so items need not be plain URLs. If
+    `on_result` is given it is called as on_result(index, url, result) as each
+    URL completes. When `collect` is True the results are also returned in
+    input order.
+    Returns (results, stats); results is None when `collect` is False.
+    """
+    concurrency = max(1, int(concurrency))
+    per_host_limit = max(1, int(per_host_limit))
+    stats = CrawlStats(total=len(urls) if hasattr(urls, '__len__') else None)
+    collected = {} if collect else None
+
+    def handle_result(index, url, result):
+        if collected is not None:
+            collected[index] = result
+        if on_result is not None:
+            on_result(index, url, result)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        asyncio.run(_crawl(urls, fn, concurrency, per_host_limit, host_key, handle_result, stats, executor))
+    stats.finished = time.monotonic()
+
+    results = [collected[i] for i in range(len(collected))] if collected is not None else None
+    return results, stats
@@ -0,0 +1,286 @@
+"""
+In-process DNS cache shared by the crawl.
+
+Every hostname is resolved once and kept for its record's TTL (or
+DNS_CACHE_TTL when the resolver does not report one); NXDOMAIN answers are
+kept for DNS_NEGATIVE_TTL. Concurrent lookups of the same host wait for the
+first one instead of all hitting the resolver. http_client.py connects to
+the cached addresses, and pre_resolve() resolves every host of an uploaded
+sheet concurrently before crawling starts, so rows whose domain does not
+exist can be dropped without waiting on a connection timeout.
+
+DNS_RESOLVER=system (default) uses getaddrinfo, which does not expose TTLs.
+DNS_RESOLVER=dnspython uses dnspython, if installed, with the record TTLs and
+optionally the nameservers in DNS_NAMESERVERS ("host" or "host:port", comma
+separated).
+"""
+import ipaddress
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:
+    dns = None
+
+DNS_CACHE_ENABLED = os.environ.get('DNS_CACHE_ENABLED', '1') != '0'
+DNS_RESOLVER = os.environ.get('DNS_RESOLVER', 'system')
+DNS_NAMESERVERS = os.environ.get('DNS_NAMESERVERS', '')
+DNS_CACHE_TTL = float(os.environ.get('DNS_CACHE_TTL', 300))
+DNS_NEGATIVE_TTL = float(os.environ.get('DNS_NEGATIVE_TTL', 300))
+DNS_MIN_TTL = float(os.environ.get('DNS_MIN_TTL', 30))
+DNS_TIMEOUT = float(os.environ.get('DNS_TIMEOUT', 5))
+DNS_WORKERS = int(os.environ.get('DNS_WORKERS', 50))
+DNS_CACHE_MAX_ENTRIES = int(os.environ.get('DNS_CACHE_MAX_ENTRIES', 100000))
+# Resolve a sheet's hosts before crawling and skip rows whose domain does not exist
+DNS_PRE_RESOLVE = os.environ.get('DNS_PRE_RESOLVE', '1') != '0'
+
+# Result cell for rows whose domain does not exist
+DOMAIN_NOT_FOUND = "Domain not found"
+
+_NXDOMAIN_ERRORS = {socket.EAI_NONAME, getattr(socket, 'EAI_NODATA', socket.EAI_NONAME)}
+
+
+class HostNotFound(socket.gaierror):
+    """The domain does not exist (NXDOMAIN)."""
+
+
+def system_resolver(host):
+    """Resolve with getaddrinfo. Returns (addresses, None) since no TTL is available."""
+    try:
+        infos = socket.getaddrinfo(host, None, proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        if e.errno in _NXDOMAIN_ERRORS:
+            raise HostNotFound(e.errno, f"Domain not found: {host}")
+        raise
+    addresses = []
+    for info in infos:
+        if info[4][0] not in addresses:
+            addresses.append(info[4][0])
+    return addresses, None
+
+
+class DnspythonResolver:
+    """Resolve A (then AAAA) records with dnspython, returning the record TTL."""
+
+    def __init__(self, nameservers=None, timeout=DNS_TIMEOUT):
+        if dns is None:
+            raise RuntimeError("dnspython is not installed")
+        self.timeout = timeout
+        if nameservers:
+            self._resolver = dns.resolver.Resolver(configure=False)
+            self._resolver.nameservers = []
+            for nameserver in nameservers:
+                address, _, port = nameserver.rpartition(':') if nameserver.count(':') == 1 else (nameserver, '', '')
+                self._resolver.nameservers.append(address)
+                if port:
+                    self._resolver.port = int(port)
+        else:
+            self._resolver = dns.resolver.Resolver()
+
+    def __call__(self, host):
+        if host == 'localhost':
+            return system_resolver(host)
+        try:
+            for record_type in ('A', 'AAAA'):
+                try:
+                    answer = self._resolver.resolve(host, record_type, lifetime=self.timeout)
+                except dns.resolver.NoAnswer:
+                    continue
+                return [record.address for record in answer], answer.rrset.ttl
+        except dns.resolver.NXDOMAIN:
+            raise HostNotFound(socket.EAI_NONAME, f"Domain not found: {host}")
+        except dns.exception.DNSException as e:
+            raise socket.gaierror(socket.EAI_AGAIN, f"DNS lookup failed for {host}: {e}")
+        raise HostNotFound(socket.EAI_NONAME, f"No address records for {host}")
+
+
+def default_resolver():
+    if DNS_RESOLVER == 'dnspython':
+        if dns is not None:
+            nameservers = [ns.strip() for ns in DNS_NAMESERVERS.split(',') if ns.strip()]
+            return DnspythonResolver(nameservers or None)
+        print("dnspython is not installed, using the system resolver")
+    return system_resolver
+
+
+class _Entry:
+    def __init__(self, addresses, error, expires):
+        self.addresses = addresses
+        self.error = error
+        self.expires = expires
+
+
+class DnsCache:
+    def __init__(self, resolver=None, ttl=DNS_CACHE_TTL, negative_ttl=DNS_NEGATIVE_TTL,
+                 min_ttl=DNS_MIN_TTL, max_entries=DNS_CACHE_MAX_ENTRIES):
+        self.resolver = resolver or default_resolver()
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.min_ttl = min_ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.lookups = 0
+
+    def resolve(self, host):
+        """
+        Addresses for `host`, from the cache when fresh. Raises HostNotFound
+        for a domain that does not exist and socket.gaierror for other failures.
+        """
+        host = host.lower().rstrip('.')
+        if _is_ip(host):
+            return [host.strip('[]')]
+        while True:
+            with self._lock:
+                entry = self._entries.get(host)
+                if entry is not None and entry.expires > time.monotonic():
+                    self.hits += 1
+                    return _answer(entry)
+                waiting = self._inflight.get(host)
+                if waiting is None:
+                    self._inflight[host] = threading.Event()
+                    break
+            # Another thread is already looking this host up
+            waiting.wait()
+        try:
+            entry = self._lookup(host)
+            with self._lock:
+                if len(self._entries) >= self.max_entries:
+                    self._evict()
+                self._entries[host] = entry
+        finally:
+            with self._lock:
+                self._inflight.pop(host).set()
+        return _answer(entry)
+
+    def _lookup(self, host):
+        with self._lock:
+            self.lookups += 1
+        now = time.monotonic()
+        try:
+            addresses, ttl = self.resolver(host)
+        except HostNotFound as e:
+            return _Entry(None, e, now + self.negative_ttl)
+        except (socket.gaierror, OSError) as e:
+            # Temporary failures are only remembered briefly
+            return _Entry(None, socket.gaierror(getattr(e, 'errno', socket.EAI_AGAIN), str(e)), now + min(self.min_ttl, 5))
+        ttl = self.ttl if ttl is None else max(self.min_ttl, min(ttl, self.ttl))
+        return _Entry(addresses, None, now + ttl)
+
+    def _evict(self):
+        now = time.monotonic()
+        for host in [host for host, entry in self._entries.items() if entry.expires <= now]:
+            del self._entries[host]
+        if len(self._entries) >= self.max_entries:
+            for host in list(self._entries)[:len(self._entries) // 10 or 1]:
+                del self._entries[host]
+
+    def status(self, host):
+        """'ok', 'nxdomain' or 'error' for `host`, resolving it if it is not cached."""
+        try:
+            self.resolve(host)
+        except HostNotFound:
+            return 'nxdomain'
+        except socket.gaierror:
+            return 'error'
+        return 'ok'
+
+    def pre_resolve(self, hosts, workers=DNS_WORKERS):
+        """Resolve every distinct host concurrently. Returns {host: status}."""
+        hosts = list(dict.fromkeys(host for host in hosts if host))
+        if not hosts:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(workers, len(hosts))) as executor:
+            return dict(zip(hosts, executor.map(self.status, hosts)))
+
+    def stats(self):
+        with self._lock:
+            return {'hosts': len(self._entries), 'lookups': self.lookups, 'hits': self.hits}
+
+
+def _is_ip(host):
+    try:
+        ipaddress.ip_address(host.strip('[]'))
+    except ValueError:
+        return False
+    return True
+
+
+def _answer(entry):
+    if entry.error is not None:
+        # A fresh exception each time, so cached errors do not pile up tracebacks
+        raise type(entry.error)(*entry.error.args)
+    return entry.addresses
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_dns_cache():
+    """Return the process-wide DNS cache, or None if DNS_CACHE_ENABLED=0."""
+    global _shared_cache
+    if not DNS_CACHE_ENABLED:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = DnsCache()
+        return _shared_cache
+
+
+def hostname_of(url):
+    """Lowercased hostname of a sheet URL (scheme optional), or None."""
+    if not isinstance(url, str) or not url.strip():
+        return None
+    url = url.strip()
+    if '//' not in url:
+        url = f"http://{url}"
+    try:
+        return urlsplit(url).hostname
+    except ValueError:
+        return None
+
+
+def pre_resolve_urls(urls):
+    """
+    Resolve the hosts of a whole URL column concurrently, before crawling,
+    and print how many are dead. Returns {host: status}.
+    """
+    cache = get_dns_cache()
+    if cache is None or not DNS_PRE_RESOLVE:
+        return {}
+    start = time.monotonic()
+    statuses = cache.pre_resolve(hostname_of(url) for url in urls)
+    dead = sum(1 for status in statuses.values() if status == 'nxdomain')
+    failed = sum(1 for status in statuses.values() if status == 'error')
+    print(f"Resolved {len(statuses)} hosts in {time.monotonic() - start:.1f}s "
+          f"({dead} domains not found, {failed} lookups failed)")
+    return statuses
+
+
+def domain_missing(url):
+    """True if the URL's domain is known not to exist (NXDOMAIN)."""
+    cache = get_dns_cache()
+    if cache is None or not DNS_PRE_RESOLVE:
+        return False
+    host = hostname_of(url)
+    return host is not None and cache.status(host) == 'nxdomain'
+
+
+def pre_resolve_in_background(urls):
+    """
+    pre_resolve_urls on a daemon thread, for background jobs whose request
+    must not wait for it. Crawls that look a host up meanwhile wait for its
+    lookup instead of starting another.
+    """
+    thread = threading.Thread(target=pre_resolve_urls, args=(list(urls),), daemon=True)
+    thread.start()
+    return thread
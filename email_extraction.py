@@ -0,0 +1,243 @@
+"""
+Email extraction engine shared by the static crawl and the JS-rendering path.
+
+All patterns are compiled once at import. scan_soup() walks the parsed
+document a single time and collects everything the crawler needs from it:
+mailto links, visible text, inline scripts and the links used for subpage
+discovery. Text is matched with one regex pass, scripts are checked for
+entity-encoded and string-concatenation obfuscation, and every candidate goes
+through the same validation. page_parser.py produces the same PageScan from
+faster, C-backed parsers.
+
+A page on which none of that finds an address goes through a second, still
+cheap tier before anyone reaches for a browser: Cloudflare-protected
+addresses are decoded and the inline scripts are evaluated by script_eval.py
+(atob, fromCharCode, reversed and ROT13 strings, concatenation over
+variables). SCRIPT_EVAL=0 turns the tier off.
+"""
+import os
+import re
+
+from bs4 import CData, Comment, NavigableString, Tag
+
+from metrics import timed
+from script_eval import decode_cfemail, evaluate_script, uses_rot13
+
+SCRIPT_EVAL = os.environ.get('SCRIPT_EVAL', '1') != '0'
+
+EMAIL_PATTERN = re.compile(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[A-Za-z]{2,}')
+FULL_EMAIL_PATTERN = re.compile(r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[A-Za-z]{2,}$')
+PHONE_PATTERN = re.compile(r'\d{3}-\d{3}-\d{4}')
+COMMON_FALSE_POSITIVES = re.compile(
+    '|'.join(re.escape(fp) for fp in [
+        'example.com', 'domain.com', 'email.com', 'your-email.com',
+        'username@', '@domain', 'example@example',
+    ])
+)
+# 'user' + '@' + 'site.com' written out in a script
+CONCAT_PATTERN = re.compile(r'[\'"][a-zA-Z0-9._%+-]+[\'"]\s*\+\s*[\'"]\@[\'"]\s*\+\s*[\'"][a-zA-Z0-9.-]+\.[A-Za-z]{2,}[\'"]')
+QUOTED_PART_PATTERN = re.compile(r'[\'"]([^\'"]*)[\'"]')
+DECIMAL_ENTITY_PATTERN = re.compile(r'&#(\d+);')
+# <meta> tags declaring the page's language, by the value of their http-equiv, name or property
+LANGUAGE_META = ('content-language', 'language', 'og:locale')
+HEX_ENTITY_PATTERN = re.compile(r'&#[xX]([0-9a-fA-F]+);')
+# Cloudflare email protection rewrites mailto links to this, followed by #<hex>
+CFEMAIL_LINK = '/cdn-cgi/l/email-protection#'
+
+# Text nodes that are part of the visible page, as in soup.stripped_strings
+_TEXT_TYPES = (NavigableString, CData)
+SKIPPED_TEXT_PARENTS = {'script', 'style', 'template'}
+
+
+def validate_email(email):
+    """
+    Validate if a string is a proper email address, excluding common false positives.
+    Returns True if valid, False otherwise.
+    """
+    if not email or '@' not in email:
+        return False
+    if email[0].isdigit():
+        return False
+    if COMMON_FALSE_POSITIVES.search(email.lower()):
+        return False
+    local_part = email.split('@', 1)[0]
+    if PHONE_PATTERN.search(local_part):
+        return False
+    return FULL_EMAIL_PATTERN.match(email) is not None
+
+
+def decode_entities(text):
+    """Decode numeric character references (&#64; and &#x40;) left in raw text."""
+    if '&#' not in text:
+        return text
+    text = DECIMAL_ENTITY_PATTERN.sub(lambda m: _safe_chr(int(m.group(1))), text)
+    return HEX_ENTITY_PATTERN.sub(lambda m: _safe_chr(int(m.group(1), 16)), text)
+
+
+def _safe_chr(code):
+    try:
+        return chr(code)
+    except (ValueError, OverflowError):
+        return ''
+
+
+def extract_emails_from_text(text):
+    """
+    Extract emails from plain text using regex.
+    Returns a set of validated, lowercased emails.
+    """
+    if not text or '@' not in text:
+        return set()
+    emails = set()
+    for match in EMAIL_PATTERN.findall(text):
+        email = match.lower().strip()
+        if validate_email(email):
+            emails.add(email)
+    return emails
+
+
+def extract_obfuscated_emails(text):
+    """
+    Extract emails obfuscated in JavaScript or HTML (e.g., string concatenation or character entities).
+    Returns a set of validated emails.
+    """
+    emails = set()
+    if not text:
+        return emails
+
+    if '+' in text:
+        for match in CONCAT_PATTERN.findall(text):
+            reconstructed = ''.join(QUOTED_PART_PATTERN.findall(match)).lower()
+            if validate_email(reconstructed):
+                emails.add(reconstructed)
+
+    emails.update(extract_emails_from_text(decode_entities(text)))
+    return emails
+
+
+def evaluate_obfuscated_emails(scripts, links=(), cfemails=()):
+    """
+    The second extraction tier: addresses from Cloudflare data-cfemail values
+    and email-protection links, and from the strings the inline scripts
+    compute (script_eval.evaluate_script). Returns a set of validated emails.
+    """
+    encoded = list(cfemails)
+    encoded.extend(href.split(CFEMAIL_LINK, 1)[1] for href, _ in links if CFEMAIL_LINK in href)
+    emails = set()
+    for value in encoded:
+        emails.update(extract_emails_from_text(decode_cfemail(value)))
+    for script_text in scripts:
+        for value in evaluate_script(script_text):
+            emails.update(extract_emails_from_text(decode_entities(value)))
+    return emails
+
+
+def mailto_address(href):
+    """Return the lowercased address of a mailto: href, or None."""
+    if not href or not href[:7].lower() == 'mailto:':
+        return None
+    return href[7:].split('?')[0].strip().lower()
+
+
+def language_code(value):
+    """Primary subtag of a declared language ('fr-CA', 'fr_FR', 'FR, en' -> 'fr'), or None."""
+    if not value:
+        return None
+    code = value.split(',')[0].strip().replace('_', '-').split('-')[0].lower()
+    return code or None
+
+
+def meta_language(attributes):
+    """The language declared by a <meta> tag with these attributes, or None."""
+    for name in ('http-equiv', 'name', 'property'):
+        value = attributes.get(name)
+        if isinstance(value, str) and value.strip().lower() in LANGUAGE_META:
+            return language_code(attributes.get('content'))
+    return None
+
+
+class PageScan:
+    """Everything the crawler uses from one parsed page."""
+
+    def __init__(self, emails=None, links=None, text='', lang=None):
+        self.emails = emails if emails is not None else set()
+        # (href, link text) for every anchor with an href, in document order
+        self.links = links if links is not None else []
+        # Visible text, joined like ' '.join(soup.stripped_strings)
+        self.text = text
+        # Language the page declares (<html lang>, else a language <meta>), e.g. 'fr'
+        self.lang = lang
+        # The part of `emails` only the script evaluation tier found
+        self.evaluated_emails = set()
+
+
+def finish_scan(text_parts, scripts, links, html_lang=None, meta_lang=None, cfemails=()):
+    """
+    Turn what a parser backend collected from one page into a PageScan: mailto
+    addresses from the links, regex matches in the visible text and
+    obfuscated addresses in the scripts, all validated. If that finds
+    nothing, `cfemails` (data-cfemail values) and the scripts go through
+    evaluate_obfuscated_emails(). The page's language is its <html lang>,
+    or failing that the first language <meta> tag.
+    """
+    scan = PageScan(links=links, text=' '.join(text_parts), lang=language_code(html_lang) or meta_lang)
+    with timed('regex'):
+        for href, _ in links:
+            email = mailto_address(href)
+            if email and validate_email(email):
+                scan.emails.add(email)
+        scan.emails.update(extract_emails_from_text(decode_entities(scan.text)))
+        for script_text in scripts:
+            # Left to the evaluation tier, which decodes the address first
+            if not (SCRIPT_EVAL and uses_rot13(script_text)):
+                scan.emails.update(extract_obfuscated_emails(script_text))
+    if not scan.emails and SCRIPT_EVAL:
+        with timed('script_eval'):
+            scan.evaluated_emails = evaluate_obfuscated_emails(scripts, links, cfemails)
+        scan.emails.update(scan.evaluated_emails)
+    return scan
+
+
+def scan_soup(soup):
+    """
+    Walk a BeautifulSoup document once, collecting validated emails (mailto
+    links, visible text, obfuscated scripts) and the links for subpage discovery.
+    """
+    text_parts = []
+    scripts = []
+    links = []
+    cfemails = []
+    html_lang = meta_lang = None
+    for node in soup.descendants:
+        if isinstance(node, Tag):
+            if 'data-cfemail' in node.attrs:
+                cfemails.append(node['data-cfemail'])
+            if node.name == 'a':
+                href = node.get('href')
+                if href is not None:
+                    links.append((href, node.get_text()))
+            elif node.name == 'html' and html_lang is None:
+                html_lang = node.get('lang')
+            elif node.name == 'meta' and meta_lang is None:
+                meta_lang = meta_language(node.attrs)
+            continue
+        if isinstance(node, Comment) or not isinstance(node, _TEXT_TYPES):
+            continue
+        parent = node.parent.name if node.parent is not None else None
+        if parent == 'script':
+            scripts.append(str(node))
+        elif parent in SKIPPED_TEXT_PARENTS or type(node) not in _TEXT_TYPES:
+            continue
+        else:
+            stripped = node.strip()
+            if stripped:
+                text_parts.append(stripped)
+    return finish_scan(text_parts, scripts, links, html_lang, meta_lang, cfemails)
+
+
+def extract_emails(soup):
+    """
+    Extract emails from a BeautifulSoup object by checking mailto links, text content, and obfuscated emails.
+    Returns a set of unique, lowercased emails.
+    """
+    return scan_soup(soup).emails
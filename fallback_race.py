@@ -0,0 +1,156 @@
+"""
+Scheduling between the static crawl and the JS-rendering fallback.
+
+is_spa_shell() looks at a site's first response and recognises pages that
+only render in a browser: almost no visible text together with an empty
+mount point, a framework bundle or a "please enable JavaScript" notice. Those
+sites can go straight to the render pool instead of paying for the whole
+static crawl first.
+
+hedged_race() runs the static crawl and, if it has not answered within a
+latency threshold, starts the render as well and takes whichever finds
+emails first. Python threads cannot be cancelled, so the losing side runs to
+completion in the background.
+
+RaceStats counts which path produced each result.
+"""
+import os
+import re
+import threading
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+SPA_MIN_TEXT = int(os.environ.get('SPA_MIN_TEXT', 200))
+HEDGE_WORKERS = int(os.environ.get('HEDGE_WORKERS', 32))
+
+# Empty element a client-side framework mounts into
+MOUNT_POINT_PATTERN = re.compile(
+    r'<div[^>]+id=["\'](?:root|app|__next|__nuxt|q-app|svelte|main-app)["\'][^>]*>\s*</div>', re.IGNORECASE)
+BUNDLE_MARKER_PATTERN = re.compile(
+    r'/_next/static/|/_nuxt/|ng-version=|data-reactroot|window\.__NUXT__|window\.__INITIAL_STATE__'
+    r'|chunk-vendors|/static/js/main\.[0-9a-f]+|/assets/index[.-][\w-]+\.js|/build/bundle\.js'
+    r'|\b(?:app|main|runtime|polyfills|vendor)[.-][0-9a-f]{6,}\.js', re.IGNORECASE)
+NOSCRIPT_PATTERN = re.compile(
+    r'<noscript[^>]*>[^<]*(?:enable|requires?|need|turn on)[^<]*javascript', re.IGNORECASE)
+
+
+def is_spa_shell(html, page):
+    """
+    True if a first response looks like a JavaScript app shell. `page` is its
+    PageScan; a page that already shows emails or enough text is never a shell.
+    """
+    if not html or page.emails or len(page.text) >= SPA_MIN_TEXT:
+        return False
+    if not page.text.strip():
+        return True
+    return bool(MOUNT_POINT_PATTERN.search(html) or BUNDLE_MARKER_PATTERN.search(html)
+                or NOSCRIPT_PATTERN.search(html))
+
+
+class RaceStats:
+    """How often each extraction path produced the result."""
+
+    PATHS = ('primary', 'js_fallback', 'spa_shell', 'hedged_primary', 'hedged_js', 'none')
+
+    def __init__(self):
+        self.wins = dict.fromkeys(self.PATHS, 0)
+        self.shells_detected = 0
+        self.hedges_started = 0
+        self.lock = threading.Lock()
+
+    def record(self, path):
+        with self.lock:
+            self.wins[path] += 1
+
+    def shell_detected(self):
+        with self.lock:
+            self.shells_detected += 1
+
+    def hedge_started(self):
+        with self.lock:
+            self.hedges_started += 1
+
+    def as_dict(self):
+        with self.lock:
+            total = sum(self.wins.values())
+            return {
+                'results': total,
+                'wins': dict(self.wins),
+                'win_rates': {path: round(count / total, 3) if total else 0.0 for path, count in self.wins.items()},
+                'shells_detected': self.shells_detected,
+                'hedges_started': self.hedges_started,
+            }
+
+
+_race_stats = None
+_hedge_executor = None
+_shared_lock = threading.Lock()
+
+
+def get_race_stats():
+    global _race_stats
+    with _shared_lock:
+        if _race_stats is None:
+            _race_stats = RaceStats()
+        return _race_stats
+
+
+def get_hedge_executor():
+    """Threads that run both sides of a hedged race; races never wait on each other inside it."""
+    global _hedge_executor
+    with _shared_lock:
+        if _hedge_executor is None:
+            _hedge_executor = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix='hedge')
+        return _hedge_executor
+
+
+def hedged_race(primary, fallback, hedge_after, found, executor=None):
+    """
+    Run `primary()`, and start `fallback()` too once it has been running for
+    `hedge_after` seconds, or as soon as it returns a result that `found()`
+    rejects. The hedge timer starts when `primary()` does, not while it is
+    still queued behind other races in the executor. Returns (winner, result,
+    hedged): winner is 'primary', 'fallback' or None when neither found
+    anything, in which case result is the fallback's (or the primary's if the
+    fallback never ran). An exception on either side counts as finding
+    nothing.
+    """
+    executor = executor or get_hedge_executor()
+    primary_started = threading.Event()
+
+    def run_primary():
+        primary_started.set()
+        return primary()
+
+    primary_future = executor.submit(run_primary)
+    names = {primary_future: 'primary'}
+    results = {}
+
+    def start_fallback():
+        future = executor.submit(fallback)
+        names[future] = 'fallback'
+        return future
+
+    pending = {primary_future}
+    primary_started.wait()
+    done, _ = wait(pending, timeout=hedge_after)
+    hedged = not done
+    if hedged:
+        pending.add(start_fallback())
+
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            name = names[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                print(f"Error in {name} extraction: {e}")
+                result = None
+            results[name] = result
+            if result is not None and found(result):
+                return name, result, hedged
+        if 'fallback' not in names.values():
+            pending.add(start_fallback())
+
+    result = results['fallback'] if 'fallback' in results else results.get('primary')
+    return None, result, hedged
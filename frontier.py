@@ -0,0 +1,344 @@
+"""
+Bounded, prioritized crawl frontier for contact-page discovery.
+
+Each site gets its own SiteFrontier. Candidate links are scored by the
+contact keywords found in their link text and path, so contact pages are
+fetched before "about" pages and those before generic help or info pages.
+Links are deduplicated on a normalized form of the URL (no fragment, no
+trailing slash, no tracking parameters). A site is never crawled past
+FRONTIER_PAGE_BUDGET pages or FRONTIER_MAX_DEPTH links away from the
+homepage, and with FRONTIER_STOP_EARLY the crawl ends as soon as a page
+yields an address on the site's own domain. SITE_DEADLINE caps the time
+spent on a site as a whole: no page is handed out after it, and fetchers get
+it to bound their own requests.
+"""
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+from collections import Counter
+from urllib.parse import parse_qsl, unquote, urlencode, urljoin, urlsplit, urlunsplit
+
+FRONTIER_PAGE_BUDGET = int(os.environ.get('FRONTIER_PAGE_BUDGET', 10))
+FRONTIER_MAX_DEPTH = int(os.environ.get('FRONTIER_MAX_DEPTH', 3))
+FRONTIER_STOP_EARLY = os.environ.get('FRONTIER_STOP_EARLY', '1') not in ('0', 'false', 'False')
+# Seconds a site's static crawl may take in total (0 disables the deadline)
+SITE_DEADLINE = float(os.environ.get('SITE_DEADLINE', 30))
+
+SUBPAGE_KEYWORDS = {
+    "en": ["contact", "about", "reach", "support", "help", "info", "team", "staff", "brokers", "get in touch", "our people", "meet the team", "directory", "contact us", "about us", "reach us"],
+    "fr": ["contact", "à propos", "nous contacter", "support", "aide", "info", "équipe", "personnel", "courtiers", "nous joindre", "notre équipe", "rencontrer l'équipe", "annuaire"],
+    "de": ["kontakt", "über uns", "erreichen", "unterstützung", "hilfe", "info", "team", "personal", "makler", "uns kontaktieren", "unser team", "team treffen", "verzeichnis"],
+    "it": ["contatto", "chi siamo", "raggiungere", "supporto", "aiuto", "info", "team", "personale", "broker", "contattarci", "il nostro team", "incontrare il team", "directory"],
+    "ur": ["رابط", "ہم سے رابطہ", "ہم تک پہنچیں", "حمایت", "مدد", "اطلاعات", "ٹیم", "افراد", "بروکر", "ہم سے رابطہ کریں", "ہماری ٹیم", "ٹیم سے ملاقات", "ڈائریکٹری"],
+    "ar": ["اتصال", "معلومات عنا", "الوصول إلينا", "دعم", "مساعدة", "معلومات", "فريق", "أفراد", "سماسرة", "اتصل بنا", "فريقنا", "لقاء الفريق", "دليل"],
+    "es": ["contacto", "acerca de", "alcanzarnos", "soporte", "ayuda", "info", "equipo", "personal", "corredores", "contactarnos", "nuestro equipo", "conocer al equipo", "directorio"],
+    "pt": ["contato", "sobre", "alcançar", "suporte", "ajuda", "info", "equipe", "pessoal", "corretor", "contatar-nos", "nossa equipe", "conhecer a equipe", "diretório"],
+    "ru": ["контакт", "о нас", "достичь", "поддержка", "помощь", "инфо", "команда", "персонал", "брокеры", "связаться с нами", "наша команда", "встреча команды", "справочник"],
+    "zh": ["联系", "关于我们", "联系我们", "支持", "帮助", "信息", "团队", "人员", "经纪人", "联系我们", "我们的团队", "团队见面", "目录"],
+    "ja": ["コンタクト", "私たちについて", "私たちに連絡する", "サポート", "ヘルプ", "情報", "チーム", "スタッフ", "ブローカー", "私たちに連絡する", "私たちのチーム", "チームに会う", "ディレクトリ"],
+    "ko": ["연락처", "关于我们", "연락처", "지원", "도움말", "정보", "팀", "직원", "중개인", "연락처", "우리 팀", "팀 만남", "디렉토리"],
+}
+
+# Keywords the primary crawl always followed, on top of the language tables
+CONTACT_KEYWORDS = ['contact', 'about', 'get in touch', 'reach us', 'communication', 'contacts', 'about the company', 'contact us']
+
+# Keyword fragments that mark a page as likely to list addresses, strongest first
+_STRONG_FRAGMENTS = ['contact', 'kontakt', 'contatt', 'contato', 'contacto', 'contatar', 'joindre', 'get in touch', 'reach us',
+                     'контакт', 'связаться', '联系', 'コンタクト', '連絡', '연락', 'رابط', 'اتصال', 'اتصل']
+_MEDIUM_FRAGMENTS = ['about', 'propos', 'über uns', 'chi siamo', 'acerca', 'sobre', 'о нас', '关于', 'について',
+                     'team', 'équipe', 'equipo', 'equipe', 'команда', 'فريق', 'チーム', '팀', 'ٹیم', 'staff', 'people']
+
+# Query parameters that only track the visitor and never change the page
+_TRACKING_PARAMS = {'gclid', 'fbclid', 'msclkid', 'dclid', 'yclid', 'mc_cid', 'mc_eid', '_ga', '_gl',
+                    'sessionid', 'phpsessid', 'jsessionid', 'sid', 'ref', 'referrer'}
+_DEFAULT_PORTS = {'http': '80', 'https': '443'}
+_NON_HTML_EXTENSIONS = ('.pdf', '.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.ico', '.zip', '.gz',
+                        '.doc', '.docx', '.xls', '.xlsx', '.ppt', '.pptx', '.mp3', '.mp4', '.avi', '.mov',
+                        '.css', '.js', '.xml', '.json', '.woff', '.woff2', '.ttf')
+
+
+def keyword_pattern(keywords):
+    """
+    One compiled regex that finds any of `keywords`. The keywords are merged
+    into a trie first ('contact', 'contact us' -> 'contact(?: us)?'), so at
+    each position of the text the regex follows one branch per character
+    instead of trying every keyword in turn.
+    """
+    trie = {}
+    for keyword in keywords:
+        node = trie
+        for char in keyword:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def alternation(node):
+        branches = [re.escape(char) + alternation(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        if len(branches) == 1 and '' not in node:
+            return branches[0]
+        # A keyword may also end here, in which case the rest is optional
+        return '(?:' + '|'.join(branches) + ')' + ('?' if '' in node else '')
+
+    return re.compile(alternation(trie))
+
+
+# Compiled once for every language of SUBPAGE_KEYWORDS
+SUBPAGE_KEYWORD_PATTERNS = {language: keyword_pattern(keywords) for language, keywords in SUBPAGE_KEYWORDS.items()}
+
+
+def _keyword_weight(keyword):
+    if any(fragment in keyword for fragment in _STRONG_FRAGMENTS):
+        return 3
+    if any(fragment in keyword for fragment in _MEDIUM_FRAGMENTS):
+        return 2
+    return 1
+
+
+def _build_weight_patterns():
+    tiers = {}
+    for keyword in set(itertools.chain(CONTACT_KEYWORDS, *SUBPAGE_KEYWORDS.values())):
+        tiers.setdefault(_keyword_weight(keyword), []).append(keyword)
+    # One keyword_pattern per weight, strongest first, so the first match is the best one
+    return [(weight, keyword_pattern(tiers[weight])) for weight in sorted(tiers, reverse=True)]
+
+
+WEIGHT_PATTERNS = _build_weight_patterns()
+
+
+def _best_weight(text):
+    if not text:
+        return 0
+    for weight, pattern in WEIGHT_PATTERNS:
+        if pattern.search(text):
+            return weight
+    return 0
+
+
+def score_link(url, link_text=''):
+    """Priority of a candidate link: best keyword weight in its link text plus in its path, 0 if none."""
+    path = unquote(urlsplit(url).path).lower()
+    return _best_weight(link_text.strip().lower()) + _best_weight(path)
+
+
+def bare_host(url):
+    """Lowercased host of a URL without port or a leading www."""
+    host = (urlsplit(url).hostname or '').lower()
+    return host[4:] if host.startswith('www.') else host
+
+
+def normalize_url(url):
+    """
+    Dedup key for a page URL: scheme, www. and default ports dropped, no
+    fragment, no trailing slash, no path parameters and no tracking query
+    parameters, with the remaining parameters sorted.
+    """
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = bare_host(url)
+    port = parts.port if parts.netloc else None
+    netloc = host if port is None or str(port) == _DEFAULT_PORTS.get(scheme) else f"{host}:{port}"
+    path = parts.path.split(';', 1)[0].rstrip('/') or '/'
+    query = [(key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+             if key.lower() not in _TRACKING_PARAMS and not key.lower().startswith('utm_')]
+    return urlunsplit(('', netloc, path, urlencode(sorted(query)), ''))
+
+
+def is_high_confidence(email, site_host):
+    """An address on the site's own domain (or a parent/sub domain of it)."""
+    domain = email.rsplit('@', 1)[-1].lower()
+    return domain == site_host or domain.endswith('.' + site_host) or site_host.endswith('.' + domain)
+
+
+class FrontierStats:
+    """
+    Pages fetched per site across all crawls, for tuning the page budget, and
+    how many sites only the script evaluation tier found emails for.
+    """
+
+    def __init__(self):
+        self.sites = 0
+        self.pages = 0
+        self.without_emails = 0
+        self.resolved_by_eval = 0
+        self.stopped_early = 0
+        self.budget_exhausted = 0
+        self.deadline_reached = 0
+        self.pages_per_site = Counter()
+        self.lock = threading.Lock()
+
+    def record(self, frontier):
+        with self.lock:
+            self.sites += 1
+            self.pages += frontier.pages_fetched
+            self.pages_per_site[frontier.pages_fetched] += 1
+            if not frontier.emails:
+                self.without_emails += 1
+            elif frontier.resolved_by_eval:
+                self.resolved_by_eval += 1
+            if frontier.stopped_early:
+                self.stopped_early += 1
+            if frontier.budget_exhausted:
+                self.budget_exhausted += 1
+            if frontier.deadline_reached:
+                self.deadline_reached += 1
+
+    def as_dict(self):
+        with self.lock:
+            # Sites the plain scan found nothing on, which would all have needed a browser
+            missed = self.without_emails + self.resolved_by_eval
+            return {
+                'sites': self.sites,
+                'pages_fetched': self.pages,
+                'avg_pages_per_site': round(self.pages / self.sites, 2) if self.sites else 0.0,
+                'stopped_early': self.stopped_early,
+                'budget_exhausted': self.budget_exhausted,
+                'deadline_reached': self.deadline_reached,
+                'resolved_by_eval': self.resolved_by_eval,
+                'eval_resolved_rate': round(self.resolved_by_eval / missed, 3) if missed else 0.0,
+                'pages_per_site': dict(sorted(self.pages_per_site.items())),
+            }
+
+
+def site_deadline(seconds=None):
+    """time.monotonic() value a site crawl starting now must finish by, or None without a deadline."""
+    seconds = SITE_DEADLINE if seconds is None else seconds
+    return time.monotonic() + seconds if seconds > 0 else None
+
+
+class SiteFrontier:
+    def __init__(self, start_url, page_budget=None, max_depth=None, stop_early=None, deadline=None):
+        self.start_url = start_url
+        self.site_host = bare_host(start_url)
+        self.page_budget = FRONTIER_PAGE_BUDGET if page_budget is None else page_budget
+        self.max_depth = FRONTIER_MAX_DEPTH if max_depth is None else max_depth
+        self.stop_early = FRONTIER_STOP_EARLY if stop_early is None else stop_early
+        self.emails = set()
+        # Whether any page had an address without the script evaluation tier
+        self.found_without_eval = False
+        self.pages_fetched = 0
+        self.stopped_early = False
+        self.deadline = site_deadline() if deadline is None else deadline
+        self.deadline_reached = False
+        self._heap = []
+        self._order = itertools.count()
+        self._seen = set()
+        self.push(start_url, float('inf'), 0)
+
+    def push(self, url, score, depth):
+        """Queue a URL unless an equivalent one was already queued. Returns True if queued."""
+        key = normalize_url(url)
+        if key in self._seen:
+            return False
+        self._seen.add(key)
+        heapq.heappush(self._heap, (-score, depth, next(self._order), url))
+        return True
+
+    def pop(self):
+        """
+        Next (url, depth) to fetch, best score first, shallower first on ties.
+        Returns None once the crawl stopped early, the budget is spent, the
+        deadline has passed or nothing is left. Every URL handed out counts
+        against the budget.
+        """
+        if self.stopped_early or self.pages_fetched >= self.page_budget or not self._heap:
+            return None
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.deadline_reached = True
+            return None
+        _, depth, _, url = heapq.heappop(self._heap)
+        self.pages_fetched += 1
+        return url, depth
+
+    @property
+    def budget_exhausted(self):
+        return self.pages_fetched >= self.page_budget and bool(self._heap)
+
+    @property
+    def resolved_by_eval(self):
+        """Found addresses, but only through the script evaluation tier."""
+        return bool(self.emails) and not self.found_without_eval
+
+    def add_page(self, url, depth, scan):
+        """Take the emails and candidate links from the PageScan of a fetched page."""
+        self.emails.update(scan.emails)
+        if scan.emails - scan.evaluated_emails:
+            self.found_without_eval = True
+        if self.stop_early and any(is_high_confidence(email, self.site_host) for email in scan.emails):
+            self.stopped_early = True
+            return
+        if depth >= self.max_depth:
+            return
+        for href, link_text in scan.links:
+            try:
+                full_url = urljoin(url, href.strip()).split('#', 1)[0]
+                parts = urlsplit(full_url)
+                if parts.scheme not in ('http', 'https') or bare_host(full_url) != self.site_host:
+                    continue
+                if parts.path.lower().endswith(_NON_HTML_EXTENSIONS):
+                    continue
+                score = score_link(full_url, link_text or '')
+                if score > 0:
+                    self.push(full_url, score, depth + 1)
+            except ValueError:
+                # A malformed link (port that is not a number, unclosed IPv6
+                # bracket) is skipped, not the rest of the page
+                continue
+
+    def summary(self):
+        if self.stopped_early:
+            reason = 'stopped early'
+        elif self.deadline_reached:
+            reason = 'deadline reached'
+        elif self.budget_exhausted:
+            reason = 'budget exhausted'
+        else:
+            reason = 'frontier empty'
+        return f"Fetched {self.pages_fetched} page(s) for {self.start_url} ({reason})"
+
+
+_frontier_stats = None
+_frontier_stats_lock = threading.Lock()
+
+
+def get_frontier_stats():
+    """Process-wide pages-per-site counters shared by every crawl path."""
+    global _frontier_stats
+    with _frontier_stats_lock:
+        if _frontier_stats is None:
+            _frontier_stats = FrontierStats()
+        return _frontier_stats
+
+
+def finish_frontier(frontier):
+    """Record a finished site in the shared stats and print its pages-fetched line."""
+    get_frontier_stats().record(frontier)
+    print(frontier.summary())
+
+
+def crawl_site(url, fetch_page, page_budget=None, max_depth=None, stop_early=None, first_page=None, deadline=None):
+    """
+    Crawl one site through a SiteFrontier. `fetch_page(url, deadline)` returns
+    the page's PageScan, or None if it could not be fetched by the site's
+    deadline. `first_page` is the PageScan of `url` when the caller already
+    fetched it, and `deadline` the site_deadline() the caller started from.
+    Returns (emails, pages fetched).
+    """
+    frontier = SiteFrontier(url, page_budget=page_budget, max_depth=max_depth, stop_early=stop_early,
+                            deadline=deadline)
+    while True:
+        item = frontier.pop()
+        if item is None:
+            break
+        page_url, depth = item
+        if first_page is not None and page_url == url:
+            scan = first_page
+        else:
+            scan = fetch_page(page_url, frontier.deadline)
+        if scan is not None:
+            frontier.add_page(page_url, depth, scan)
+    finish_frontier(frontier)
+    return frontier.emails, frontier.pages_fetched
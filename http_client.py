@@ -0,0 +1,382 @@
+"""
+Shared HTTP client for the static crawl.
+
+All page fetches go through one client so that the homepage and every
+contact/about subpage on the same host reuse a kept-alive connection instead
+of paying for a new TCP+TLS handshake each time. The default backend is a
+requests.Session with bounded per-host urllib3 pools; if httpx (with h2) is
+installed, HTTP_CLIENT_BACKEND=httpx switches to an HTTP/2-capable client.
+Either way callers get a requests-style response and requests exceptions.
+
+Requests also go through the per-host politeness scheduler: each one waits
+for a slot on its host, and a 429/503 answer is retried after the backoff the
+scheduler picks (Retry-After when the server sends one).
+
+With the requests backend, new connections take their address from the
+shared DNS cache (dns_cache.py) instead of resolving the host again.
+
+Crawled pages are fetched with get_page(), which streams the body: a
+response whose Content-Type is not HTML is dropped before its body is read,
+at most MAX_PAGE_BYTES are kept of any page, and the whole fetch (waiting
+for a host slot, connecting, reading) has to finish before the site's
+deadline.
+
+Each page fetch reports its fetch, wait and download times, and every new
+connection its dns and connect times, to the stage metrics (metrics.py).
+"""
+import os
+import socket
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import (ConnectTimeoutError, HTTPError as Urllib3Error, NameResolutionError,
+                                NewConnectionError, ReadTimeoutError)
+
+from dns_cache import get_dns_cache
+from metrics import observe, timed
+from politeness import SlotTimeout, get_host_scheduler, host_key
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+DEFAULT_HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36"
+}
+
+HTTP_CLIENT_BACKEND = os.environ.get('HTTP_CLIENT_BACKEND', 'requests')
+# Number of distinct hosts to keep pools for, and connections kept per host.
+HTTP_POOL_HOSTS = int(os.environ.get('HTTP_POOL_HOSTS', 200))
+HTTP_POOL_PER_HOST = int(os.environ.get('HTTP_POOL_PER_HOST', 4))
+# How many times a 429/503 response is retried after backing off.
+HTTP_THROTTLE_RETRIES = int(os.environ.get('HTTP_THROTTLE_RETRIES', 2))
+# Bytes of a page body the crawler reads before it stops downloading and uses what it has.
+MAX_PAGE_BYTES = int(os.environ.get('MAX_PAGE_BYTES', 2 * 1024 * 1024))
+PAGE_CHUNK_SIZE = 64 * 1024
+# Content types a crawled page may have; a response without a Content-Type is let through.
+PAGE_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain')
+
+
+class NotHtmlError(requests.exceptions.RequestException):
+    """The response's Content-Type is not one the crawler parses."""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """The site's deadline passed before the page was fetched."""
+
+
+class HttpClient:
+    """
+    Thread-safe wrapper around a pooled session.
+
+    keep_alive=False sends `Connection: close` on every request, reproducing the
+    old one-connection-per-request behaviour (used by the benchmarks).
+    scheduler=None uses the shared politeness scheduler; pass False to disable it.
+    dns_cache works the same way for the shared DNS cache.
+    """
+
+    def __init__(self, backend=HTTP_CLIENT_BACKEND, pool_hosts=HTTP_POOL_HOSTS,
+                 pool_per_host=HTTP_POOL_PER_HOST, keep_alive=True, scheduler=None,
+                 throttle_retries=HTTP_THROTTLE_RETRIES, dns_cache=None):
+        if backend == 'httpx' and httpx is None:
+            print("httpx is not installed, falling back to the requests backend")
+            backend = 'requests'
+        self.backend = backend
+        self.keep_alive = keep_alive
+        self.scheduler = get_host_scheduler() if scheduler is None else (scheduler or None)
+        self.throttle_retries = throttle_retries
+        if backend == 'httpx':
+            limits = httpx.Limits(max_connections=pool_hosts * pool_per_host,
+                                  max_keepalive_connections=pool_hosts * pool_per_host)
+            try:
+                self._client = httpx.Client(http2=True, limits=limits, follow_redirects=True)
+            except ImportError:
+                # http2=True needs the optional h2 package.
+                self._client = httpx.Client(limits=limits, follow_redirects=True)
+        else:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_per_host)
+            self.dns_cache = get_dns_cache() if dns_cache is None else (dns_cache or None)
+            adapter.poolmanager.pool_classes_by_scheme = _timed_pool_classes(self.dns_cache)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            self._adapter = adapter
+            self._client = session
+
+    def _headers(self, headers):
+        merged = dict(DEFAULT_HEADERS)
+        merged.update(headers or {})
+        if not self.keep_alive:
+            merged['Connection'] = 'close'
+        return merged
+
+    def get(self, url, headers=None, timeout=10, **kwargs):
+        return self._send(url, lambda: self._get(url, headers, timeout, **kwargs))
+
+    def get_page(self, url, headers=None, timeout=10, max_bytes=None, deadline=None, limit=None):
+        """
+        Fetch a page for the crawler. The body is streamed and only read for an
+        HTML content type (NotHtmlError otherwise); reading stops after
+        `max_bytes` (MAX_PAGE_BYTES by default) and the response keeps what was
+        read. `deadline` is a time.monotonic() value the fetch must finish by;
+        `timeout` is capped by it and DeadlineExceeded is raised once it passes.
+        `limit` (a concurrency.AdaptiveLimit) is held only while a request is
+        on the wire, after the wait for the host's slot and any backoff; an
+        exception or HTTP error status counts as one of its errors.
+        """
+        max_bytes = MAX_PAGE_BYTES if max_bytes is None else max_bytes
+
+        def send():
+            return self._get_page(url, headers, timeout, max_bytes, deadline)
+
+        with timed('fetch', url):
+            return self._send(url, _limited(send, limit) if limit is not None else send, deadline)
+
+    def _send(self, url, send, deadline=None):
+        if self.scheduler is None:
+            return send()
+        host = host_key(url)
+        for attempt in range(self.throttle_retries + 1):
+            try:
+                with self.scheduler.slot(host, deadline):
+                    response = send()
+            except SlotTimeout as e:
+                raise DeadlineExceeded(f"Site deadline passed while waiting for a slot on {host} for {url}") from e
+            delay = self.scheduler.report(host, response.status_code, response.headers.get('Retry-After'))
+            if delay is None or attempt == self.throttle_retries:
+                return response
+            print(f"{host} answered HTTP {response.status_code}, retrying in {delay:.1f}s")
+        return response
+
+    def _get(self, url, headers, timeout, **kwargs):
+        if self.backend == 'httpx':
+            try:
+                response = self._client.get(url, headers=self._headers(headers), timeout=timeout, **kwargs)
+            except httpx.HTTPError as e:
+                raise requests.exceptions.RequestException(str(e))
+            return _HttpxResponse(response)
+        return self._client.get(url, headers=self._headers(headers), timeout=timeout, **kwargs)
+
+    def _get_page(self, url, headers, timeout, max_bytes, deadline):
+        timeout = _remaining(url, timeout, deadline)
+        if self.backend == 'httpx':
+            try:
+                with timed('wait', url):
+                    response = self._client.send(self._client.build_request('GET', url, headers=self._headers(headers),
+                                                                            timeout=timeout), stream=True)
+            except httpx.HTTPError as e:
+                raise requests.exceptions.RequestException(str(e))
+            try:
+                with timed('download', url):
+                    response._content = _read_body(url, response.status_code, response.headers,
+                                                   response.iter_bytes(PAGE_CHUNK_SIZE), max_bytes, deadline)
+            except httpx.HTTPError as e:
+                raise requests.exceptions.RequestException(str(e))
+            finally:
+                response.close()
+            return _HttpxResponse(response)
+        with timed('wait', url):
+            response = self._client.get(url, headers=self._headers(headers), timeout=timeout, stream=True)
+        download_start = time.perf_counter()
+        try:
+            # read1 returns whatever the socket has, so a slow-drip body still
+            # gets its deadline checked between reads
+            if hasattr(response.raw, 'read1'):
+                chunks = iter(lambda: response.raw.read1(PAGE_CHUNK_SIZE, decode_content=True), b'')
+            else:
+                chunks = response.iter_content(PAGE_CHUNK_SIZE)
+            response._content = _read_body(url, response.status_code, response.headers, chunks, max_bytes, deadline)
+        except ReadTimeoutError as e:
+            response.close()
+            raise requests.exceptions.ReadTimeout(e)
+        except Urllib3Error as e:
+            response.close()
+            raise requests.exceptions.ConnectionError(e)
+        except Exception:
+            response.close()
+            raise
+        finally:
+            observe('download', time.perf_counter() - download_start, url)
+        if not response.raw.closed:
+            # Reading stopped before the end of the body, so the connection
+            # cannot go back to the pool with the rest still unread
+            response.raw.close()
+        response._content_consumed = True
+        response.close()
+        return response
+
+    def connection_stats(self):
+        """Connections opened so far, summed over every host pool (requests backend only)."""
+        if self.backend != 'requests':
+            return {}
+        pools = self._adapter.poolmanager.pools
+        opened = 0
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is not None:
+                opened += pool.num_connections
+        return {'hosts': len(pools), 'connections_opened': opened}
+
+    def close(self):
+        self._client.close()
+
+
+def _remaining(url, timeout, deadline):
+    """`timeout` capped by what is left before `deadline`."""
+    if deadline is None:
+        return timeout
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise DeadlineExceeded(f"Site deadline passed before fetching {url}")
+    return min(timeout, remaining)
+
+
+def is_page_content_type(content_type):
+    if not content_type:
+        return True
+    return content_type.split(';', 1)[0].strip().lower() in PAGE_CONTENT_TYPES
+
+
+def _read_body(url, status_code, headers, chunks, max_bytes, deadline):
+    """Read a streamed page body within the byte budget and the deadline."""
+    if status_code >= 400:
+        # raise_for_status() will reject it; the body is never used
+        return b''
+    content_type = headers.get('Content-Type')
+    if not is_page_content_type(content_type):
+        raise NotHtmlError(f"Skipped {url}: content type {content_type}")
+    body = bytearray()
+    for chunk in chunks:
+        body += chunk
+        if len(body) >= max_bytes:
+            print(f"Stopped reading {url} after {max_bytes} bytes")
+            del body[max_bytes:]
+            break
+        if deadline is not None and time.monotonic() >= deadline:
+            raise DeadlineExceeded(f"Site deadline passed while reading {url} ({len(body)} bytes read)")
+    return bytes(body)
+
+
+def _limited(send, limit):
+    """`send` holding a slot of `limit` while it runs."""
+    def limited():
+        limit.acquire()
+        failed = True
+        try:
+            response = send()
+            failed = response.status_code >= 400
+            return response
+        finally:
+            limit.release(failed)
+    return limited
+
+
+def _timed_pool_classes(cache):
+    """
+    urllib3 pool classes whose connections time their dns lookup and connect,
+    and connect to `cache`'s addresses for the host (the system resolver's
+    when `cache` is None, whose lookup then counts as connect time). Like
+    socket.create_connection, each address is tried in turn until one
+    connects, so a dead first record or an IPv6 record on a host without
+    IPv6 does not fail the host.
+    """
+
+    def new_conn(base):
+        def _new_conn(self):
+            if cache is None:
+                return base._new_conn(self)
+            # Only the socket connects to the cached address; TLS SNI and the
+            # Host header keep using the hostname.
+            hostname = self._dns_host
+            start = time.perf_counter()
+            try:
+                addresses = cache.resolve(hostname)
+            except socket.gaierror as e:
+                raise NameResolutionError(hostname, self, e) from e
+            finally:
+                self._dns_seconds = time.perf_counter() - start
+                observe('dns', self._dns_seconds)
+            error = None
+            try:
+                for address in addresses:
+                    self._dns_host = address
+                    try:
+                        return base._new_conn(self)
+                    except (NewConnectionError, ConnectTimeoutError) as e:
+                        error = e
+                raise error or NewConnectionError(self, f"No addresses for {hostname}")
+            finally:
+                self._dns_host = hostname
+        return _new_conn
+
+    def connect(base):
+        def _connect(self):
+            self._dns_seconds = 0.0
+            start = time.perf_counter()
+            try:
+                return base.connect(self)
+            finally:
+                observe('connect', time.perf_counter() - start - self._dns_seconds)
+        return _connect
+
+    http_conn = type('TimedHTTPConnection', (HTTPConnection,),
+                     {'_new_conn': new_conn(HTTPConnection), 'connect': connect(HTTPConnection)})
+    https_conn = type('TimedHTTPSConnection', (HTTPSConnection,),
+                      {'_new_conn': new_conn(HTTPSConnection), 'connect': connect(HTTPSConnection)})
+    return {
+        'http': type('TimedHTTPConnectionPool', (HTTPConnectionPool,), {'ConnectionCls': http_conn}),
+        'https': type('TimedHTTPSConnectionPool', (HTTPSConnectionPool,), {'ConnectionCls': https_conn}),
+    }
+
+
+class _HttpxResponse:
+    """Makes an httpx response look enough like a requests one for the crawler."""
+
+    def __init__(self, response):
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.url = str(response.url)
+        self.http_version = response.http_version
+
+    @property
+    def text(self):
+        return self._response.text
+
+    @property
+    def content(self):
+        return self._response.content
+
+    def raise_for_status(self):
+        try:
+            self._response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            raise requests.exceptions.HTTPError(str(e), response=self)
+
+
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
+
+def get_http_client():
+    """Return the process-wide client, creating it on first use."""
+    global _shared_client
+    with _shared_client_lock:
+        if _shared_client is None:
+            _shared_client = HttpClient()
+        return _shared_client
+
+
+def configure_http_client(**kwargs):
+    """Replace the process-wide client, e.g. to change pool sizes or the backend."""
+    global _shared_client
+    with _shared_client_lock:
+        old, _shared_client = _shared_client, HttpClient(**kwargs)
+    if old is not None:
+        old.close()
+    return _shared_client
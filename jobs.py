@@ -0,0 +1,230 @@
+"""
+Background job runner for uploads.
+
+An upload becomes a Job: the request returns its ID immediately and the client
+polls for progress, then downloads the finished workbook. All jobs share one
+fixed set of crawler threads, which take work from the active jobs in
+round-robin order, so a large upload cannot starve a small one and no upload
+spins up a pool of its own. There are as many threads as the concurrency
+controller can keep busy (its static and render limits at their maximum),
+and those limits decide how many of them fetch at a time; JOB_CRAWL_WORKERS
+sets a fixed number instead. The number of unfinished jobs is bounded; further
+submissions are rejected until one completes. A caller can choose the job's
+ID (the checkpointed apps use the upload's checkpoint ID); submitting an ID
+that is still queued or running returns the existing job.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from concurrency import get_concurrency_controller
+
+# 0 sizes the crawler threads from the concurrency controller
+JOB_CRAWL_WORKERS = int(os.environ.get('JOB_CRAWL_WORKERS', 0))
+MAX_PENDING_JOBS = int(os.environ.get('MAX_PENDING_JOBS', 10))
+JOB_OUTPUT_DIR = os.environ.get('JOB_OUTPUT_DIR', 'job_output')
+# Finished jobs (and their output files) are forgotten after this many seconds.
+JOB_RETENTION = int(os.environ.get('JOB_RETENTION', 24 * 3600))
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def count_emails(result):
+    """Number of addresses in a comma-separated result cell."""
+    if not isinstance(result, str) or '@' not in result:
+        return 0
+    return sum(1 for part in result.split(',') if '@' in part)
+
+
+class Job:
+    def __init__(self, name, items, process_fn, finalize_fn, progress_fn=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex
+        self.name = name
+        self.items = items
+        self.process_fn = process_fn
+        self.finalize_fn = finalize_fn
+        self.progress_fn = progress_fn
+        self.total = len(items)
+        self.results = [None] * self.total
+        self.status = 'queued'
+        self.error = None
+        self.output_path = None
+        self.done = 0
+        self.rows_with_emails = 0
+        self.emails_found = 0
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._next_index = 0
+        self._lock = threading.Lock()
+
+    def _record(self, index, result):
+        with self._lock:
+            self.results[index] = result
+            self.done += 1
+            found = count_emails(result)
+            self.emails_found += found
+            if found:
+                self.rows_with_emails += 1
+            return self.done == self.total
+
+    def progress(self):
+        with self._lock:
+            now = self.finished or time.time()
+            elapsed = now - self.started if self.started else 0.0
+            throughput = self.done / elapsed if elapsed > 0 else 0.0
+            remaining = self.total - self.done
+            if self.status == 'done':
+                eta = 0.0
+            elif throughput > 0:
+                eta = remaining / throughput
+            else:
+                eta = None
+            progress = {
+                'job_id': self.id,
+                'name': self.name,
+                'status': self.status,
+                'rows_total': self.total,
+                'rows_done': self.done,
+                'rows_with_emails': self.rows_with_emails,
+                'emails_found': self.emails_found,
+                'elapsed_seconds': round(elapsed, 1),
+                'urls_per_sec': round(throughput, 3),
+                'eta_seconds': round(eta, 1) if eta is not None else None,
+                'error': self.error,
+            }
+        if self.progress_fn is not None:
+            progress.update(self.progress_fn())
+        return progress
+
+
+class JobManager:
+    """
+    Owns the shared crawler threads and the table of jobs.
+
+    process_fn(item) is called once per item on a crawler thread; once every
+    item of a job has a result, finalize_fn(results) is called and must return
+    the bytes (or a file-like object) of the output file. progress_fn, if
+    given, returns extra fields to merge into the job's progress report.
+    """
+
+    def __init__(self, workers=JOB_CRAWL_WORKERS, max_pending_jobs=MAX_PENDING_JOBS, output_dir=JOB_OUTPUT_DIR):
+        self.workers = workers or get_concurrency_controller().row_workers()
+        self.max_pending_jobs = max_pending_jobs
+        self.output_dir = output_dir
+        self._jobs = {}
+        self._active = deque()
+        self._cond = threading.Condition()
+        self._threads = []
+
+    def _start_threads(self):
+        if self._threads:
+            return
+        os.makedirs(self.output_dir, exist_ok=True)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-crawler-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def submit(self, name, items, process_fn, finalize_fn, progress_fn=None, job_id=None):
+        items = list(items)
+        with self._cond:
+            self._forget_expired()
+            existing = self._jobs.get(job_id) if job_id else None
+            if existing is not None and existing.status in ('queued', 'running'):
+                return existing
+            pending = self._pending()
+            if pending >= self.max_pending_jobs:
+                raise JobQueueFull(f"{pending} jobs are already queued or running, try again later")
+            self._start_threads()
+            job = Job(name, items, process_fn, finalize_fn, progress_fn=progress_fn, job_id=job_id)
+            self._jobs[job.id] = job
+            if job.total:
+                self._active.append(job)
+                self._cond.notify_all()
+        if not job.total:
+            self._finalize(job)
+        return job
+
+    def get(self, job_id):
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def pending_count(self):
+        """Jobs queued or running."""
+        with self._cond:
+            return self._pending()
+
+    def _pending(self):
+        return sum(1 for job in self._jobs.values() if job.status in ('queued', 'running'))
+
+    def _next_task(self):
+        """Take one item from the job at the head of the queue and rotate it to the back."""
+        with self._cond:
+            while not self._active:
+                self._cond.wait()
+            job = self._active.popleft()
+            index = job._next_index
+            job._next_index += 1
+            if job._next_index < job.total:
+                self._active.append(job)
+            if job.status == 'queued':
+                job.status = 'running'
+                job.started = time.time()
+            return job, index
+
+    def _worker_loop(self):
+        while True:
+            job, index = self._next_task()
+            try:
+                result = job.process_fn(job.items[index])
+            except Exception as e:
+                result = f"Error: {str(e)}"
+            if job._record(index, result):
+                self._finalize(job)
+
+    def _finalize(self, job):
+        if job.started is None:
+            job.started = time.time()
+        try:
+            output = job.finalize_fn(job.results)
+            path = os.path.join(self.output_dir, f"{job.id}.out")
+            data = output.getvalue() if hasattr(output, 'getvalue') else output
+            with open(path, 'wb') as f:
+                f.write(data)
+            job.output_path = path
+            job.status = 'done'
+        except Exception as e:
+            print(f"Job {job.id} failed while writing output: {e}")
+            job.error = str(e)
+            job.status = 'failed'
+        job.finished = time.time()
+        # Results now live in the output file.
+        job.results = None
+        job.items = None
+        print(f"Job {job.id} ({job.name}) {job.status}: {job.progress()}")
+
+    def _forget_expired(self):
+        cutoff = time.time() - JOB_RETENTION
+        for job_id, job in list(self._jobs.items()):
+            if job.finished and job.finished < cutoff:
+                if job.output_path and os.path.exists(job.output_path):
+                    os.remove(job.output_path)
+                del self._jobs[job_id]
+
+
+_shared_manager = None
+_shared_manager_lock = threading.Lock()
+
+
+def get_job_manager():
+    """Return the process-wide job manager."""
+    global _shared_manager
+    with _shared_manager_lock:
+        if _shared_manager is None:
+            _shared_manager = JobManager()
+        return _shared_manager
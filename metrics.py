@@ -0,0 +1,201 @@
+"""
+Per-stage timing for the crawler.
+
+Code on the crawl path wraps each stage in timed(stage), or reports a
+duration it already measured with observe(). The stages are:
+
+  url            one sheet URL from start to result
+  fetch          one static page: host slot, request and body
+  wait           request sent until the response headers (new connections included)
+  dns            DNS cache lookup for a new connection
+  connect        TCP connect and TLS handshake of a new connection
+  download       reading the response body
+  parse          parsing a page into a PageScan (regex included)
+  regex          the email regexes over a page's text and scripts
+  browser_start  launching Chrome
+  render_load    Chrome loading a page
+  render_wait    waiting for a rendered page to settle
+
+Every observation lands in a per-stage histogram; render_prometheus() turns
+them into the Prometheus text format served at /metrics. Work done for a
+sheet URL runs inside url_timing(url), which also adds up that URL's stages:
+when it ends, one JSON line with the URL's total and per-stage seconds goes
+to the 'crawler.timing' logger and, for traced jobs, to the job's JobTrace
+together with every individual stage. The URL is tracked per thread, so
+stages measured on other threads (hedged renders, the pipeline's fetch
+threads) only reach the histograms. METRICS_ENABLED=0 makes all of it a no-op.
+"""
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
+TRACE_DIR = os.environ.get('TRACE_DIR', 'job_traces')
+STAGE_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+timing_log = logging.getLogger('crawler.timing')
+
+_local = threading.local()
+
+
+class Histogram:
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        # One slot per bucket plus the +Inf overflow
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+class StageMetrics:
+    """Thread-safe per-stage histograms."""
+
+    def __init__(self, buckets=STAGE_BUCKETS):
+        self.buckets = buckets
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._histograms.get(stage)
+            if histogram is None:
+                histogram = self._histograms[stage] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def snapshot(self):
+        """{stage: {'count', 'sum', 'avg'}} for every stage seen so far."""
+        with self._lock:
+            return {
+                stage: {'count': h.count, 'sum': round(h.sum, 4), 'avg': round(h.sum / h.count, 4) if h.count else 0.0}
+                for stage, h in sorted(self._histograms.items())
+            }
+
+    def render_prometheus(self, gauges=None):
+        """
+        Prometheus text exposition of the stage histograms, plus `gauges`
+        ({metric name: value}) as untyped samples.
+        """
+        lines = ['# HELP crawler_stage_seconds Time spent in each crawl stage.',
+                 '# TYPE crawler_stage_seconds histogram']
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, histogram.counts):
+                    cumulative += count
+                    lines.append(f'crawler_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'crawler_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'crawler_stage_seconds_sum{{stage="{stage}"}} {histogram.sum:.6f}')
+                lines.append(f'crawler_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+        for name, value in sorted((gauges or {}).items()):
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+class JobTrace:
+    """Every stage of a job's URLs, one JSON object per line, in TRACE_DIR/<job id>.jsonl."""
+
+    def __init__(self, job_id, directory=TRACE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = self.path_for(job_id, directory)
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def path_for(job_id, directory=TRACE_DIR):
+        return os.path.join(directory, f"{job_id}.jsonl")
+
+    def write(self, event):
+        line = json.dumps(event) + '\n'
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(line)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class UrlTiming:
+    def __init__(self, url, trace=None):
+        self.url = url
+        self.trace = trace
+        self.stages = {}
+        self.result = None
+
+    def add(self, stage, seconds, page=None):
+        self.stages[stage] = self.stages.get(stage, 0.0) + seconds
+        if self.trace is not None:
+            self.trace.write({'time': time.time(), 'url': self.url, 'page': page, 'stage': stage,
+                              'seconds': round(seconds, 6)})
+
+
+def observe(stage, seconds, page=None):
+    """Record `seconds` spent in `stage` (for `page`, if it is about one page)."""
+    if not METRICS_ENABLED:
+        return
+    get_stage_metrics().observe(stage, seconds)
+    timing = getattr(_local, 'timing', None)
+    if timing is not None:
+        timing.add(stage, seconds, page)
+
+
+@contextmanager
+def timed(stage, page=None):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - start, page)
+
+
+@contextmanager
+def url_timing(url, trace=None):
+    """
+    Time one sheet URL on this thread. Yields its UrlTiming (None when metrics
+    are off); setting `.result` adds the result to the summary line.
+    """
+    if not METRICS_ENABLED:
+        yield None
+        return
+    timing = UrlTiming(url, trace)
+    outer = getattr(_local, 'timing', None)
+    _local.timing = timing
+    start = time.perf_counter()
+    try:
+        yield timing
+    finally:
+        _local.timing = outer
+        seconds = time.perf_counter() - start
+        get_stage_metrics().observe('url', seconds)
+        summary = {'url': url if isinstance(url, str) else None, 'seconds': round(seconds, 4),
+                   'stages': {stage: round(total, 4) for stage, total in timing.stages.items()}}
+        if timing.result is not None:
+            summary['result'] = timing.result
+        if timing_log.isEnabledFor(logging.INFO):
+            timing_log.info(json.dumps(summary))
+        if trace is not None:
+            trace.write(dict(summary, time=time.time(), stage='url'))
+
+
+_shared_metrics = None
+_shared_metrics_lock = threading.Lock()
+
+
+def get_stage_metrics():
+    """Return the process-wide stage histograms."""
+    global _shared_metrics
+    # Checked before taking the lock, since this runs on every observation
+    if _shared_metrics is None:
+        with _shared_metrics_lock:
+            if _shared_metrics is None:
+                _shared_metrics = StageMetrics()
+    return _shared_metrics
@@ -1,19 +1,43 @@
 # import sys
 # sys.path.append('./env/lib/site-packages')
-from flask import Flask, request, render_template, send_file
+from flask import Flask, request, render_template, send_file, jsonify, url_for
 import pandas as pd
 import requests
-from bs4 import BeautifulSoup
-import re
 from io import BytesIO
-from concurrent.futures import ThreadPoolExecutor
-from urllib.parse import urlparse, urljoin
+from functools import partial
 import os
-import shutil
+import logging
+from logging.handlers import RotatingFileHandler
+import uuid
+from http_client import get_http_client
+from result_cache import CacheStats, get_result_cache
+from jobs import JobQueueFull, get_job_manager
+from crawl_engine import host_of, run_crawl
+from page_parser import parse_page
+from sheet_io import SheetReader, SheetWriter, sheet_format, stream_sheet
+from frontier import crawl_site
+from dns_cache import DOMAIN_NOT_FOUND, domain_missing, pre_resolve_in_background, pre_resolve_urls
+from url_dedup import DedupStats, SharedResults
+from concurrency import get_concurrency_controller
+from checkpoint import RERUN_KINDS, checkpointed, get_checkpoint_store, row_kind
+from metrics import JobTrace, get_stage_metrics, timing_log, url_timing
 
 app = Flask(__name__)
 application = app
 
+# One JSON line of stage timings per URL (see metrics.py), rotated by size.
+# JOB_TRACE=1 also writes a per-stage trace for every background job.
+TIMING_LOG = os.environ.get('TIMING_LOG', 'logs/crawl_timing.log')
+TIMING_LOG_MAX_BYTES = int(os.environ.get('TIMING_LOG_MAX_BYTES', 10 * 2 ** 20))
+JOB_TRACE = os.environ.get('JOB_TRACE', '0') == '1'
+if TIMING_LOG and not timing_log.handlers:
+    os.makedirs(os.path.dirname(TIMING_LOG) or '.', exist_ok=True)
+    timing_handler = RotatingFileHandler(TIMING_LOG, maxBytes=TIMING_LOG_MAX_BYTES, backupCount=5)
+    timing_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    timing_log.addHandler(timing_handler)
+    timing_log.setLevel(logging.INFO)
+    timing_log.propagate = False
+
 def find_url_column(columns):
     keywords = ['website', 'url', 'websites', 'urls']
     for col in columns:
@@ -21,93 +45,86 @@ def find_url_column(columns):
             return col
     return None
 
-def extract_emails_from_url(url):
-    """Fetch emails from the given URL and explore potential internal links for emails."""
+def extract_emails_from_url(url, cache_stats=None, refresh=False, page_budget=None, max_depth=None):
+    """
+    Fetch emails from the given URL and explore potential internal links for emails.
+    `refresh` ignores a cached result; `page_budget` and `max_depth` override the frontier's limits.
+    """
     if pd.isna(url) or not isinstance(url, str):
         return ""
     print("CKPT1: Starting URL Processing")
     if not url.startswith(('http://', 'https://')):
         url = f"http://{url}"
     print(f"CKPT2: Final URL -> {url}")
-    visited_urls = set()
-    emails = set()
+    cache = get_result_cache()
+    if cache is not None and not refresh:
+        cached = cache.get(url)
+        if cache_stats is not None:
+            cache_stats.record(cached is not None)
+        if cached is not None:
+            print(f"Cache hit for {url} ({cached.method})")
+            return cached.cell
+    if domain_missing(url):
+        print(f"Skipping {url}: domain not found")
+        if cache is not None:
+            cache.put(url, "", 'dns')
+        return DOMAIN_NOT_FOUND
     print("CKPT3: Initialization Complete")
-    keywords = ['contact', 'about', 'get in touch', 'reach us', 'communication','contacts','about the company','contact us']
+    fetched = []
     
-    base_domain = urlparse(url).netloc
-
-    def is_internal_link(link):
-        """Check if a link belongs to the same domain."""
-        return urlparse(link).netloc == base_domain or urlparse(link).netloc == ""
+    def fetch(page_url, deadline=None):
+        scan = fetch_page(page_url, deadline)
+        if scan is not None:
+            fetched.append(page_url)
+        return scan
     
-    def fetch_emails(current_url):
-        if current_url in visited_urls:
-            return
-        visited_urls.add(current_url)
-        try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36"
-            }
-            response = requests.get(current_url, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract emails from the current page text
-            text = ' '.join(soup.stripped_strings)
-            raw_emails = re.findall(r'[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}', text)
-            emails.update([email for email in raw_emails if not email[0].isdigit()])
-            
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                if href.startswith("mailto:"):
-                    email = href.replace("mailto:", "").split("?")[0]
-                    if email and not email[0].isdigit():
-                        emails.add(email)
-            
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                full_url = urljoin(current_url, href)
-                if is_internal_link(full_url) and any(keyword in href.lower() for keyword in keywords):
-                    fetch_emails(full_url)
-        except requests.exceptions.RequestException as e:
-            print(f"RequestException for {current_url}: {e}")
-        except Exception as e:
-            print(f"Error processing {current_url}: {e}")
-
-    fetch_emails(url)
-    return ', '.join(emails) if emails else "No email ID found"
-
-def get_optimal_workers(file_size):
-    """Return optimal number of workers based on the file size."""
-    if file_size <= 100:
-        return 5  
-    elif file_size <= 300:
-        return 10  
-    else:
-        return 20 
-
-def process_urls_in_parallel(df, url_column, num_workers):
-    """Process all URLs in parallel using ThreadPoolExecutor."""
-    with ThreadPoolExecutor(max_workers=num_workers) as executor:
-        return list(executor.map(extract_emails_from_url, df[url_column]))
+    emails, _ = crawl_site(url, fetch, page_budget=page_budget, max_depth=max_depth)
+    result = ', '.join(emails)
+    # A site none of whose pages could be fetched may only be down for now
+    if cache is not None and (result or fetched):
+        cache.put(url, result, 'primary')
+    return result if result else "No email ID found"
+
+def process_single_url(url, trace=None, **kwargs):
+    """extract_emails_from_url(url, **kwargs), with the URL's stage timings logged (and traced)."""
+    with url_timing(url, trace) as timing:
+        result = extract_emails_from_url(url, **kwargs)
+        if timing is not None:
+            timing.result = row_kind(result)
+        return result
+
+def fetch_page(url, deadline=None):
+    """Fetch one page and return its PageScan (emails from mailto links, text and scripts), or None on failure."""
+    try:
+        response = get_http_client().get_page(url, timeout=10, deadline=deadline,
+                                              limit=get_concurrency_controller().static)
+        response.raise_for_status()
+        return parse_page(response.text)
+    except requests.exceptions.RequestException as e:
+        print(f"RequestException for {url}: {e}")
+    except Exception as e:
+        print(f"Error processing {url}: {e}")
+    return None
 
 SPLIT_FOLDER = 'split_processing'
 os.makedirs(SPLIT_FOLDER, exist_ok=True)
 
-def split_excel_file(file, chunk_size=150):
-    """Splits the Excel file into smaller chunks if the size exceeds the limit."""
-    df = pd.read_excel(file)
-    file_name, _ = os.path.splitext(file.filename)
-    split_files = []
-    
-    # Splitting the file into chunks
-    for i, chunk in enumerate(range(0, len(df), chunk_size)):
-        split_file_name = f"{SPLIT_FOLDER}/{file_name}_{i+1}.xlsx"
-        df.iloc[chunk:chunk + chunk_size].to_excel(split_file_name, index=False)
-        split_files.append(split_file_name)
-    
-    return split_files
+MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+# Name under which this app's uploads are checkpointed
+CHECKPOINT_SOURCE = 'newnewapp'
+
+def write_checkpoint_sheet(checkpoint, path):
+    """Write a checkpointed upload with every row's stored result to `path`, streaming both."""
+    results = checkpoint.results()
+    with SheetReader(checkpoint.input_path, checkpoint.format) as reader:
+        with SheetWriter(path, reader.header + ['Emails'], checkpoint.format) as writer:
+            for index, row in enumerate(reader.rows()):
+                writer.append(row + (results.get(index, ""),))
+    return path
 
 @app.route('/')
 def upload_file():
@@ -117,49 +134,238 @@ def upload_file():
 def process_file():    
     file = request.files['file']
 
-    if not file or not file.filename.endswith('.xlsx'):
-        return "Invalid file type. Please upload an Excel file.", 400
+    fmt = sheet_format(file.filename) if file else None
+    if not fmt:
+        return "Invalid file type. Please upload an Excel or CSV file.", 400
+
+    # Both files stay on disk and are streamed, so memory does not grow with the sheet
+    original_file_name, _ = os.path.splitext(file.filename)
+    request_id = uuid.uuid4().hex
+    output_file_path = f"{SPLIT_FOLDER}/{request_id}_output.{fmt}"
 
     try:
-        df = pd.read_excel(file)
-        original_file_name, _ = os.path.splitext(file.filename)
-
-        if len(df) > 150:
-            split_files = split_excel_file(file, chunk_size=150)
-        
-        else:
-            temp_file_path = f"{SPLIT_FOLDER}/{file.filename}"
-            df.to_excel(temp_file_path, index=False)
-            split_files = [temp_file_path]
-
-        combined_df = pd.DataFrame()
-        for split_file in split_files:
-            df_split = pd.read_excel(split_file)
-            url_column = find_url_column(df_split.columns)
+        # The upload is kept with its checkpoint: sending the same file again
+        # skips the rows an interrupted run finished
+        checkpoint = get_checkpoint_store().open_upload(file, fmt, CHECKPOINT_SOURCE, settings='static')
+        input_path = checkpoint.input_path
+        done = checkpoint.reusable_results()
+        if done:
+            print(f"Resuming {file.filename}: {len(done)} rows already checkpointed")
+        checkpoint.set_status('running')
+        cache_stats = CacheStats()
+        dedup_stats = DedupStats()
+        with SheetReader(input_path, fmt) as reader:
+            url_column = find_url_column(reader.header)
             if not url_column:
-                return f"No column found that likely contains URLs in {os.path.basename(split_file)}.", 400
-            
-            num_workers = get_optimal_workers(len(df_split))
-            df_split['Emails'] = process_urls_in_parallel(df_split, url_column, num_workers)
-            
-            combined_df = pd.concat([combined_df, df_split], ignore_index=True)
+                return "No column found that likely contains URLs.", 400
+            url_index = reader.header.index(url_column)
+            num_workers = get_concurrency_controller().row_workers(max(0, (reader.row_count or 0) - len(done)))
+            # A separate streaming pass over the URL column, so every host is resolved up front
+            with SheetReader(input_path, fmt) as host_reader:
+                pre_resolve_urls(row[url_index] for index, row in enumerate(host_reader.rows()) if index not in done)
+            # Rows repeating a site wait for its first row's crawl instead of crawling it again
+            process_url = SharedResults(partial(process_single_url, cache_stats=cache_stats), stats=dedup_stats)
 
-        print('CKPT4 - OUTPUT FILE PROCESS')
-        output_file_path = f"{SPLIT_FOLDER}/{original_file_name}.xlsx"
-        with pd.ExcelWriter(output_file_path, engine='openpyxl') as writer:
-            combined_df.to_excel(writer, index=False)
-
-        response = send_file(output_file_path, as_attachment=True, download_name=f"{original_file_name}.xlsx",
-                         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-        
-        for filename in os.listdir(SPLIT_FOLDER):
-            file_path = os.path.join(SPLIT_FOLDER, filename)
-            if os.path.isfile(file_path):
-                os.remove(file_path)
+            def process_row(item):
+                index, url = item
+                return done[index] if index in done else process_url(url)
+
+            def crawl(urls, on_result):
+                def record(index, item, result):
+                    if index not in done:
+                        checkpoint.save(index, item[1], result)
+                    on_result(index, item[1], result)
 
+                _, stats = run_crawl(enumerate(urls), process_row, concurrency=num_workers, on_result=record,
+                                     collect=False, host_key=lambda item: host_of(item[1]))
+                print(f"Crawled {stats.done} URLs in {stats.elapsed:.1f}s ({stats.urls_per_sec:.2f} URLs/sec)")
+
+            with SheetWriter(output_file_path, reader.header + ['Emails'], fmt) as writer:
+                rows = stream_sheet(reader, writer, url_index, crawl)
+        checkpoint.set_status('done', rows_total=rows)
+
+        print(f"Cache hit rate: {cache_stats.hit_rate:.1%} ({cache_stats.hits} hits, {cache_stats.misses} misses)")
+        print(dedup_stats.summary())
+        print('CKPT4 - OUTPUT FILE PROCESS')
+        response = send_file(os.path.abspath(output_file_path), as_attachment=True, download_name=f"{original_file_name}.{fmt}",
+                         mimetype=MIMETYPES[fmt])
+        response.headers['X-Cache-Hits'] = str(cache_stats.hits)
+        response.headers['X-Cache-Misses'] = str(cache_stats.misses)
+        response.headers['X-Cache-Hit-Rate'] = f"{cache_stats.hit_rate:.3f}"
+        response.headers['X-Dedup-Ratio'] = f"{dedup_stats.ratio:.3f}"
         return response
     except Exception as e:
         return f"An error occurred: {e}", 500
+    finally:
+        # Only remove this request's output; the input stays with its checkpoint
+        if os.path.isfile(output_file_path):
+            os.remove(output_file_path)
+
+def submit_checkpointed_job(checkpoint, rows=None, refresh=False, page_budget=None, max_depth=None, trace=False):
+    """
+    Queue the rows of a checkpointed upload that have no result yet or a
+    failed one, or the (index, url) `rows` given for a rerun, as a background
+    job with the checkpoint's ID. Every result is checkpointed as it finishes
+    and the output is built from the store. With `trace` (or JOB_TRACE) every
+    stage of every URL is written to the job's trace file.
+    """
+    done = checkpoint.reusable_results()
+    rows_total = 0
+    pending = []
+    with SheetReader(checkpoint.input_path, checkpoint.format) as reader:
+        url_index = reader.header.index(find_url_column(reader.header))
+        for index, row in enumerate(reader.rows()):
+            rows_total += 1
+            if index not in done:
+                pending.append((index, row[url_index]))
+    if rows is None:
+        rows = pending
+    settings = 'static'
+    if page_budget is not None or max_depth is not None:
+        settings = f"static page_budget={page_budget} max_depth={max_depth}"
+    checkpoint.set_status('running', rows_total=rows_total, settings=settings)
+    cache_stats = CacheStats()
+    dedup_stats = DedupStats()
+    job_trace = JobTrace(checkpoint.id) if trace or JOB_TRACE else None
+    process_url = SharedResults(partial(process_single_url, trace=job_trace, cache_stats=cache_stats, refresh=refresh,
+                                        page_budget=page_budget, max_depth=max_depth), stats=dedup_stats)
+    
+    def finalize(results):
+        if job_trace is not None:
+            job_trace.close()
+        checkpoint.set_status('done')
+        path = write_checkpoint_sheet(checkpoint, f"{SPLIT_FOLDER}/{checkpoint.id}_output.{checkpoint.format}")
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        finally:
+            os.remove(path)
+    
+    pre_resolve_in_background(url for _, url in rows)
+    return get_job_manager().submit(
+        checkpoint.name, rows, checkpointed(checkpoint, process_url, settings), finalize,
+        progress_fn=lambda: dict(checkpoint.progress(), cache_hit_rate=round(cache_stats.hit_rate, 3),
+                                 dedup_ratio=round(dedup_stats.ratio, 3)),
+        job_id=checkpoint.id)
+
+def job_response(job):
+    return jsonify(job_id=job.id, status_url=url_for('job_status', job_id=job.id),
+                   download_url=url_for('download_job', job_id=job.id)), 202
+
+def find_checkpoint(job_id):
+    """This app's checkpoint for a job ID, or None."""
+    checkpoint = get_checkpoint_store().get(job_id)
+    return checkpoint if checkpoint is not None and checkpoint.source == CHECKPOINT_SOURCE else None
+
+def find_job(job_id):
+    """
+    The job manager's job for an ID. A checkpointed job this process does not
+    know (it was cut short by a restart) is resumed; a finished one is None.
+    """
+    job = get_job_manager().get(job_id)
+    if job is not None:
+        return job
+    checkpoint = find_checkpoint(job_id)
+    if checkpoint is None or checkpoint.status == 'done':
+        return None
+    print(f"Resuming job {job_id} ({checkpoint.name}) from its checkpoint")
+    return submit_checkpointed_job(checkpoint)
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue an upload for background processing and return its job ID right away."""
+    file = request.files.get('file')
+    fmt = sheet_format(file.filename) if file else None
+    if not fmt:
+        return "Invalid file type. Please upload an Excel or CSV file.", 400
+    try:
+        checkpoint = get_checkpoint_store().open_upload(file, fmt, CHECKPOINT_SOURCE, settings='static')
+        with SheetReader(checkpoint.input_path, fmt) as reader:
+            url_column = find_url_column(reader.header)
+    except Exception as e:
+        return f"An error occurred: {e}", 500
+    if not url_column:
+        return "No column found that likely contains URLs.", 400
+    
+    try:
+        job = submit_checkpointed_job(checkpoint, trace=request.form.get('trace') == '1')
+    except JobQueueFull as e:
+        return str(e), 503
+    return job_response(job)
+
+@app.route('/jobs/<job_id>/rerun', methods=['POST'])
+def rerun_job(job_id):
+    """
+    Rerun a finished job's failed and/or empty rows (form field `rows`, e.g.
+    "failed,empty"), optionally with a larger `page_budget` or `max_depth`,
+    ignoring cached results.
+    """
+    checkpoint = find_checkpoint(job_id)
+    if checkpoint is None:
+        return "Unknown job.", 404
+    kinds = [kind.strip() for kind in request.form.get('rows', ','.join(RERUN_KINDS)).split(',') if kind.strip()]
+    # Missing or non-numeric values keep the frontier's defaults
+    page_budget = request.form.get('page_budget', type=int)
+    max_depth = request.form.get('max_depth', type=int)
+    if not kinds or any(kind not in RERUN_KINDS for kind in kinds):
+        return f"rows must be taken from {', '.join(RERUN_KINDS)}.", 400
+    job = get_job_manager().get(job_id)
+    if checkpoint.status != 'done' or (job is not None and job.status in ('queued', 'running')):
+        return "Job is still running.", 409
+    rows = checkpoint.rows_to_rerun(kinds)
+    print(f"Rerunning {len(rows)} {'/'.join(kinds)} rows of job {job_id}")
+    try:
+        job = submit_checkpointed_job(checkpoint, rows=rows, refresh=True, page_budget=page_budget, max_depth=max_depth,
+                                      trace=request.form.get('trace') == '1')
+    except JobQueueFull as e:
+        return str(e), 503
+    return job_response(job)
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = find_job(job_id)
+    if job is not None:
+        return jsonify(job.progress())
+    checkpoint = find_checkpoint(job_id)
+    if checkpoint is None:
+        return "Unknown job.", 404
+    return jsonify(dict(checkpoint.progress(), job_id=job_id, name=checkpoint.name, status=checkpoint.status))
+
+@app.route('/jobs/<job_id>/download')
+def download_job(job_id):
+    job = find_job(job_id)
+    if job is None:
+        checkpoint = find_checkpoint(job_id)
+        if checkpoint is None:
+            return "Unknown job.", 404
+        path = write_checkpoint_sheet(checkpoint, f"{SPLIT_FOLDER}/{uuid.uuid4().hex}_output.{checkpoint.format}")
+        with open(path, 'rb') as f:
+            data = BytesIO(f.read())
+        os.remove(path)
+        return send_file(data, as_attachment=True, download_name=checkpoint.name, mimetype=MIMETYPES[checkpoint.format])
+    if job.status == 'failed':
+        return f"An error occurred: {job.error}", 500
+    if job.status != 'done':
+        return "Job is still running.", 409
+    return send_file(os.path.abspath(job.output_path), as_attachment=True, download_name=job.name, mimetype=MIMETYPES[sheet_format(job.name)])
+
+@app.route('/jobs/<job_id>/trace')
+def job_trace(job_id):
+    """The per-stage trace of a job submitted with trace=1, as JSON lines."""
+    if find_checkpoint(job_id) is None:
+        return "Unknown job.", 404
+    path = JobTrace.path_for(job_id)
+    if not os.path.exists(path):
+        return "Job was not traced.", 404
+    return send_file(os.path.abspath(path), mimetype='application/x-ndjson')
+
+@app.route('/metrics')
+def metrics():
+    """Stage timing histograms and crawl gauges in the Prometheus text format."""
+    concurrency = get_concurrency_controller().snapshot()
+    gauges = {f"crawler_{name}": value for name, value in concurrency.items() if name != 'recent_decisions'}
+    gauges['crawler_jobs_pending'] = get_job_manager().pending_count()
+    return get_stage_metrics().render_prometheus(gauges), 200, {'Content-Type': 'text/plain; version=0.0.4'}
 
 if __name__ == '__main__':
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
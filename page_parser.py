@@ -0,0 +1,153 @@
+"""
+Pluggable HTML parser backends.
+
+Every backend turns raw HTML into the same email_extraction.PageScan (emails,
+links, visible text and declared language) in one walk over its own tree, without building a
+BeautifulSoup document unless it is the html.parser backend:
+
+  html.parser  BeautifulSoup with the pure-Python parser (default)
+  lxml         lxml.html's libxml2 tree
+  selectolax   selectolax's lexbor tree
+
+PARSER_BACKEND picks the default. A backend whose package is not installed
+falls back to html.parser with a warning.
+"""
+import os
+
+from bs4 import BeautifulSoup
+
+from email_extraction import SKIPPED_TEXT_PARENTS, finish_scan, meta_language, scan_soup
+from metrics import timed
+
+try:
+    import lxml.html
+    from lxml import etree
+except ImportError:
+    lxml = None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+
+PARSER_BACKEND = os.environ.get('PARSER_BACKEND', 'html.parser')
+
+_warned_missing = set()
+
+
+def scan_html_parser(html):
+    return scan_soup(BeautifulSoup(html, 'html.parser'))
+
+
+def _lxml_root(html):
+    try:
+        return lxml.html.document_fromstring(html)
+    except ValueError:
+        # lxml refuses str input that carries an XML encoding declaration
+        return lxml.html.document_fromstring(html.encode('utf-8'))
+
+
+def scan_lxml(html):
+    try:
+        root = _lxml_root(html)
+    except etree.ParserError:
+        return finish_scan([], [], [])
+
+    text_parts = []
+    scripts = []
+    links = []
+    html_lang = root.get('lang')
+    meta_lang = None
+
+    def add_text(text, parent_tag):
+        if not text:
+            return
+        if parent_tag == 'script':
+            scripts.append(text)
+        elif parent_tag not in SKIPPED_TEXT_PARENTS:
+            stripped = text.strip()
+            if stripped:
+                text_parts.append(stripped)
+
+    for element in root.iter():
+        tag = element.tag
+        if isinstance(tag, str):
+            if tag == 'a':
+                href = element.get('href')
+                if href is not None:
+                    links.append((href, element.text_content()))
+            elif tag == 'meta' and meta_lang is None:
+                meta_lang = meta_language(element.attrib)
+            add_text(element.text, tag)
+        # A tail is text that follows the element inside its parent, which
+        # also covers text after comments and processing instructions.
+        if element.tail:
+            parent = element.getparent()
+            add_text(element.tail, parent.tag if parent is not None else None)
+    return finish_scan(text_parts, scripts, links, html_lang, meta_lang, root.xpath('//@data-cfemail'))
+
+
+def scan_selectolax(html):
+    tree = LexborHTMLParser(html)
+    text_parts = []
+    scripts = []
+    links = []
+    meta_lang = None
+    root = tree.root
+    if root is None:
+        return finish_scan([], [], [])
+    for node in root.traverse(include_text=True):
+        tag = node.tag
+        if tag == '-text':
+            parent_tag = node.parent.tag if node.parent is not None else None
+            text = node.text_content
+            if not text:
+                continue
+            if parent_tag == 'script':
+                scripts.append(text)
+            elif parent_tag not in SKIPPED_TEXT_PARENTS:
+                stripped = text.strip()
+                if stripped:
+                    text_parts.append(stripped)
+        elif tag == 'a':
+            attributes = node.attributes
+            if 'href' in attributes:
+                links.append((attributes['href'] or '', node.text()))
+        elif tag == 'meta' and meta_lang is None:
+            meta_lang = meta_language(node.attributes)
+    cfemails = [node.attributes.get('data-cfemail') or '' for node in tree.css('[data-cfemail]')]
+    return finish_scan(text_parts, scripts, links, root.attributes.get('lang'), meta_lang, cfemails)
+
+
+BACKENDS = {
+    'html.parser': scan_html_parser,
+    'lxml': scan_lxml,
+    'selectolax': scan_selectolax,
+}
+
+
+def available_backends():
+    available = ['html.parser']
+    if lxml is not None:
+        available.append('lxml')
+    if LexborHTMLParser is not None:
+        available.append('selectolax')
+    return available
+
+
+def resolve_backend(backend=None):
+    backend = backend or PARSER_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    if backend not in available_backends():
+        if backend not in _warned_missing:
+            _warned_missing.add(backend)
+            print(f"Parser backend {backend} is not installed, using html.parser")
+        return 'html.parser'
+    return backend
+
+
+def parse_page(html, backend=None):
+    """Parse raw HTML with the chosen backend and return its PageScan."""
+    with timed('parse'):
+        return BACKENDS[resolve_backend(backend)](html)
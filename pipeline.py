@@ -0,0 +1,321 @@
+"""
+Two-stage crawl pipeline: network I/O in threads, parsing in processes.
+
+Fetcher threads only download raw pages. The pages go through a bounded queue
+to a ProcessPoolExecutor sized to the CPU count, which parses them and runs
+email extraction away from the GIL. When the parse stage falls behind, the
+queue fills up and the fetchers block, so memory stays bounded. Each site is
+crawled like extract_emails_from_url, through its own frontier.SiteFrontier,
+with at most SITE_PAGE_PARALLELISM of its pages in flight at a time so the
+frontier's priorities and early stop still apply.
+
+Fetches take a slot of the adaptive static limit (concurrency.py) like every
+other page fetch, so the fetcher threads are a ceiling the controller works
+under rather than a fixed concurrency.
+
+stats() reports per-stage utilization and queue depth, which shows whether a
+run is network-bound (fetchers busy, parse stage idle) or CPU-bound (parse
+queue full, parse workers busy).
+"""
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+import requests
+
+from concurrency import get_concurrency_controller
+from http_client import get_http_client
+from metrics import observe
+from page_parser import parse_page
+from frontier import SiteFrontier, finish_frontier
+
+PARSE_WORKERS = int(os.environ.get('PARSE_WORKERS', os.cpu_count() or 1))
+PARSE_QUEUE_SIZE = int(os.environ.get('PARSE_QUEUE_SIZE', 64))
+SITE_PAGE_PARALLELISM = int(os.environ.get('SITE_PAGE_PARALLELISM', 2))
+
+_STOP = object()
+
+
+def parse_for_crawl(html, backend=None):
+    """Runs in a worker process: parse one page, return (PageScan, seconds spent)."""
+    start = time.perf_counter()
+    scan = parse_page(html, backend)
+    return scan, time.perf_counter() - start
+
+
+_parse_pool = None
+_parse_pool_lock = threading.Lock()
+
+
+def get_parse_pool():
+    """
+    Process-wide parse pool. Workers are spawned rather than forked because the
+    parent is a multi-threaded web server.
+    """
+    global _parse_pool
+    with _parse_pool_lock:
+        if _parse_pool is None:
+            _parse_pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS,
+                                              mp_context=multiprocessing.get_context('spawn'))
+        return _parse_pool
+
+
+class _Site:
+    def __init__(self, index, url):
+        self.index = index
+        self.url = url
+        self.frontier = None
+        self.pending = 0
+        # Pages whose HTML arrived; a site without any is reported as None
+        self.fetched = 0
+        self.lock = threading.Lock()
+
+    def start(self):
+        """Create the frontier when the site becomes active, so its deadline starts then."""
+        self.frontier = SiteFrontier(self.url)
+
+    def next_pages(self):
+        """Take pages off the frontier up to the per-site limit. Call with the lock held."""
+        pages = []
+        while self.pending < SITE_PAGE_PARALLELISM:
+            item = self.frontier.pop()
+            if item is None:
+                break
+            self.pending += 1
+            pages.append(item)
+        return pages
+
+
+class StageStats:
+    def __init__(self, workers):
+        self.workers = workers
+        self.busy = 0.0
+        self.items = 0
+        self.lock = threading.Lock()
+
+    def add(self, seconds):
+        with self.lock:
+            self.busy += seconds
+            self.items += 1
+
+    def utilization(self, wall):
+        return self.busy / (self.workers * wall) if wall > 0 else 0.0
+
+
+class CrawlPipeline:
+    def __init__(self, fetch_workers=20, parse_workers=None, parse_queue_size=PARSE_QUEUE_SIZE,
+                 max_active_sites=None, timeout=10, parser_backend=None, limit=None):
+        self.fetch_workers = fetch_workers
+        # limit=None uses the shared controller's static limit; pass False to fetch without one
+        self.limit = get_concurrency_controller().static if limit is None else (limit or None)
+        if parse_workers is None:
+            self.pool = get_parse_pool()
+            self._owns_pool = False
+        else:
+            self.pool = ProcessPoolExecutor(max_workers=parse_workers, mp_context=multiprocessing.get_context('spawn'))
+            self._owns_pool = True
+        self.parse_workers = parse_workers or PARSE_WORKERS
+        self.parse_queue_size = parse_queue_size
+        self.max_active_sites = max_active_sites or fetch_workers * 2
+        self.timeout = timeout
+        self.parser_backend = parser_backend
+        self.fetch_stats = StageStats(fetch_workers)
+        self.parse_stats = StageStats(self.parse_workers)
+        self._depth_samples = {'fetch': [], 'parse': []}
+        self._wall = 0.0
+
+    def _fetch(self, url, deadline=None):
+        start = time.perf_counter()
+        try:
+            response = get_http_client().get_page(url, timeout=self.timeout, deadline=deadline, limit=self.limit)
+            response.raise_for_status()
+            return response.text
+        except requests.exceptions.RequestException as e:
+            print(f"RequestException for {url}: {e}")
+            return None
+        except Exception as e:
+            # Anything else would kill the fetcher thread and leave the page pending forever
+            print(f"Error processing {url}: {e}")
+            return None
+        finally:
+            self.fetch_stats.add(time.perf_counter() - start)
+
+    def _fetch_loop(self, work, to_parse):
+        while True:
+            item = work.get()
+            if item is _STOP:
+                return
+            site, url, depth = item
+            # Blocks while the parse stage is saturated
+            to_parse.put((site, url, depth, self._fetch(url, site.frontier.deadline)))
+
+    def _sample_depths(self, work, to_parse, done):
+        while not done.wait(0.1):
+            self._depth_samples['fetch'].append(work.qsize())
+            self._depth_samples['parse'].append(to_parse.qsize())
+
+    def run(self, urls):
+        """
+        Crawl every URL and return, in input order, the comma-separated emails
+        found for each: "" when none were found or the URL is not a string,
+        None when no page of the site could be fetched. Stage statistics are
+        reset at the start of every run.
+        """
+        urls = list(urls)
+        results = [""] * len(urls)
+        self.fetch_stats = StageStats(self.fetch_workers)
+        self.parse_stats = StageStats(self.parse_workers)
+        self._depth_samples = {'fetch': [], 'parse': []}
+        work = queue.Queue()
+        to_parse = queue.Queue(maxsize=self.parse_queue_size)
+        active_sites = threading.Semaphore(self.max_active_sites)
+        in_flight = threading.Semaphore(self.parse_workers * 2)
+        all_done = threading.Event()
+        state = {'remaining': 0}
+        state_lock = threading.Lock()
+
+        def finish_site(site):
+            finish_frontier(site.frontier)
+            if site.frontier.emails:
+                results[site.index] = ', '.join(site.frontier.emails)
+            else:
+                results[site.index] = "" if site.fetched else None
+            active_sites.release()
+            with state_lock:
+                state['remaining'] -= 1
+                if state['remaining'] == 0:
+                    all_done.set()
+
+        def finish_page(site, url=None, depth=0, scan=None):
+            # Runs in the parse pool's done-callbacks, which swallow exceptions:
+            # the page must stop counting as pending whatever happens, or the
+            # site never finishes and run() waits forever
+            with site.lock:
+                try:
+                    if scan is not None:
+                        site.frontier.add_page(url, depth, scan)
+                except Exception as e:
+                    print(f"Error processing {url}: {e}")
+                finally:
+                    site.pending -= 1
+                try:
+                    pages = site.next_pages()
+                except Exception as e:
+                    print(f"Error processing {site.url}: {e}")
+                    pages = []
+                finished = site.pending == 0
+            for page_url, page_depth in pages:
+                work.put((site, page_url, page_depth))
+            if finished:
+                finish_site(site)
+
+        def handle_parsed(site, url, depth, future):
+            in_flight.release()
+            scan = None
+            try:
+                scan, seconds = future.result()
+                self.parse_stats.add(seconds)
+                # The worker process's own stage metrics never reach this process
+                observe('parse', seconds, url)
+            except Exception as e:
+                print(f"Error processing {url}: {e}")
+            finally:
+                finish_page(site, url, depth, scan)
+
+        def dispatch_loop():
+            while True:
+                item = to_parse.get()
+                if item is _STOP:
+                    return
+                site, url, depth, html = item
+                if html is None:
+                    finish_page(site)
+                    continue
+                with site.lock:
+                    site.fetched += 1
+                in_flight.acquire()
+                try:
+                    future = self.pool.submit(parse_for_crawl, html, self.parser_backend)
+                except Exception as e:
+                    print(f"Error processing {url}: {e}")
+                    in_flight.release()
+                    finish_page(site)
+                    continue
+                future.add_done_callback(lambda f, site=site, url=url, depth=depth: handle_parsed(site, url, depth, f))
+
+        start = time.monotonic()
+        sampler_done = threading.Event()
+        threads = [threading.Thread(target=self._fetch_loop, args=(work, to_parse), daemon=True)
+                   for _ in range(self.fetch_workers)]
+        threads.append(threading.Thread(target=dispatch_loop, daemon=True))
+        sampler = threading.Thread(target=self._sample_depths, args=(work, to_parse, sampler_done), daemon=True)
+        for thread in threads + [sampler]:
+            thread.start()
+
+        sites = []
+        for index, url in enumerate(urls):
+            if not isinstance(url, str) or not url.strip():
+                continue
+            url = url.strip()
+            if not url.startswith(('http://', 'https://')):
+                url = f"http://{url}"
+            sites.append(_Site(index, url))
+        state['remaining'] = len(sites)
+        if not sites:
+            all_done.set()
+        for site in sites:
+            active_sites.acquire()
+            with site.lock:
+                site.start()
+                pages = site.next_pages()
+            if not pages:
+                # Nothing to fetch (deadline already passed): no page will finish the site
+                finish_site(site)
+                continue
+            for page_url, depth in pages:
+                work.put((site, page_url, depth))
+        all_done.wait()
+
+        for _ in range(self.fetch_workers):
+            work.put(_STOP)
+        to_parse.put(_STOP)
+        for thread in threads:
+            thread.join()
+        sampler_done.set()
+        sampler.join()
+        self._wall = time.monotonic() - start
+        return results
+
+    def close(self):
+        """Shut down the parse pool if this pipeline created its own."""
+        if self._owns_pool:
+            self.pool.shutdown()
+
+    def stats(self):
+        wall = self._wall
+        fetch_util = self.fetch_stats.utilization(wall)
+        parse_util = self.parse_stats.utilization(wall)
+        parse_depths = self._depth_samples['parse'] or [0]
+        fetch_depths = self._depth_samples['fetch'] or [0]
+        full_ratio = sum(1 for depth in parse_depths if depth >= self.parse_queue_size) / len(parse_depths)
+        if parse_util > 0.8 or full_ratio > 0.5:
+            bound = 'cpu'
+        elif fetch_util > 0.5:
+            bound = 'network'
+        else:
+            bound = 'idle'
+        return {
+            'elapsed': round(wall, 3),
+            'pages_fetched': self.fetch_stats.items,
+            'pages_parsed': self.parse_stats.items,
+            'fetch_utilization': round(fetch_util, 3),
+            'parse_utilization': round(parse_util, 3),
+            'fetch_queue_avg': round(sum(fetch_depths) / len(fetch_depths), 1),
+            'fetch_queue_max': max(fetch_depths),
+            'parse_queue_avg': round(sum(parse_depths) / len(parse_depths), 1),
+            'parse_queue_max': max(parse_depths),
+            'parse_queue_full_ratio': round(full_ratio, 3),
+            'bound': bound,
+        }
@@ -0,0 +1,171 @@
+"""
+Per-host politeness scheduler.
+
+Every outgoing request takes a slot for its host first. A host gets at most
+HOST_CONCURRENCY requests in flight and at most one new request every
+HOST_MIN_INTERVAL seconds, while requests to other hosts are not delayed at
+all. When a host answers 429 or 503 its next slot is pushed back by the
+Retry-After header if there is one, otherwise by an exponential backoff. The
+host's request interval is also doubled, then eased back towards
+HOST_MIN_INTERVAL by each normal answer, so the pace adapts to what the host
+tolerates.
+"""
+import os
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+HOST_CONCURRENCY = int(os.environ.get('HOST_CONCURRENCY', 2))
+HOST_MIN_INTERVAL = float(os.environ.get('HOST_MIN_INTERVAL', 0.25))
+HOST_BASE_BACKOFF = float(os.environ.get('HOST_BASE_BACKOFF', 2.0))
+HOST_MAX_BACKOFF = float(os.environ.get('HOST_MAX_BACKOFF', 60.0))
+
+THROTTLE_STATUSES = (429, 503)
+
+# Sweep idle host entries once every this many acquisitions.
+_SWEEP_INTERVAL = 1000
+
+
+def host_key(url):
+    """Lowercased netloc of a URL; anything without a scheme is treated as a bare host."""
+    if '//' not in url:
+        url = f"http://{url}"
+    return urlparse(url).netloc.lower()
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at is None:
+        return None
+    return max(0.0, retry_at.timestamp() - time.time())
+
+
+class SlotTimeout(Exception):
+    """The deadline passed before the host had a free slot."""
+
+
+class _HostState:
+    def __init__(self, interval):
+        self.in_flight = 0
+        self.next_time = 0.0
+        self.throttles = 0
+        self.interval = interval
+
+
+class HostScheduler:
+    def __init__(self, concurrency=HOST_CONCURRENCY, min_interval=HOST_MIN_INTERVAL,
+                 base_backoff=HOST_BASE_BACKOFF, max_backoff=HOST_MAX_BACKOFF):
+        self.concurrency = concurrency
+        self.min_interval = min_interval
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._hosts = {}
+        self._cond = threading.Condition()
+        self._acquisitions = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def acquire(self, host, deadline=None):
+        """
+        Block until `host` has a free slot and its interval has passed. Raises
+        SlotTimeout if `deadline` (a time.monotonic() value) comes first.
+        """
+        start = time.monotonic()
+        with self._cond:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self.min_interval)
+            while True:
+                now = time.monotonic()
+                if state.in_flight < self.concurrency and now >= state.next_time:
+                    break
+                if deadline is not None and now >= deadline:
+                    self.waited += now - start
+                    raise SlotTimeout(f"No slot for {host} before the deadline")
+                timeout = state.next_time - now if state.in_flight < self.concurrency else None
+                if deadline is not None:
+                    timeout = deadline - now if timeout is None else min(timeout, deadline - now)
+                self._cond.wait(timeout)
+            state.in_flight += 1
+            state.next_time = now + state.interval
+            self.waited += now - start
+            self._acquisitions += 1
+            if self._acquisitions % _SWEEP_INTERVAL == 0:
+                self._sweep(now)
+
+    def release(self, host):
+        with self._cond:
+            state = self._hosts.get(host)
+            if state is not None:
+                state.in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, host, deadline=None):
+        self.acquire(host, deadline)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def report(self, host, status_code, retry_after=None):
+        """
+        Record a response from `host`. For 429/503 this pushes the host's next
+        slot back and returns the delay in seconds; otherwise returns None.
+        """
+        with self._cond:
+            state = self._hosts.get(host)
+            if state is None:
+                state = self._hosts[host] = _HostState(self.min_interval)
+            if status_code not in THROTTLE_STATUSES:
+                state.throttles = 0
+                state.interval = max(self.min_interval, state.interval * 0.9)
+                return None
+            state.throttles += 1
+            state.interval = min(self.max_backoff, max(state.interval * 2, self.min_interval, 0.1))
+            self.throttled += 1
+            delay = parse_retry_after(retry_after)
+            if delay is None:
+                delay = self.base_backoff * 2 ** (state.throttles - 1)
+            delay = min(delay, self.max_backoff)
+            state.next_time = max(state.next_time, time.monotonic() + delay)
+            self._cond.notify_all()
+            return delay
+
+    def _sweep(self, now):
+        for host, state in list(self._hosts.items()):
+            if state.in_flight == 0 and state.throttles == 0 and state.next_time <= now \
+                    and state.interval <= self.min_interval:
+                del self._hosts[host]
+
+    def stats(self):
+        with self._cond:
+            return {
+                'hosts': len(self._hosts),
+                'throttled_responses': self.throttled,
+                'seconds_waited': round(self.waited, 3),
+            }
+
+
+_shared_scheduler = None
+_shared_scheduler_lock = threading.Lock()
+
+
+def get_host_scheduler():
+    """Return the process-wide scheduler shared by the HTTP client and the JS renderer."""
+    global _shared_scheduler
+    with _shared_scheduler_lock:
+        if _shared_scheduler is None:
+            _shared_scheduler = HostScheduler()
+        return _shared_scheduler
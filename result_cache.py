@@ -0,0 +1,182 @@
+"""
+On-disk cache of per-domain extraction results.
+
+Lead lists are re-uploaded with a lot of overlap, so results are kept in a
+small SQLite database keyed by normalized domain. Each entry records the
+emails, which method found them and when. Positive results live for
+RESULT_CACHE_TTL seconds; negative results (nothing found, or method 'dns' for
+a domain that does not exist) use the much shorter RESULT_CACHE_NEGATIVE_TTL
+so dead domains are skipped for a while without being written off forever.
+"Error..." results are never stored: they are usually transient, and callers
+also leave out sites they could not fetch at all. The table is trimmed to
+RESULT_CACHE_MAX_ENTRIES, dropping the oldest entries first.
+"""
+import os
+import sqlite3
+import threading
+import time
+from urllib.parse import urlparse
+
+from dns_cache import DOMAIN_NOT_FOUND
+
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', '1') != '0'
+RESULT_CACHE_PATH = os.environ.get('RESULT_CACHE_PATH', 'email_cache.sqlite3')
+RESULT_CACHE_TTL = int(os.environ.get('RESULT_CACHE_TTL', 7 * 24 * 3600))
+RESULT_CACHE_NEGATIVE_TTL = int(os.environ.get('RESULT_CACHE_NEGATIVE_TTL', 24 * 3600))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', 100000))
+
+# Check the size limit once every this many writes rather than on every write.
+_EVICTION_CHECK_INTERVAL = 200
+
+
+def cache_key(url):
+    """Normalize a sheet URL to the domain used as cache key ('www.' and scheme dropped)."""
+    if not isinstance(url, str):
+        return None
+    url = url.strip().lower()
+    if not url:
+        return None
+    if not url.startswith(('http://', 'https://')):
+        url = f"http://{url}"
+    netloc = urlparse(url).netloc
+    if '@' in netloc:
+        netloc = netloc.rsplit('@', 1)[1]
+    if netloc.endswith(':80') or netloc.endswith(':443'):
+        netloc = netloc.rsplit(':', 1)[0]
+    if netloc.startswith('www.'):
+        netloc = netloc[4:]
+    return netloc.rstrip('.') or None
+
+
+class CacheEntry:
+    def __init__(self, domain, emails, method, found, created):
+        self.domain = domain
+        self.emails = emails
+        self.method = method
+        self.found = bool(found)
+        self.created = created
+
+    @property
+    def cell(self):
+        """The sheet cell for this entry."""
+        if self.found:
+            return self.emails
+        return DOMAIN_NOT_FOUND if self.method == 'dns' else "No email ID found"
+
+
+class CacheStats:
+    """Hit/miss counters for one upload."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class ResultCache:
+    def __init__(self, path=RESULT_CACHE_PATH, ttl=RESULT_CACHE_TTL, negative_ttl=RESULT_CACHE_NEGATIVE_TTL,
+                 max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " domain TEXT PRIMARY KEY,"
+                " emails TEXT NOT NULL,"
+                " method TEXT NOT NULL,"
+                " found INTEGER NOT NULL,"
+                " created REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            self._conn.commit()
+
+    def get(self, url, negative_methods=None):
+        """
+        Return the fresh CacheEntry for the URL's domain, or None.
+
+        `negative_methods` restricts which negative entries count as a hit: a
+        caller that would try more methods than were tried when the entry was
+        written should not accept its "nothing found".
+        """
+        domain = cache_key(url)
+        if domain is None:
+            return None
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT domain, emails, method, found, created FROM results WHERE domain = ?", (domain,)
+            ).fetchone()
+        if row is None:
+            return None
+        entry = CacheEntry(*row)
+        ttl = self.ttl if entry.found else self.negative_ttl
+        if time.time() - entry.created > ttl:
+            return None
+        if not entry.found and negative_methods is not None and entry.method not in negative_methods:
+            return None
+        return entry
+
+    def put(self, url, emails, method):
+        """
+        Store the result for the URL's domain. Empty `emails` is stored as a
+        negative result; "Error..." results are not stored.
+        """
+        domain = cache_key(url)
+        if domain is None or (emails or "").startswith('Error'):
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results (domain, emails, method, found, created) VALUES (?, ?, ?, ?, ?)",
+                (domain, emails or "", method, 1 if emails else 0, time.time()),
+            )
+            self._conn.commit()
+            self._writes += 1
+            if self._writes % _EVICTION_CHECK_INTERVAL == 0:
+                self._evict()
+
+    def _evict(self):
+        (count,) = self._conn.execute("SELECT COUNT(*) FROM results").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM results WHERE domain IN (SELECT domain FROM results ORDER BY created LIMIT ?)",
+                (excess,),
+            )
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM results")
+            self._conn.commit()
+
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_result_cache():
+    """Return the process-wide cache, or None when caching is disabled."""
+    global _shared_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResultCache()
+        return _shared_cache
@@ -0,0 +1,358 @@
+"""
+A cheap stand-in for a browser when a page only hides its address.
+
+Many sites build their contact address in a small inline script, or encode
+it the way Cloudflare's email protection does, so that the HTML never
+contains it in plain text. Rendering those pages in Chrome works but costs
+seconds and a browser process. evaluate_script() runs the handful of
+JavaScript string operations such scripts use, without a JavaScript engine:
+
+  - string literals, including \\x40 and \\u0040 escapes, and concatenation
+  - var/let/const and plain assignments (also +=), so later expressions can
+    use earlier variables; an assignment to a property (el.textContent = ...)
+    is evaluated like any other
+  - atob(), String.fromCharCode(), decodeURIComponent(), unescape()
+  - .split('').reverse().join(''), array literals with .join(), .concat(),
+    .replace() with string arguments, .toLowerCase(), .trim()
+  - functions defined in the script that look like ROT13 (or are called
+    rot13), and ones called reverse
+  - string literals that are base64 for something containing an '@'
+
+Anything else is skipped: an expression the evaluator does not understand
+gives up and scanning resumes at the next token. So that a script cannot make
+the evaluator build huge strings (x += x repeated) or retry expressions
+without end, a value longer than SCRIPT_EVAL_MAX_VALUE gives up like an
+unknown expression, and evaluation stops after SCRIPT_EVAL_MAX_OPERATIONS
+operations. decode_cfemail() decodes Cloudflare's data-cfemail /
+email-protection#... hex.
+"""
+import base64
+import binascii
+import codecs
+import re
+from urllib.parse import unquote
+
+# Scripts longer than this are bundles or data blobs, not address builders
+SCRIPT_EVAL_MAX_CHARS = 20000
+# Longest string or array (total characters) an evaluated expression may build
+SCRIPT_EVAL_MAX_VALUE = 4096
+# Operands and method calls evaluated per script before the evaluator stops
+SCRIPT_EVAL_MAX_OPERATIONS = 20000
+# Something in a script that hints it builds an address: a string that starts
+# or ends with '@', an escaped '@' or a decoding call. A bare '@' is too common
+# (@media, @license, decorators) to be worth evaluating the script for.
+SCRIPT_HINT_PATTERN = re.compile(
+    r'[\'"`]@|@[\'"`]|\\x40|\\u0040|%40|atob|fromCharCode|charCodeAt|reverse|rot13|unescape|decodeURI')
+
+_TOKEN_PATTERN = re.compile(r'''
+    (?P<skip>\s+|//[^\n]*|/\*.*?\*/)
+  | (?P<str>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*'|`(?:[^`\\$]|\\.)*`)
+  | (?P<num>0[xX][0-9a-fA-F]+|\d+)
+  | (?P<name>[A-Za-z_$][\w$]*)
+  | (?P<op>[+=(),.;\[\]{}])
+  | (?P<other>.)
+''', re.DOTALL | re.VERBOSE)
+_ESCAPE_PATTERN = re.compile(r'\\(?:x([0-9a-fA-F]{2})|u\{([0-9a-fA-F]+)\}|u([0-9a-fA-F]{4})|(.))', re.DOTALL)
+_SIMPLE_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', 'v': '\v', '0': '\0'}
+_FUNCTION_PATTERN = re.compile(r'(?:function\s+([\w$]+)|([\w$]+)\s*=\s*function\b)')
+_BASE64_LITERAL = re.compile(r'[\'"]([A-Za-z0-9+/]{8,}={0,2})[\'"]')
+_DECLARATIONS = {'var', 'let', 'const'}
+_MAX_NESTING = 32
+
+
+def decode_cfemail(encoded):
+    """The address in a Cloudflare data-cfemail value (hex, first byte is the XOR key), or ''."""
+    try:
+        data = bytes.fromhex(encoded.strip())
+    except ValueError:
+        return ''
+    if len(data) < 2:
+        return ''
+    key = data[0]
+    return bytes(byte ^ key for byte in data[1:]).decode('utf-8', 'replace')
+
+
+def _unescape(body):
+    def replace(match):
+        hex2, braced, hex4, char = match.groups()
+        code = hex2 or braced or hex4
+        if code:
+            try:
+                return chr(int(code, 16))
+            except (ValueError, OverflowError):
+                return ''
+        return _SIMPLE_ESCAPES.get(char, char)
+    return _ESCAPE_PATTERN.sub(replace, body) if '\\' in body else body
+
+
+def tokenize(script):
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(script):
+        kind = match.lastgroup
+        if kind == 'skip':
+            continue
+        value = match.group()
+        if kind == 'str':
+            value = _unescape(value[1:-1])
+        elif kind == 'num':
+            value = int(value, 16) if value[:2].lower() == '0x' else int(value)
+        tokens.append((kind, value))
+    return tokens
+
+
+def _decode_base64(value):
+    try:
+        return base64.b64decode(value + '=' * (-len(value) % 4), validate=True).decode('utf-8')
+    except (binascii.Error, ValueError):
+        return None
+
+
+def _rot13(value):
+    return codecs.encode(value, 'rot13')
+
+
+def _special_functions(script):
+    """{name: function} for the ROT13 and reverse helpers a script defines."""
+    functions = {}
+    for match in _FUNCTION_PATTERN.finditer(script):
+        name = match.group(1) or match.group(2)
+        body = script[match.end():match.end() + 400]
+        if 'rot13' in name.lower() or ('charCodeAt' in body and '13' in body):
+            functions[name] = _rot13
+        elif 'reverse' in name.lower():
+            functions[name] = lambda value: value[::-1]
+    return functions
+
+
+def uses_rot13(script):
+    """
+    True if a script decodes ROT13. ROT13 keeps the '@' and the dots, so the
+    encoded address looks like a real one to a plain regex.
+    """
+    if 'rot13' not in script.lower() and 'charCodeAt' not in script:
+        return False
+    return _rot13 in _special_functions(script).values()
+
+
+class _GiveUp(Exception):
+    pass
+
+
+class _OutOfOperations(_GiveUp):
+    pass
+
+
+def _check_size(size):
+    if size > SCRIPT_EVAL_MAX_VALUE:
+        raise _GiveUp()
+
+
+def _size(value):
+    if isinstance(value, list):
+        return sum(len(item) for item in value) + len(value)
+    return len(value) if isinstance(value, str) else 0
+
+
+class _Evaluator:
+    def __init__(self, tokens, functions):
+        self.tokens = tokens
+        self.functions = functions
+        self.env = {}
+        self.pos = 0
+        self.depth = 0
+        self.operations = 0
+
+    def step(self):
+        self.operations += 1
+        if self.operations > SCRIPT_EVAL_MAX_OPERATIONS:
+            raise _OutOfOperations()
+
+    def peek(self, offset=0):
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, kind=None, value=None):
+        token = self.peek()
+        if token[0] is None or (kind is not None and token[0] != kind) or (value is not None and token[1] != value):
+            raise _GiveUp()
+        self.pos += 1
+        return token[1]
+
+    def at_op(self, value, offset=0):
+        return self.peek(offset) == ('op', value)
+
+    def expression(self):
+        self.depth += 1
+        if self.depth > _MAX_NESTING:
+            raise _GiveUp()
+        try:
+            value = self.term()
+            while self.at_op('+') and not self.at_op('=', 1):
+                self.pos += 1
+                value = _concat(value, self.term())
+            return value
+        finally:
+            self.depth -= 1
+
+    def arguments(self):
+        self.take('op', '(')
+        args = []
+        while not self.at_op(')'):
+            args.append(self.expression())
+            if not self.at_op(')'):
+                self.take('op', ',')
+        self.pos += 1
+        return args
+
+    def term(self):
+        self.step()
+        kind, value = self.peek()
+        if kind in ('str', 'num'):
+            self.pos += 1
+            result = value
+        elif kind == 'op' and value == '(':
+            self.pos += 1
+            result = self.expression()
+            self.take('op', ')')
+        elif kind == 'op' and value == '[':
+            self.pos += 1
+            result = []
+            while not self.at_op(']'):
+                result.append(_text(self.expression()))
+                if not self.at_op(']'):
+                    self.take('op', ',')
+            self.pos += 1
+        elif kind == 'name':
+            result = self.call_or_variable()
+        else:
+            raise _GiveUp()
+        while self.at_op('.') or self.at_op('['):
+            result = self.postfix(result)
+        _check_size(_size(result))
+        return result
+
+    def call_or_variable(self):
+        name = self.take('name')
+        if name == 'String' and self.at_op('.') and self.peek(1) == ('name', 'fromCharCode'):
+            self.pos += 2
+            return ''.join(chr(code) for code in self.arguments() if isinstance(code, int) and 0 <= code < 0x110000)
+        if not self.at_op('('):
+            if name not in self.env:
+                raise _GiveUp()
+            return self.env[name]
+        if name == 'atob':
+            args = self.arguments()
+            decoded = _decode_base64(_text(args[0])) if args else None
+            if decoded is None:
+                raise _GiveUp()
+            return decoded
+        if name in ('decodeURIComponent', 'decodeURI', 'unescape'):
+            args = self.arguments()
+            return unquote(_text(args[0])) if args else ''
+        if name in self.functions:
+            args = self.arguments()
+            return self.functions[name](_text(args[0])) if args else ''
+        raise _GiveUp()
+
+    def postfix(self, value):
+        self.step()
+        if self.at_op('['):
+            self.pos += 1
+            index = self.expression()
+            self.take('op', ']')
+            if not isinstance(index, int) or not isinstance(value, (str, list)) or index >= len(value):
+                raise _GiveUp()
+            return value[index]
+        self.pos += 1
+        method = self.take('name')
+        if method == 'length':
+            return len(value) if isinstance(value, (str, list)) else 0
+        args = self.arguments()
+        if method == 'split' and isinstance(value, str):
+            separator = _text(args[0]) if args else None
+            return list(value) if separator == '' else value.split(separator) if separator is not None else [value]
+        if method == 'reverse' and isinstance(value, list):
+            return value[::-1]
+        if method == 'join' and isinstance(value, list):
+            separator = _text(args[0]) if args else ','
+            _check_size(_size(value) + len(separator) * len(value))
+            return separator.join(value)
+        if method == 'concat':
+            args = [_text(arg) for arg in args]
+            _check_size(_size(value) + _size(args))
+            return value + args if isinstance(value, list) else ''.join([_text(value)] + args)
+        if method == 'replace' and isinstance(value, str) and len(args) == 2:
+            return value.replace(_text(args[0]), _text(args[1]), 1)
+        if method in ('toLowerCase', 'toLocaleLowerCase') and isinstance(value, str):
+            return value.lower()
+        if method == 'trim' and isinstance(value, str):
+            return value.strip()
+        if method == 'toString':
+            return _text(value)
+        raise _GiveUp()
+
+    def run(self):
+        """Every string the script computes, assignments applied in order."""
+        values = []
+        while self.pos < len(self.tokens):
+            kind, value = self.peek()
+            if kind == 'name' and value in _DECLARATIONS:
+                self.pos += 1
+                continue
+            start = self.pos
+            try:
+                if kind == 'name' and self.at_op('=', 1) and not self.at_op('=', 2):
+                    self.pos += 2
+                    result = self.env[value] = self.expression()
+                elif kind == 'name' and self.at_op('+', 1) and self.at_op('=', 2):
+                    self.pos += 3
+                    result = self.env[value] = _concat(self.env.get(value, ''), self.expression())
+                elif kind in ('str', 'name') or (kind == 'op' and value in '(['):
+                    result = self.expression()
+                else:
+                    self.pos += 1
+                    continue
+            except _OutOfOperations:
+                break
+            except _GiveUp:
+                self.depth = 0
+                self.pos = start + 1
+                continue
+            if isinstance(result, list):
+                result = ','.join(result)
+            if isinstance(result, str) and result:
+                values.append(result)
+        return values
+
+
+def _text(value):
+    if isinstance(value, list):
+        return ','.join(value)
+    return value if isinstance(value, str) else str(value)
+
+
+def _concat(left, right):
+    if isinstance(left, int) and isinstance(right, int):
+        return left + right
+    left, right = _text(left), _text(right)
+    _check_size(len(left) + len(right))
+    return left + right
+
+
+def evaluate_script(script):
+    """
+    The strings an inline script computes with the operations above, plus
+    the decoded form of base64 literals that hide an '@'. Scripts over
+    SCRIPT_EVAL_MAX_CHARS are skipped, and only scripts with a hint of an
+    address (SCRIPT_HINT_PATTERN) are evaluated.
+    """
+    if not script or len(script) > SCRIPT_EVAL_MAX_CHARS:
+        return []
+    values = []
+    if SCRIPT_HINT_PATTERN.search(script):
+        values = _Evaluator(tokenize(script), _special_functions(script)).run()
+    for literal in _BASE64_LITERAL.findall(script):
+        decoded = _decode_base64(literal)
+        if decoded and '@' in decoded:
+            values.append(decoded)
+    return values
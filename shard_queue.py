@@ -0,0 +1,364 @@
+"""
+Sharded crawling across worker processes through a SQLite work queue.
+
+The coordinator (the /process request in CRAWL_MODE=sharded) puts the
+deduplicated sites of an upload into a queue database (SHARD_QUEUE_PATH) as
+one task each and waits for their results; worker processes lease tasks,
+crawl them and write the results back. A lease lasts SHARD_LEASE_SECONDS and
+the worker's heartbeat thread renews the leases it holds every
+SHARD_HEARTBEAT_SECONDS, so the tasks of a worker that dies or loses the
+queue are leased again by another worker once they expire. A task leased
+SHARD_MAX_ATTEMPTS times without a result (it keeps killing its worker) is
+given up with an error result. The first result written for a task wins,
+so a task that was reassigned and then finished twice keeps one result.
+
+The coordinator starts SHARD_WORKERS local worker processes itself and
+replaces any that exit while work remains; local workers left behind by a
+coordinator that died exit once the queue has been idle for two leases.
+Workers on other hosts (or started by hand) run
+
+    python shard_queue.py --queue /shared/shards.sqlite3 --target app:process_single_url
+
+against the same database file, which must then be on a filesystem with
+working locks. Results come back in the order of the site list, so the
+caller can fan them out to the original rows.
+"""
+import argparse
+import importlib
+import os
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+SHARD_QUEUE_PATH = os.environ.get('SHARD_QUEUE_PATH', 'shards.sqlite3')
+SHARD_WORKERS = int(os.environ.get('SHARD_WORKERS', 4))
+SHARD_LEASE_SECONDS = float(os.environ.get('SHARD_LEASE_SECONDS', 30))
+SHARD_HEARTBEAT_SECONDS = float(os.environ.get('SHARD_HEARTBEAT_SECONDS', 5))
+SHARD_MAX_ATTEMPTS = int(os.environ.get('SHARD_MAX_ATTEMPTS', 3))
+# How often idle workers and the waiting coordinator look at the queue
+SHARD_POLL_SECONDS = float(os.environ.get('SHARD_POLL_SECONDS', 0.2))
+
+
+class ShardQueue:
+    """Tasks, leases and results of sharded jobs in one SQLite database."""
+
+    def __init__(self, path=SHARD_QUEUE_PATH, lease_seconds=SHARD_LEASE_SECONDS, max_attempts=SHARD_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS tasks ("
+                " job_id TEXT NOT NULL,"
+                " position INTEGER NOT NULL,"
+                " url TEXT,"
+                " status TEXT NOT NULL,"
+                " worker TEXT,"
+                " lease_until REAL,"
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (job_id, position))"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS tasks_by_status ON tasks (status, lease_until)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " job_id TEXT NOT NULL,"
+                " position INTEGER NOT NULL,"
+                " result TEXT NOT NULL,"
+                " worker TEXT)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_by_job ON results (job_id, seq)")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS workers ("
+                " worker_id TEXT PRIMARY KEY,"
+                " host TEXT NOT NULL,"
+                " pid INTEGER NOT NULL,"
+                " started REAL NOT NULL,"
+                " heartbeat REAL NOT NULL,"
+                " done INTEGER NOT NULL DEFAULT 0)"
+            )
+
+    def _transaction(self, fn):
+        # BEGIN IMMEDIATE takes the write lock up front, so two workers never
+        # lease the same task
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def enqueue(self, urls, job_id=None):
+        """Add one task per URL (its position in `urls`) and return the job ID."""
+        job_id = job_id or uuid.uuid4().hex
+        rows = [(job_id, position, url if isinstance(url, str) else None, 'pending')
+                for position, url in enumerate(urls)]
+        self._transaction(lambda conn: conn.executemany(
+            "INSERT OR IGNORE INTO tasks (job_id, position, url, status) VALUES (?, ?, ?, ?)", rows))
+        return job_id
+
+    def lease(self, worker_id, limit):
+        """
+        Lease up to `limit` pending or expired tasks to `worker_id`. Returns
+        (job ID, position, url) tuples. Expired tasks that have used up their
+        attempts are finished with an error result instead.
+        """
+        def take(conn):
+            now = time.time()
+            rows = conn.execute(
+                "SELECT job_id, position, url, attempts FROM tasks"
+                " WHERE status = 'pending' OR (status = 'leased' AND lease_until < ?)"
+                " ORDER BY status = 'leased', job_id, position LIMIT ?", (now, limit + 16)
+            ).fetchall()
+            leased = []
+            for job_id, position, url, attempts in rows:
+                if attempts >= self.max_attempts:
+                    conn.execute("UPDATE tasks SET status = 'done', worker = NULL WHERE job_id = ? AND position = ?",
+                                 (job_id, position))
+                    conn.execute("INSERT INTO results (job_id, position, result, worker) VALUES (?, ?, ?, NULL)",
+                                 (job_id, position, f"Error: gave up after {attempts} lost attempts"))
+                    continue
+                if len(leased) == limit:
+                    break
+                conn.execute(
+                    "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1"
+                    " WHERE job_id = ? AND position = ?", (worker_id, now + self.lease_seconds, job_id, position))
+                leased.append((job_id, position, url))
+            return leased
+        return self._transaction(take)
+
+    def complete(self, job_id, position, worker_id, result):
+        """Store a task's result unless it already has one. Returns True if it was stored."""
+        def finish(conn):
+            updated = conn.execute(
+                "UPDATE tasks SET status = 'done', lease_until = NULL"
+                " WHERE job_id = ? AND position = ? AND status != 'done'", (job_id, position)).rowcount
+            if updated:
+                conn.execute("INSERT INTO results (job_id, position, result, worker) VALUES (?, ?, ?, ?)",
+                             (job_id, position, str(result), worker_id))
+                conn.execute("UPDATE workers SET done = done + 1 WHERE worker_id = ?", (worker_id,))
+            return bool(updated)
+        return self._transaction(finish)
+
+    def register(self, worker_id):
+        now = time.time()
+        self._transaction(lambda conn: conn.execute(
+            "INSERT OR REPLACE INTO workers (worker_id, host, pid, started, heartbeat, done) VALUES (?, ?, ?, ?, ?, 0)",
+            (worker_id, socket.gethostname(), os.getpid(), now, now)))
+
+    def heartbeat(self, worker_id):
+        """Renew the leases `worker_id` holds and record that it is alive."""
+        def renew(conn):
+            now = time.time()
+            conn.execute("UPDATE workers SET heartbeat = ? WHERE worker_id = ?", (now, worker_id))
+            conn.execute("UPDATE tasks SET lease_until = ? WHERE worker = ? AND status = 'leased'",
+                         (now + self.lease_seconds, worker_id))
+        self._transaction(renew)
+
+    def results_since(self, job_id, seq=0):
+        """(seq, position, result) of the results stored for a job after `seq`."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, position, result FROM results WHERE job_id = ? AND seq > ? ORDER BY seq", (job_id, seq)
+            ).fetchall()
+
+    def has_work(self, job_id=None):
+        """True while a job (or any job) has unfinished tasks."""
+        with self._lock:
+            if job_id is None:
+                row = self._conn.execute("SELECT 1 FROM tasks WHERE status != 'done' LIMIT 1").fetchone()
+            else:
+                row = self._conn.execute("SELECT 1 FROM tasks WHERE job_id = ? AND status != 'done' LIMIT 1",
+                                         (job_id,)).fetchone()
+        return row is not None
+
+    def workers(self):
+        """{worker_id: {'host', 'pid', 'heartbeat_age', 'done'}} of the registered workers."""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute("SELECT worker_id, host, pid, heartbeat, done FROM workers").fetchall()
+        return {worker_id: {'host': host, 'pid': pid, 'heartbeat_age': round(now - heartbeat, 1), 'done': done}
+                for worker_id, host, pid, heartbeat, done in rows}
+
+    def leases(self):
+        """{worker_id: [(job ID, position), ...]} of the tasks leased right now."""
+        with self._lock:
+            rows = self._conn.execute("SELECT worker, job_id, position FROM tasks WHERE status = 'leased'").fetchall()
+        leases = {}
+        for worker_id, job_id, position in rows:
+            leases.setdefault(worker_id, []).append((job_id, position))
+        return leases
+
+    def tasks(self, job_id):
+        """
+        (position, status, attempts, results stored, worker that stored the
+        result) for every task of a job, in position order.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT t.position, t.status, t.attempts, COUNT(r.seq), MAX(r.worker) FROM tasks t"
+                " LEFT JOIN results r ON r.job_id = t.job_id AND r.position = t.position"
+                " WHERE t.job_id = ? GROUP BY t.position ORDER BY t.position", (job_id,)
+            ).fetchall()
+
+    def forget(self, job_id):
+        def drop(conn):
+            conn.execute("DELETE FROM tasks WHERE job_id = ?", (job_id,))
+            conn.execute("DELETE FROM results WHERE job_id = ?", (job_id,))
+        self._transaction(drop)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def load_target(target):
+    """The function a 'module:function' target names."""
+    module_name, _, function_name = target.partition(':')
+    return getattr(importlib.import_module(module_name), function_name or 'process_single_url')
+
+
+def run_worker(queue, fn, concurrency=8, worker_id=None, exit_when_idle=None, heartbeat=SHARD_HEARTBEAT_SECONDS,
+               poll=SHARD_POLL_SECONDS):
+    """
+    Lease tasks from `queue` and run fn(url) for each, with up to `concurrency`
+    in flight, until the queue has been empty for `exit_when_idle` seconds
+    (forever if None). Returns the number of tasks this worker completed.
+    """
+    worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    queue.register(worker_id)
+    stop = threading.Event()
+
+    def beat():
+        while not stop.wait(heartbeat):
+            try:
+                queue.heartbeat(worker_id)
+            except sqlite3.Error as e:
+                print(f"Shard worker {worker_id}: heartbeat failed: {e}")
+
+    def process(task):
+        job_id, position, url = task
+        try:
+            result = fn(url)
+        except Exception as e:
+            result = f"Error: {str(e)}"
+        if not queue.complete(job_id, position, worker_id, result):
+            print(f"Shard worker {worker_id}: {url} already had a result, dropped this one")
+        return result
+
+    print(f"Shard worker {worker_id} started on {queue.path} ({concurrency} at a time)")
+    heartbeat_thread = threading.Thread(target=beat, daemon=True)
+    heartbeat_thread.start()
+    in_flight = set()
+    completed = 0
+    idle_since = time.monotonic()
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            while True:
+                if len(in_flight) < concurrency:
+                    for task in queue.lease(worker_id, concurrency - len(in_flight)):
+                        in_flight.add(executor.submit(process, task))
+                if in_flight:
+                    finished, in_flight = wait(in_flight, timeout=poll, return_when=FIRST_COMPLETED)
+                    completed += len(finished)
+                    idle_since = time.monotonic()
+                    continue
+                if exit_when_idle is not None and time.monotonic() - idle_since >= exit_when_idle:
+                    break
+                time.sleep(poll)
+    finally:
+        stop.set()
+    print(f"Shard worker {worker_id} finished {completed} tasks")
+    return completed
+
+
+def start_local_worker(queue_path, target, concurrency, exit_when_idle=2 * SHARD_LEASE_SECONDS):
+    """Start a worker process on this machine, in this module's directory."""
+    command = [sys.executable, os.path.abspath(__file__), '--queue', os.path.abspath(queue_path),
+               '--target', target, '--concurrency', str(concurrency), '--exit-when-idle', str(exit_when_idle)]
+    return subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_sharded(urls, target, workers=SHARD_WORKERS, concurrency=8, on_result=None, queue_path=SHARD_QUEUE_PATH,
+                poll=SHARD_POLL_SECONDS, job_id=None, forget=True):
+    """
+    Coordinator: queue every URL as a task, start `workers` local worker
+    processes that run `target` ('module:function') on them, and wait for
+    all results. Workers that exit while tasks remain are replaced. If
+    `on_result` is given it is called as on_result(position, url, result) as
+    each result arrives. Returns the results in the order of `urls`. Raises
+    RuntimeError if the workers keep exiting (more than SHARD_MAX_ATTEMPTS
+    restarts per worker). The job's tasks and results are dropped from the
+    queue at the end unless `forget` is False.
+    """
+    urls = list(urls)
+    queue = ShardQueue(queue_path)
+    job_id = queue.enqueue(urls, job_id)
+    results = [None] * len(urls)
+    remaining = len(urls)
+    processes = [start_local_worker(queue_path, target, concurrency) for _ in range(workers)]
+    restarts = 0
+    seq = 0
+    print(f"Sharded job {job_id}: {len(urls)} sites across {workers} local worker processes")
+    try:
+        while remaining:
+            for seq, position, result in queue.results_since(job_id, seq):
+                results[position] = result
+                remaining -= 1
+                if on_result is not None:
+                    on_result(position, urls[position], result)
+            if not remaining:
+                break
+            for i, process in enumerate(processes):
+                if process.poll() is not None:
+                    restarts += 1
+                    if restarts > workers * SHARD_MAX_ATTEMPTS:
+                        raise RuntimeError(f"Shard workers keep exiting ({restarts} restarts), "
+                                           f"last exit code {process.returncode}")
+                    print(f"Shard worker process {process.pid} exited with {process.returncode}, starting another")
+                    processes[i] = start_local_worker(queue_path, target, concurrency)
+            time.sleep(poll)
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.terminate()
+        for process in processes:
+            try:
+                process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        if forget:
+            queue.forget(job_id)
+        queue.close()
+    print(f"Sharded job {job_id} done ({restarts} worker restarts)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a shard worker against a queue database.')
+    parser.add_argument('--queue', default=SHARD_QUEUE_PATH)
+    parser.add_argument('--target', default='app:process_single_url', help="'module:function' to run per URL")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--exit-when-idle', type=float, default=None,
+                        help='exit after the queue has been empty this many seconds')
+    parser.add_argument('--worker-id', default=None)
+    args = parser.parse_args()
+    fn = load_target(args.target)
+    run_worker(ShardQueue(args.queue), fn, concurrency=args.concurrency, worker_id=args.worker_id,
+               exit_when_idle=args.exit_when_idle)
+
+
+if __name__ == '__main__':
+    main()
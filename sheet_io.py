@@ -0,0 +1,179 @@
+"""
+Streaming spreadsheet input and output.
+
+Large lead lists are read row by row (openpyxl read-only mode for .xlsx, the
+csv module for .csv) and written back incrementally (a write-only workbook or
+a csv writer), so memory stays flat regardless of the number of rows. The URL
+column is pulled lazily and fed to the crawler as a generator; results are
+written in input order as soon as every earlier row has finished.
+"""
+import csv
+import os
+
+from openpyxl import Workbook, load_workbook
+
+SUPPORTED_EXTENSIONS = ('.xlsx', '.csv')
+
+
+def sheet_format(filename):
+    """Return 'xlsx' or 'csv' for a supported file name, otherwise None."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    return ext[1:] if ext in SUPPORTED_EXTENSIONS else None
+
+
+class SheetReader:
+    """Iterates over the rows of an .xlsx or .csv file without loading it all."""
+
+    def __init__(self, path, fmt=None):
+        self.path = path
+        self.format = fmt or sheet_format(path)
+        if self.format not in ('xlsx', 'csv'):
+            raise ValueError(f"Unsupported file type: {path}")
+        self._workbook = None
+        self._csv_file = None
+        self._rows = self._open()
+        try:
+            self.header = [str(value) if value is not None else '' for value in next(self._rows)]
+        except StopIteration:
+            self.header = []
+
+    def _open(self):
+        if self.format == 'xlsx':
+            self._workbook = load_workbook(self.path, read_only=True, data_only=True)
+            sheet = self._workbook.worksheets[0]
+            return sheet.iter_rows(values_only=True)
+        self._csv_file = open(self.path, newline='', encoding='utf-8-sig')
+        return iter(csv.reader(self._csv_file))
+
+    @property
+    def row_count(self):
+        """
+        Approximate number of data rows: the declared sheet dimensions for xlsx
+        (None if missing) or the line count for csv.
+        """
+        if self._workbook is not None:
+            max_row = self._workbook.worksheets[0].max_row
+            return max_row - 1 if max_row else None
+        with open(self.path, 'rb') as f:
+            return max(0, sum(1 for _ in f) - 1)
+
+    def rows(self):
+        """Yield each data row as a tuple padded to the header width."""
+        width = len(self.header)
+        for row in self._rows:
+            if self.format == 'csv':
+                # Match read_excel/read_csv, which treat empty cells as missing
+                row = tuple(value if value != '' else None for value in row)
+            else:
+                row = tuple(row)
+            if all(value is None for value in row):
+                continue
+            if len(row) < width:
+                row = row + (None,) * (width - len(row))
+            yield row
+
+    def close(self):
+        if self._workbook is not None:
+            self._workbook.close()
+        if self._csv_file is not None:
+            self._csv_file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class SheetWriter:
+    """Appends rows to a write-only workbook or a csv file."""
+
+    def __init__(self, path, header, fmt=None):
+        self.path = path
+        self.format = fmt or sheet_format(path)
+        if self.format == 'xlsx':
+            self._workbook = Workbook(write_only=True)
+            self._sheet = self._workbook.create_sheet()
+            self._append = self._sheet.append
+        elif self.format == 'csv':
+            self._file = open(path, 'w', newline='', encoding='utf-8')
+            self._append = csv.writer(self._file).writerow
+        else:
+            raise ValueError(f"Unsupported file type: {path}")
+        self._append(list(header))
+        self.rows_written = 0
+
+    def append(self, row):
+        self._append(list(row))
+        self.rows_written += 1
+
+    def close(self):
+        if self.format == 'xlsx':
+            self._workbook.save(self.path)
+        else:
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class OrderedRowSink:
+    """
+    Buffers rows that finished out of order and writes them back in input
+    order. Only rows still waiting on an earlier one are held in memory.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self._rows = {}
+        self._results = {}
+        self._next = 0
+
+    def add_row(self, index, row):
+        self._rows[index] = row
+
+    def add_result(self, index, result):
+        self._results[index] = result
+        while self._next in self._results:
+            row = self._rows.pop(self._next)
+            self.writer.append(row + (self._results.pop(self._next),))
+            self._next += 1
+
+    @property
+    def pending(self):
+        return len(self._rows)
+
+
+def stream_sheet(reader, writer, url_index, crawl):
+    """
+    Feed the URL column of `reader` to `crawl` lazily and write every row plus
+    its result to `writer` in input order.
+
+    `crawl(urls, on_result)` must consume the `urls` iterable and call
+    on_result(index, url, result) once per URL (crawl_engine.run_crawl does).
+    Returns the number of rows written.
+    """
+    sink = OrderedRowSink(writer)
+
+    def urls():
+        for index, row in enumerate(reader.rows()):
+            sink.add_row(index, row)
+            yield row[url_index]
+
+    crawl(urls(), lambda index, url, result: sink.add_result(index, result))
+    return writer.rows_written
+
+
+def save_upload(file_storage, path, chunk_size=1 << 20):
+    """Copy an uploaded file to disk in chunks instead of reading it into memory."""
+    with open(path, 'wb') as out:
+        stream = file_storage.stream if hasattr(file_storage, 'stream') else file_storage
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            out.write(chunk)
+    return path
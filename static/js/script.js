@@ -7,19 +7,27 @@ function uploadFile(event) {
     const statusMessage = document.querySelector('#status');
 
     statusMessage.classList.remove('error', 'success'); 
-    statusMessage.innerHTML = "Fetching email IDs, please wait..."; 
+    statusMessage.innerHTML = "Uploading file..."; 
 
     const formData = new FormData(form);
 
-    fetch('/process', {
+    fetch('/jobs', {
         method: 'POST',
         body: formData
     })
+    .then(response => {
+        if (response.ok) {
+            return response.json();
+        }
+        return response.text().then(text => { throw new Error(text || 'File processing failed'); });
+    })
+    .then(job => waitForJob(job, statusMessage))
+    .then(job => fetch(job.download_url))
     .then(response => {
         if (response.ok) {
             return response.blob(); 
         }
-        throw new Error('File processing failed');
+        throw new Error('File download failed');
     })
     .then(blob => {
         const originalFileName = fileInput.files[0].name; 
@@ -41,3 +49,32 @@ function uploadFile(event) {
         statusMessage.classList.add('error');
     });
 }
+
+function waitForJob(job, statusMessage) {
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(job.status_url)
+            .then(response => {
+                if (response.ok) {
+                    return response.json();
+                }
+                throw new Error('Could not get job status');
+            })
+            .then(progress => {
+                if (progress.status === 'done') {
+                    resolve(job);
+                    return;
+                }
+                if (progress.status === 'failed') {
+                    throw new Error(progress.error || 'File processing failed');
+                }
+                const eta = progress.eta_seconds === null ? '' : `, about ${Math.ceil(progress.eta_seconds / 60)} min left`;
+                statusMessage.innerHTML = `Fetching email IDs: ${progress.rows_done} of ${progress.rows_total} rows done, ` +
+                    `${progress.emails_found} emails found${eta}`;
+                setTimeout(poll, 2000);
+            })
+            .catch(reject);
+        };
+        poll();
+    });
+}
@@ -0,0 +1,83 @@
+"""
+CrawlPipeline.run must finish even when a page fails in an unexpected way.
+
+Failures in the parse pool's done-callbacks are swallowed by the executor
+and a fetcher thread that raises dies, so either one used to leave the
+site's page pending and run() waiting forever. So did a site whose deadline
+had passed before it became active.
+"""
+import os
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault('RESULT_CACHE_ENABLED', '0')
+
+import frontier  # noqa: E402
+import pipeline  # noqa: E402
+from benchmarks.local_server import LocalServer, contact_site  # noqa: E402
+from pipeline import CrawlPipeline  # noqa: E402
+
+
+def run_with_timeout(crawl_pipeline, urls, timeout=30):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(crawl_pipeline.run(urls)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "CrawlPipeline.run hung"
+    return results[0]
+
+
+@pytest.fixture
+def crawl_pipeline():
+    crawl_pipeline = CrawlPipeline(fetch_workers=2, parse_workers=1)
+    yield crawl_pipeline
+    crawl_pipeline.close()
+
+
+@pytest.fixture
+def site():
+    with LocalServer(contact_site('info@example.org')) as server:
+        yield server
+
+
+def test_site_finishes_when_add_page_raises(monkeypatch, crawl_pipeline, site):
+    def add_page(self, url, depth, scan):
+        raise ValueError("Port could not be cast to integer value as 'abc'")
+    monkeypatch.setattr(pipeline.SiteFrontier, 'add_page', add_page)
+
+    assert run_with_timeout(crawl_pipeline, [site.url('/')]) == [""]
+
+
+def test_site_finishes_when_fetch_raises(monkeypatch, crawl_pipeline, site):
+    class BrokenClient:
+        def get_page(self, url, **kwargs):
+            raise RuntimeError("unexpected")
+    monkeypatch.setattr(pipeline, 'get_http_client', lambda: BrokenClient())
+
+    assert run_with_timeout(crawl_pipeline, [site.url('/'), site.url('/')]) == [None, None]
+    assert crawl_pipeline.stats()['pages_fetched'] == 2
+
+
+def slow_homepage(request):
+    time.sleep(1.5)
+    request.send_html("<html><body><a href=\"/contact\">Contact</a></body></html>")
+
+
+def test_site_deadline_starts_when_the_site_becomes_active(monkeypatch):
+    monkeypatch.setattr(frontier, 'SITE_DEADLINE', 1)
+    servers = [LocalServer({'/': slow_homepage}).start() for _ in range(4)]
+    crawl_pipeline = CrawlPipeline(fetch_workers=2, parse_workers=1, max_active_sites=1)
+    try:
+        assert run_with_timeout(crawl_pipeline, [server.url('/') for server in servers]) == [None] * 4
+        # Every site got to fetch its homepage, not just the first one
+        assert all(server.requests_served == 1 for server in servers)
+    finally:
+        crawl_pipeline.close()
+        for server in servers:
+            server.stop()
+
+
+def test_emails_are_still_found(crawl_pipeline, site):
+    assert run_with_timeout(crawl_pipeline, [site.url('/'), None]) == ['info@example.org', ""]
@@ -0,0 +1,87 @@
+"""
+The politeness scheduler against local hosts that answer 429.
+
+A throttled request is retried once the host's Retry-After has passed and
+the caller only sees the final 200, while other hosts keep their own pace.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from benchmarks.local_server import LocalServer
+from http_client import HttpClient
+from politeness import HostScheduler
+
+PAGE = "<html><body><p>Contact: info@example.org</p></body></html>"
+
+
+def throttle_first(count, retry_after):
+    """A route answering 429 with Retry-After to the first `count` requests, then the page."""
+    lock = threading.Lock()
+    arrivals = []
+
+    def route(request):
+        with lock:
+            arrivals.append(time.monotonic())
+            throttled = len(arrivals) <= count
+        if throttled:
+            request.send_html("Too many requests", status=429, headers={'Retry-After': str(retry_after)})
+        else:
+            request.send_html(PAGE)
+
+    return route, arrivals
+
+
+@pytest.fixture
+def client():
+    client = HttpClient(scheduler=HostScheduler(concurrency=2, min_interval=0.01), throttle_retries=3)
+    yield client
+    client.close()
+
+
+def test_throttled_page_is_retried_after_retry_after(client):
+    route, arrivals = throttle_first(1, retry_after=1)
+    with LocalServer({'*': route}) as server:
+        response = client.get(server.url('/contact'))
+
+    assert response.status_code == 200
+    assert len(arrivals) == 2
+    assert arrivals[1] - arrivals[0] >= 0.9
+
+
+def test_every_page_of_a_throttled_host_ends_with_200(client):
+    route, arrivals = throttle_first(2, retry_after=1)
+    with LocalServer({'*': route}) as server:
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            statuses = list(executor.map(lambda i: client.get(server.url(f'/page{i}')).status_code, range(4)))
+
+    assert statuses == [200] * 4
+    assert len(arrivals) == 6
+
+
+def test_free_hosts_are_not_held_back_by_a_throttled_host(client):
+    route, _ = throttle_first(1, retry_after=2)
+    limited = LocalServer({'*': route}).start()
+    free = [LocalServer({'*': PAGE}).start() for _ in range(2)]
+    finished = {}
+
+    def fetch(job):
+        server, i = job
+        status = client.get(server.url(f'/page{i}')).status_code
+        finished[server.netloc] = time.monotonic()
+        return status
+
+    try:
+        start = time.monotonic()
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            statuses = list(executor.map(fetch, [(server, i) for i in range(3) for server in [limited] + free]))
+    finally:
+        for server in [limited] + free:
+            server.stop()
+
+    assert statuses == [200] * 9
+    assert finished[limited.netloc] - start >= 1.9
+    for server in free:
+        assert finished[server.netloc] - start < 1.0
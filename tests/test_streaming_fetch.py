@@ -0,0 +1,102 @@
+"""
+HttpClient.get_page streams page bodies: it stops reading at MAX_PAGE_BYTES,
+skips bodies that are not HTML and gives up on a page that is still
+arriving when the site deadline passes.
+"""
+import threading
+import time
+
+import pytest
+
+import http_client
+from benchmarks.local_server import LocalServer
+from http_client import DeadlineExceeded, HttpClient, NotHtmlError
+
+MAX_BYTES = 64 * 1024
+BODY_BYTES = 32 * 2 ** 20
+CHUNK = b'<p>' + b'Lorem ipsum dolor sit amet. ' * 2340 + b'</p>\n'
+
+
+def streamed(content_type, total):
+    """
+    A route sending `total` bytes of `content_type`. Returns it with a dict
+    that gets the bytes it got out, under 'sent', once the client hung up.
+    """
+    sent = {}
+    finished = threading.Event()
+
+    def route(request):
+        request.send_response(200)
+        request.send_header('Content-Type', content_type)
+        request.send_header('Content-Length', str(total))
+        request.end_headers()
+        written = 0
+        try:
+            while written < total:
+                data = CHUNK[:total - written]
+                request.wfile.write(data)
+                written += len(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        sent['sent'] = written
+        finished.set()
+
+    def bytes_sent():
+        assert finished.wait(10), "the server never stopped sending"
+        return sent['sent']
+
+    return route, bytes_sent
+
+
+def slow_drip(seconds):
+    def route(request):
+        # No Content-Length: the body ends when the connection closes
+        request.close_connection = True
+        request.send_response(200)
+        request.send_header('Content-Type', 'text/html; charset=utf-8')
+        request.send_header('Connection', 'close')
+        request.end_headers()
+        try:
+            ends = time.monotonic() + seconds
+            while time.monotonic() < ends:
+                request.wfile.write(b'<span>.</span>')
+                request.wfile.flush()
+                time.sleep(0.05)
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    return route
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(http_client, 'MAX_PAGE_BYTES', MAX_BYTES)
+    client = HttpClient(scheduler=False)
+    yield client
+    client.close()
+
+
+def test_reading_stops_at_max_page_bytes(client):
+    route, bytes_sent = streamed('text/html; charset=utf-8', BODY_BYTES)
+    with LocalServer({'/big': route}) as server:
+        response = client.get_page(server.url('/big'))
+        response.raise_for_status()
+        assert len(response.content) == MAX_BYTES
+        # The server is cut off long before the whole body, give or take the socket buffers
+        assert bytes_sent() < BODY_BYTES
+
+
+def test_pdf_is_skipped_without_reading_it(client):
+    route, bytes_sent = streamed('application/pdf', BODY_BYTES)
+    with LocalServer({'/brochure': route}) as server:
+        with pytest.raises(NotHtmlError):
+            client.get_page(server.url('/brochure'))
+        assert bytes_sent() < BODY_BYTES
+
+
+def test_page_still_streaming_at_the_deadline_fails(client):
+    with LocalServer({'/drip': slow_drip(10)}) as server:
+        start = time.monotonic()
+        with pytest.raises(DeadlineExceeded):
+            client.get_page(server.url('/drip'), deadline=start + 0.5)
+        assert time.monotonic() - start < 2.0
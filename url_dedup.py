@@ -0,0 +1,131 @@
+"""
+Deduplication of sheet rows that point at the same site.
+
+Lead lists often repeat a company's website on many rows, written in
+different ways (example.com, http://example.com/, https://www.example.com).
+site_key() maps all of those to one canonical key: frontier.normalize_url()
+of the URL, so scheme, www., default ports, fragments, trailing slashes and
+tracking parameters are ignored but a different path is a different site.
+
+SiteGroups is for batches: it crawls each distinct site once and fans the
+result back out to every row. SharedResults does the same for streamed rows,
+where later duplicates wait for the first row's crawl.
+"""
+import threading
+
+from frontier import normalize_url
+
+
+def site_key(url):
+    """Canonical key for a sheet URL, or None if it is not a usable URL."""
+    if not isinstance(url, str):
+        return None
+    url = url.strip()
+    if not url:
+        return None
+    if not url.lower().startswith(('http://', 'https://')):
+        url = f"http://{url}"
+    try:
+        key = normalize_url(url)
+    except ValueError:
+        return None
+    return key if key.strip('/') else None
+
+
+class DedupStats:
+    """Rows seen and distinct sites crawled for one upload."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.rows = 0
+        self.sites = 0
+
+    def record(self, rows, sites):
+        with self._lock:
+            self.rows += rows
+            self.sites += sites
+
+    @property
+    def ratio(self):
+        """Share of rows that did not need their own crawl."""
+        return 1 - self.sites / self.rows if self.rows else 0.0
+
+    def summary(self):
+        return f"Deduplicated {self.rows} rows to {self.sites} sites ({self.ratio:.1%} duplicates)"
+
+
+class SiteGroups:
+    """
+    Groups a URL column by site_key. `urls` holds the first row's URL of every
+    site in input order and `site_rows` the rows of each; rows without a
+    usable URL keep their own entry so they are handled exactly as before.
+    """
+
+    def __init__(self, urls):
+        self.urls = []
+        self.row_sites = []
+        self.site_rows = []
+        positions = {}
+        for row, url in enumerate(urls):
+            key = site_key(url)
+            position = positions.get(key) if key is not None else None
+            if position is None:
+                position = len(self.urls)
+                if key is not None:
+                    positions[key] = position
+                self.urls.append(url)
+                self.site_rows.append([])
+            self.row_sites.append(position)
+            self.site_rows[position].append(row)
+
+    def fan_out(self, site_results):
+        """Per-row results from the results for `self.urls`."""
+        return [site_results[position] for position in self.row_sites]
+
+
+class _SharedEntry:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SharedResults:
+    """
+    Wraps a per-URL function so that rows of the same site share one call.
+    The first row of a site runs `fn`; rows arriving while it runs wait for
+    it, later rows get the stored result (or the same exception).
+    """
+
+    def __init__(self, fn, stats=None):
+        self.fn = fn
+        self.stats = stats
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        key = site_key(url)
+        if key is None:
+            self._record(True)
+            return self.fn(url)
+        with self._lock:
+            entry = self._entries.get(key)
+            first = entry is None
+            if first:
+                entry = self._entries[key] = _SharedEntry()
+        self._record(first)
+        if first:
+            try:
+                entry.result = self.fn(url)
+            except Exception as e:
+                entry.error = e
+            entry.done.set()
+        else:
+            entry.done.wait()
+        if entry.error is not None:
+            raise entry.error
+        return entry.result
+
+    def _record(self, new_site):
+        if self.stats is not None:
+            self.stats.record(1, 1 if new_site else 0)